@@ -1,6 +1,15 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from src.api.api import api_router
+from sqlalchemy.orm import Session
+from src.util import util_base_de_datos as db_utils
+from src.util import util_migraciones
+from src.util import util_tareas
+from src.util import util_catalogo
+from src.util import util_eventos
+from src.util import util_limites
+from src.auth import security
+from src.crud import crud_analista
 
 app = FastAPI(
     title="API de Agente Inteligente de Soporte",
@@ -9,6 +18,10 @@ app = FastAPI(
     redoc_url="/redoc",
 )
 
+# Límite de peticiones por colaborador/cliente. Se agrega antes que CORS para que
+# CORS quede por fuera y también los 429 lleven sus cabeceras.
+app.add_middleware(util_limites.LimiteMiddleware, identificar=security.identidad_limites)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "http://localhost:9002", "https://soporte-pi.vercel.app"],
@@ -17,6 +30,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Las migraciones se aplican en el despliegue (python -m src.util.util_migraciones);
+# con un esquema a medio migrar la API no arranca.
+@app.on_event("startup")
+def verificar_migraciones():
+    pendientes = util_migraciones.migraciones_pendientes(db_utils.engine)
+    if pendientes:
+        raise RuntimeError(
+            f"Hay migraciones pendientes {pendientes}: ejecuta 'python -m src.util.util_migraciones' antes de iniciar la API."
+        )
+
+
+# Catálogo de clientes/servicios en memoria: carga inicial y recarga por aviso de la BD
+@app.on_event("startup")
+def cargar_catalogo():
+    try:
+        with Session(db_utils.engine) as session:
+            util_catalogo.catalogo.refrescar(session)
+    except Exception as e:
+        print(f"No se pudo cargar el catálogo al iniciar (se cargará en el primer uso): {e}")
+    util_eventos.hub_eventos.escuchar_canal(util_catalogo.CANAL, lambda _: util_catalogo.catalogo.invalidar())
+    # Cambios de rol de analista (trigger de la migración 0010): invalida la identidad cacheada
+    util_eventos.hub_eventos.escuchar_canal("analista_cambios", crud_analista.invalidate_analyst_principal)
+    util_eventos.hub_eventos.iniciar()
+
+
+# Trabajador de tareas diferidas (outbox): contadores y notificaciones post-commit, más
+# los jobs periódicos (purga del outbox, rollups de analítica, reconciliación de contadores)
+@app.on_event("startup")
+def iniciar_trabajador_tareas():
+    util_tareas.trabajador_tareas.iniciar()
+
+
+@app.on_event("shutdown")
+def detener_trabajador_tareas():
+    util_tareas.trabajador_tareas.detener()
+
+
 # Incluye todas las rutas de la API bajo el prefijo /api
 app.include_router(api_router, prefix="/api")
 
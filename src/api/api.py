@@ -1,8 +1,9 @@
 from fastapi import APIRouter
-from src.api.routes import auth, chat, analyst
+from src.api.routes import auth, chat, analyst, analytics
 
 api_router = APIRouter()
 
 api_router.include_router(auth.router, prefix="/auth", tags=["Auth"])
 api_router.include_router(chat.router, prefix="/chat", tags=["Chatbot"])
-api_router.include_router(analyst.router, prefix="/analista", tags=["Analista"])
\ No newline at end of file
+api_router.include_router(analyst.router, prefix="/analista", tags=["Analista"])
+api_router.include_router(analytics.router, prefix="/analitica", tags=["Analítica"])
\ No newline at end of file
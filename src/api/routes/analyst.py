@@ -1,11 +1,22 @@
+import json
+import asyncio
+import datetime
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from src.util import util_schemas as sch
 from src.util import util_base_de_datos as db_utils
+from src.util import util_asignacion
+from src.util import util_sla
+from src.util import util_eventos
+from src.util import util_etag
+from src.util import util_cache
+from src.util import util_limites
 from src.auth import security
-from src.crud import crud_analista, crud_tickets, crud_escalados
+from src.crud import crud_analista, crud_tickets, crud_escalados, crud_contadores
 
 # =======================================================================
 # @section 1: AÑADIMOS EL DICCIONARIO DE TRADUCCIÓN
@@ -37,10 +48,18 @@ router = APIRouter()
 
 @router.get("/conversaciones", response_model=sch.AnalystTicketPage)
 def listar_conversaciones_analista(
+        response: Response,
         limit: int = Query(20, ge=1, le=100),
         offset: int = Query(0, ge=0),
         status: Optional[str] = Query(None,
                                       description="Filtro por estado: Abierto, En Atención, Cerrado, etc."),
+        cursor: Optional[str] = Query(None,
+                                      description="Cursor devuelto en next_cursor; si se envía se ignora offset."),
+        orden: str = Query("recientes", pattern="^(recientes|prioridad)$",
+                           description="recientes (por actualización) o prioridad (por vencimiento SLA)."),
+        sla: Optional[str] = Query(None, pattern="^(en_riesgo|vencido)$",
+                                   description="Solo tickets abiertos en riesgo de vencer o ya vencidos."),
+        if_none_match: Optional[str] = Header(None),
         db: Session = Depends(db_utils.obtener_bd),
         current_user: sch.TokenData = Depends(security.get_current_user),
 ):
@@ -49,6 +68,17 @@ def listar_conversaciones_analista(
     if not analyst_id:
         return sch.AnalystTicketPage(items=[], total=0, limit=limit, offset=offset)
 
+    # GET condicional: versión de la bandeja + parámetros de la página.
+    # Los filtros de SLA dependen de la hora, así que su ETag vence cada minuto.
+    version = crud_analista.get_inbox_version(db, analyst_id)
+    minuto = datetime.datetime.utcnow().strftime("%Y%m%d%H%M") if sla else None
+    etag = util_etag.etag_debil(
+        "bandeja", analyst_id, version, limit, offset, status, cursor, orden, sla, minuto
+    )
+    if util_etag.coincide(if_none_match, etag):
+        return util_etag.no_modificado(etag)
+    util_etag.marcar(response, etag)
+
     # =======================================================================
     # @section CORRECCIÓN AÑADIDA - Lógica de traducción para el filtro
     # =======================================================================
@@ -62,29 +92,214 @@ def listar_conversaciones_analista(
 
         estados_bd = [db_status]
 
-    rows, total = crud_analista.get_tickets_by_analyst(
-        db, analyst_id, limit=limit, offset=offset, estados=estados_bd
+    # Página hidratada cacheada; la clave lleva el ETag, así que nunca sirve otra versión
+    cache = util_cache.cache_vistas
+    clave = cache.clave_bandeja(analyst_id, etag)
+    pagina = cache.obtener_bandeja(clave)
+    if pagina is None:
+        try:
+            rows, total, next_cursor = crud_analista.get_tickets_by_analyst(
+                db, analyst_id, limit=limit, offset=offset, estados=estados_bd, cursor=cursor,
+                orden=orden, sla=sla,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        infos = crud_analista.hydrate_ticket_page(db, rows)
+        pagina = {"items": infos, "total": total, "next_cursor": next_cursor}
+        cache.guardar_bandeja(clave, pagina)
+
+    items = [sch.AnalystTicketItem(**info) for info in pagina["items"]]
+    return sch.AnalystTicketPage(
+        items=items, total=pagina["total"], limit=limit, offset=offset, next_cursor=pagina["next_cursor"]
     )
+
+
+@router.get("/resumen", response_model=sch.AnalystSummary)
+def resumen_analista(
+        db: Session = Depends(db_utils.obtener_bd),
+        current_user: sch.TokenData = Depends(security.get_current_user),
+):
+    analyst_id = crud_analista.get_analyst_id_for_current_user(db, current_user)
+    if not analyst_id:
+        return sch.AnalystSummary(total=0)
+
+    return sch.AnalystSummary(**crud_contadores.resumen_analista(db, analyst_id))
+
+
+@router.get("/tickets/buscar", response_model=sch.AnalystTicketSearchPage)
+def buscar_tickets_analista(
+        q: Optional[str] = Query(None, description="Texto libre sobre el asunto."),
+        status: Optional[List[str]] = Query(None, description="Uno o más estados (Abierto, En Atención, ...)."),
+        level: Optional[List[str]] = Query(None, description="Uno o más niveles (bajo, medio, alto, crítico)."),
+        service: Optional[str] = Query(None, description="Nombre exacto del servicio."),
+        company: Optional[str] = Query(None, description="Nombre exacto de la empresa."),
+        desde: Optional[datetime.date] = Query(None, description="Fecha de creación mínima (inclusive)."),
+        hasta: Optional[datetime.date] = Query(None, description="Fecha de creación máxima (inclusive)."),
+        limit: int = Query(20, ge=1, le=100),
+        cursor: Optional[str] = Query(None, description="Cursor devuelto en next_cursor."),
+        db: Session = Depends(db_utils.obtener_bd),
+        current_user: sch.TokenData = Depends(security.get_current_user),
+):
+    analyst_id = crud_analista.get_analyst_id_for_current_user(db, current_user)
+    if not analyst_id:
+        return sch.AnalystTicketSearchPage(items=[], total=0, limit=limit, facets=sch.AnalystSearchFacets())
+
+    estados_bd = None
+    if status:
+        estados_bd = []
+        for st in status:
+            db_status = UI_TO_DB_STATUS.get(st.lower().strip())
+            if not db_status:
+                raise HTTPException(status_code=400, detail=f"Estado de filtro '{st}' no es válido.")
+            estados_bd.append(db_status)
+
+    niveles_bd = None
+    if level:
+        niveles_bd = []
+        for lv in level:
+            db_level = UI_TO_DB_LEVEL.get(lv.lower().strip())
+            if not db_level:
+                raise HTTPException(status_code=400, detail=f"Nivel de filtro '{lv}' no es válido.")
+            niveles_bd.append(db_level)
+
+    try:
+        rows, next_cursor, facets, total = crud_analista.search_tickets_by_analyst(
+            db, analyst_id,
+            estados=estados_bd, niveles=niveles_bd, servicio=service, empresa=company,
+            desde=desde, hasta=hasta, texto=q, limit=limit, cursor=cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     infos = crud_analista.hydrate_ticket_page(db, rows)
-    items = [sch.AnalystTicketItem(**info) for info in infos]
-    return sch.AnalystTicketPage(items=items, total=total, limit=limit, offset=offset)
+    return sch.AnalystTicketSearchPage(
+        items=[sch.AnalystTicketItem(**info) for info in infos],
+        total=total,
+        limit=limit,
+        next_cursor=next_cursor,
+        facets=sch.AnalystSearchFacets(**facets),
+    )
+
+
+@router.get("/eventos")
+async def eventos_analista(
+        request: Request,
+        db: Session = Depends(db_utils.obtener_bd),
+        current_user: sch.TokenData = Depends(security.get_current_user),
+):
+    """
+    Canal SSE con los cambios de la bandeja del analista (tickets nuevos,
+    derivaciones y cambios de estado/nivel) como deltas. Si el cliente se atrasa
+    recibe un evento "resync" y debe recargar la página actual.
+    """
+    analyst_id = await run_in_threadpool(crud_analista.get_analyst_id_for_current_user, db, current_user)
+    if not analyst_id:
+        raise HTTPException(status_code=403, detail="No autorizado (no es analista).")
+
+    hub = util_eventos.hub_eventos
+
+    async def flujo():
+        cola = hub.suscribir(analyst_id)
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    evento = await asyncio.wait_for(cola.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"  # keep-alive para proxies
+                    continue
+                yield f"event: {evento['tipo']}\ndata: {json.dumps(evento, default=str)}\n\n"
+        finally:
+            hub.desuscribir(analyst_id, cola)
+
+    return StreamingResponse(
+        flujo(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/eventos/metricas")
+def metricas_eventos(
+        db: Session = Depends(db_utils.obtener_bd),
+        current_user: sch.TokenData = Depends(security.get_current_user),
+):
+    """Conexiones abiertas, entregas y latencia de fan-out (NOTIFY -> cola del cliente)."""
+    if not crud_analista.get_analyst_id_for_current_user(db, current_user):
+        raise HTTPException(status_code=403, detail="No autorizado (no es analista).")
+    return util_eventos.hub_eventos.metricas()
+
+
+@router.get("/cache/metricas")
+def metricas_cache(
+        db: Session = Depends(db_utils.obtener_bd),
+        current_user: sch.TokenData = Depends(security.get_current_user),
+):
+    """Hits, misses, entradas obsoletas descartadas, invalidaciones y edad de lo servido."""
+    if not crud_analista.get_analyst_id_for_current_user(db, current_user):
+        raise HTTPException(status_code=403, detail="No autorizado (no es analista).")
+    return util_cache.cache_vistas.metricas()
+
+
+@router.get("/limites/metricas")
+def metricas_limites(
+        db: Session = Depends(db_utils.obtener_bd),
+        current_user: sch.TokenData = Depends(security.get_current_user),
+):
+    """Peticiones permitidas y rechazadas (429) por el limitador, y su backend."""
+    if not crud_analista.get_analyst_id_for_current_user(db, current_user):
+        raise HTTPException(status_code=403, detail="No autorizado (no es analista).")
+    return util_limites.limitador.metricas()
 
 
 @router.get("/conversaciones/{id_ticket}", response_model=sch.AnalystTicketDetail)
 def detalle_conversacion_analista(
         id_ticket: int,
+        response: Response,
+        if_none_match: Optional[str] = Header(None),
         db: Session = Depends(db_utils.obtener_bd),
         current_user: sch.TokenData = Depends(security.get_current_user),
 ):
-    t = crud_analista.get_ticket_admin_by_id(db, id_ticket)
-    if not t:
+    # Antes de revelar si el ticket existe o su versión
+    if not crud_analista.get_analyst_id_for_current_user(db, current_user):
+        raise HTTPException(status_code=403, detail="No autorizado (no es analista).")
+    # GET condicional: una lectura por PK decide si hace falta hidratar
+    version = crud_analista.get_ticket_version(db, id_ticket)
+    if not version:
         raise HTTPException(status_code=404, detail="Ticket no encontrado")
+    etag = util_etag.etag_debil("detalle", id_ticket, *version)
+    if util_etag.coincide(if_none_match, etag):
+        return util_etag.no_modificado(etag)
 
-    info = crud_analista.hydrate_ticket_info(db, t)
-    conv = crud_analista.get_conversation_by_ticket(db, id_ticket)
-    conversation = [sch.AnalystMessage(**m) for m in (conv.contenido or [])]
+    cache = util_cache.cache_vistas
+    info = cache.obtener_detalle(id_ticket, etag)
+    if info is None:
+        info = crud_analista.get_ticket_detail(db, id_ticket)
+        if not info:
+            raise HTTPException(status_code=404, detail="Ticket no encontrado")
+        cache.guardar_detalle(id_ticket, etag, info)
 
-    return sch.AnalystTicketDetail(**info, conversation=conversation)
+    util_etag.marcar(response, etag)
+    return sch.AnalystTicketDetail(**info)
+
+
+@router.get("/conversaciones/{id_ticket}/mensajes", response_model=sch.AnalystConversationPage)
+def mensajes_conversacion_analista(
+        id_ticket: int,
+        antes: Optional[int] = Query(None, ge=1, description="conversation_cursor / next_cursor anterior"),
+        limit: int = Query(50, ge=1, le=200),
+        db: Session = Depends(db_utils.obtener_bd),
+        current_user: sch.TokenData = Depends(security.get_current_user),
+):
+    """Mensajes anteriores de la conversación, del más reciente al más antiguo por páginas."""
+    if not crud_analista.get_analyst_id_for_current_user(db, current_user):
+        raise HTTPException(status_code=403, detail="No autorizado (no es analista).")
+    if not crud_analista.get_ticket_version(db, id_ticket):
+        raise HTTPException(status_code=404, detail="Ticket no encontrado")
+    mensajes, next_cursor = crud_analista.get_conversation_page(db, id_ticket, antes=antes, limit=limit)
+    return sch.AnalystConversationPage(
+        items=[sch.AnalystMessage(**m) for m in mensajes], next_cursor=next_cursor
+    )
 
 
 @router.put("/tickets/{ticket_id}/status", response_model=sch.AnalystTicketDetail)
@@ -94,16 +309,10 @@ def update_ticket_status(
         db: Session = Depends(db_utils.obtener_bd),
         current_user: sch.TokenData = Depends(security.get_current_user),
 ):
-    analyst_id = crud_analista.get_analyst_id_for_current_user_or_default(db, current_user)
+    analyst_id = crud_analista.get_analyst_id_for_current_user(db, current_user)
     if not analyst_id:
         raise HTTPException(status_code=403, detail="No autorizado (no es analista).")
 
-    ticket = crud_analista.get_ticket_admin_by_id(db, ticket_id)
-    if not ticket:
-        raise HTTPException(status_code=404, detail="Ticket no encontrado.")
-    if ticket.id_analista != analyst_id:
-        raise HTTPException(status_code=403, detail="No autorizado para modificar este ticket.")
-
     # =======================================================================
     # @section 2: LÓGICA DE TRADUCCIÓN AÑADIDA
     # =======================================================================
@@ -116,39 +325,85 @@ def update_ticket_status(
     if not db_status:
         raise HTTPException(status_code=400, detail=f"Estado '{payload.status}' no es válido.")
 
-    # Llamamos a la función del CRUD con el valor YA TRADUCIDO
-    updated_ticket = crud_analista.update_ticket_status_db(
+    db_level = None
+    if getattr(payload, 'level', None):
+        level_from_ui = payload.level.lower().strip()
+        db_level = UI_TO_DB_LEVEL.get(level_from_ui)
+
+        if not db_level:
+            raise HTTPException(status_code=400, detail=f"Nivel '{payload.level}' no es válido.")
+    # =======================================================================
+
+    # Estado, nivel, closed_at y diagnóstico en un solo UPDATE ... RETURNING (una transacción)
+    info = crud_analista.apply_ticket_changes_db(
         db_session=db,
         ticket_id=ticket_id,
+        analyst_id=analyst_id,
         new_status=db_status,
+        new_level=db_level,
         description=payload.description if db_status == "finalizado" else None,
+        expected_updated_at=payload.expected_updated_at,
     )
-    # =======================================================================
 
-    if not updated_ticket:
-        raise HTTPException(status_code=500, detail="No se pudo actualizar el estado.")
+    if not info:
+        # Camino de error: una lectura barata para saber por qué no se actualizó
+        ticket = crud_analista.get_ticket_admin_by_id(db, ticket_id)
+        if not ticket:
+            raise HTTPException(status_code=404, detail="Ticket no encontrado.")
+        if ticket.id_analista != analyst_id:
+            raise HTTPException(status_code=403, detail="No autorizado para modificar este ticket.")
+        raise HTTPException(
+            status_code=409, detail="El ticket fue modificado por otra persona. Recargue e intente de nuevo."
+        )
 
-    # =======================================================================
-    # @section 2: LÓGICA DE TRADUCCIÓN AÑADIDA PARA EL NIVEL
-    # =======================================================================
-    if getattr(payload, 'level', None):
-        level_from_ui = payload.level.lower().strip()
-        db_level = UI_TO_DB_LEVEL.get(level_from_ui)
+    return sch.AnalystTicketDetail(**info)
+
+
+@router.post("/tickets/bulk", response_model=sch.BulkTicketResponse)
+def bulk_update_tickets(
+        payload: sch.BulkTicketRequest,
+        db: Session = Depends(db_utils.obtener_bd),
+        current_user: sch.TokenData = Depends(security.get_current_user),
+):
+    """
+    Aplica estado, nivel y/o derivación a varios tickets del analista en una sola
+    transacción. Devuelve un resultado por ticket (los ajenos o inexistentes no
+    hacen fallar al resto).
+    """
+    current_analyst = crud_analista.get_analyst_from_token(db, current_user)
+    if not current_analyst:
+        raise HTTPException(status_code=403, detail="No autorizado (no es analista).")
+
+    db_status = None
+    if payload.status:
+        db_status = UI_TO_DB_STATUS.get(payload.status.lower().strip())
+        if not db_status:
+            raise HTTPException(status_code=400, detail=f"Estado '{payload.status}' no es válido.")
 
+    db_level = None
+    if payload.level:
+        db_level = UI_TO_DB_LEVEL.get(payload.level.lower().strip())
         if not db_level:
             raise HTTPException(status_code=400, detail=f"Nivel '{payload.level}' no es válido.")
 
-        updated_ticket = crud_analista.update_ticket_level_db(
-            db_session=db, ticket_id=ticket_id, new_level=db_level  # Usamos el valor traducido
-        )
-        if not updated_ticket:
-            raise HTTPException(status_code=500, detail="No se pudo actualizar el nivel.")
-    # =======================================================================
+    if payload.motivo_derivacion and current_analyst.nivel >= 3:
+        raise HTTPException(status_code=403, detail="Acción no permitida para analistas de nivel 3.")
+    if not (db_status or db_level or payload.motivo_derivacion):
+        raise HTTPException(status_code=400, detail="No se indicó ninguna operación.")
 
-    info = crud_analista.hydrate_ticket_info(db, updated_ticket)
-    conv = crud_analista.get_conversation_by_ticket(db, ticket_id)
-    conversation = [sch.AnalystMessage(**m) for m in (conv.contenido or [])]
-    return sch.AnalystTicketDetail(**info, conversation=conversation)
+    results = crud_analista.apply_bulk_changes_db(
+        db_session=db,
+        analyst=current_analyst,
+        ticket_ids=payload.ticket_ids,
+        new_status=db_status,
+        new_level=db_level,
+        description=payload.description if db_status == "finalizado" else None,
+        motivo_derivacion=payload.motivo_derivacion,
+    )
+    return sch.BulkTicketResponse(
+        actualizados=sum(1 for r in results if r["ok"]),
+        results=[sch.BulkTicketResult(**r) for r in results],
+    )
 
 
 @router.put("/tickets/{ticket_id}/derivar", response_model=sch.AnalystTicketDetail)
@@ -169,20 +424,30 @@ def derivar_ticket(
         raise HTTPException(status_code=404, detail="Ticket no encontrado.")
     if ticket.id_analista != current_analyst.id_analista:
         raise HTTPException(status_code=403, detail="No autorizado para derivar este ticket.")
+    # La derivación mueve carga de tickets abiertos en el índice de asignación
+    if ticket.estado not in util_sla.ESTADOS_ABIERTOS:
+        raise HTTPException(status_code=409, detail="Solo se pueden derivar tickets abiertos.")
 
-    new_analyst = crud_analista.find_random_higher_level_analyst(db, current_analyst.id_analista)
-    if not new_analyst:
+    router_derivaciones = util_asignacion.enrutador_derivaciones
+    new_analyst_id = router_derivaciones.elegir_superior(db, current_analyst.id_analista, current_analyst.nivel)
+    if not new_analyst_id:
         raise HTTPException(status_code=409, detail="No se encontraron analistas de nivel superior disponibles.")
 
-    crud_tickets.reassign_ticket_db(db, ticket, new_analyst.id_analista)
-    crud_escalados.log_escalation_db(
-        db_session=db, ticket_id=ticket_id, solicitante_id=current_analyst.id_analista,
-        derivado_id=new_analyst.id_analista, motivo=payload.motivo,
-    )
-    db.commit()
-    db.refresh(ticket)
-
-    info = crud_analista.hydrate_ticket_info(db, ticket)
-    conv = crud_analista.get_conversation_by_ticket(db, ticket_id)
-    conversation = [sch.AnalystMessage(**m) for m in (conv.contenido or [])]
-    return sch.AnalystTicketDetail(**info, conversation=conversation)
\ No newline at end of file
+    try:
+        crud_tickets.reassign_ticket_db(db, ticket, new_analyst_id)
+        crud_escalados.log_escalation_db(
+            db_session=db, ticket_id=ticket_id, solicitante_id=current_analyst.id_analista,
+            derivado_id=new_analyst_id, motivo=payload.motivo,
+        )
+        util_eventos.publicar(
+            db, "ticket_derivado", ticket_id, [current_analyst.id_analista, new_analyst_id],
+            id_analista=new_analyst_id, status=ticket.estado, level=ticket.nivel,
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        router_derivaciones.revertir(current_analyst.id_analista, new_analyst_id)
+        raise
+
+    info = crud_analista.get_ticket_detail(db, ticket_id)
+    return sch.AnalystTicketDetail(**info)
\ No newline at end of file
@@ -0,0 +1,34 @@
+import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from src.util import util_schemas as sch
+from src.util import util_base_de_datos as db_utils
+from src.auth import security
+from src.crud import crud_analista, crud_analitica
+
+router = APIRouter()
+
+
+@router.get("/tickets", response_model=sch.AnalyticsResponse)
+def metricas_tickets(
+        desde: datetime.date = Query(..., description="Fecha inicial (inclusive)."),
+        hasta: Optional[datetime.date] = Query(None, description="Fecha final (inclusive). Por defecto, hoy."),
+        agrupar: str = Query("nivel", pattern="^(nivel|cliente|servicio|fecha)$"),
+        db: Session = Depends(db_utils.obtener_bd),
+        current_user: sch.TokenData = Depends(security.get_current_user),
+):
+    """
+    Tiempo de cierre, cumplimiento de SLA, tasa de escalamiento y volumen,
+    servidos desde los rollups diarios (no toca las tablas ticket/escalado).
+    """
+    if not crud_analista.get_analyst_id_for_current_user(db, current_user):
+        raise HTTPException(status_code=403, detail="No autorizado (no es analista).")
+
+    hasta = hasta or datetime.date.today()
+    if hasta < desde:
+        raise HTTPException(status_code=400, detail="'hasta' no puede ser anterior a 'desde'.")
+
+    metricas = crud_analitica.obtener_metricas(db, desde, hasta, agrupar)
+    return sch.AnalyticsResponse(desde=desde, hasta=hasta, agrupar=agrupar, **metricas)
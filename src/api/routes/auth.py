@@ -1,11 +1,9 @@
-from src.util import util_keyvault as key
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from google.oauth2 import id_token
-from google.auth.transport import requests as grequests
 
 from src.util import util_schemas as sch
 from src.util import util_base_de_datos as db_utils
+from src.util import util_catalogo
 from src.auth import security
 from src.crud import crud_users
 from src.crud import crud_roles
@@ -13,51 +11,34 @@ from src.crud import crud_roles
 router = APIRouter()
 
 
-def verify_google_token(id_token_str: str) -> dict:
-    """Verifica el token de Google y devuelve la información del usuario."""
-    google_client_id = key.getkeyapi("GOOGLE-CLIENT-ID")
-    if not google_client_id:
-        raise HTTPException(status_code=500, detail="GOOGLE_CLIENT_ID no configurado")
-    try:
-        id_info = id_token.verify_oauth2_token(
-            id_token_str, grequests.Request(), google_client_id
-        )
-        if id_info.get("iss") not in ("accounts.google.com", "https://accounts.google.com"):
-            raise HTTPException(status_code=401, detail="Issuer inválido")
-        return id_info
-    except ValueError as e:
-        raise HTTPException(status_code=401, detail=f"Token de Google inválido: {e}")
-
-
 @router.post("/google/login/colaborador", response_model=sch.Token, tags=["Auth"])
 async def google_login_colaborador(
         request: sch.GoogleLoginRequest,
         db: Session = Depends(db_utils.obtener_bd),
 ):
-    id_info = verify_google_token(request.id_token)
-    persona = crud_users.get_or_create_from_external(db_session=db, id_info=id_info)
-    colaborador = crud_roles.get_or_create_collaborator_role(db, persona)
+    id_info = security.verify_google_token(request.id_token)
+
+    # Una lectura (external + rol) y escrituras solo si algo cambió o falta
+    gmail_client_id = crud_roles.get_gmail_client_id(db)
+    id_persona, id_colaborador = crud_users.get_or_create_from_external(
+        db_session=db, id_info=id_info,
+        rol=db_utils.Colaborador, rol_filtro=(db_utils.Colaborador.id_cliente == gmail_client_id,),
+    )
+    id_colaborador, id_cliente = crud_roles.get_or_create_collaborator_role(db, id_persona, id_colaborador)
 
     db.commit()  # <-- CORRECCIÓN CLAVE
 
-    cliente = db.query(db_utils.Cliente).filter_by(id_cliente=colaborador.id_cliente).first()
-    servicios_contratados_db = (
-        db.query(db_utils.Servicio)
-        .join(db_utils.ClienteServicio)
-        .filter(db_utils.ClienteServicio.id_cliente == colaborador.id_cliente)
-        .all()
-    )
-    servicios_para_token = [sch.ServicioInfo(id_servicio=str(s.id_servicio), nombre=s.nombre) for s in
-                            servicios_contratados_db]
+    # El token solo lleva IDs; el perfil del cliente se arma desde el catálogo en cada petición
+    perfil = util_catalogo.catalogo.perfil_cliente(db, id_cliente)
 
     token_data_payload = sch.TokenData(
         correo=id_info.get("email"),
         nombre=id_info.get("name"),
-        persona_id=str(persona.id_persona),
-        colaborador_id=str(colaborador.id_colaborador),
-        cliente_id=str(colaborador.id_cliente),
-        cliente_nombre=cliente.nombre if cliente else "Cliente Desconocido",
-        servicios_contratados=servicios_para_token
+        persona_id=str(id_persona),
+        colaborador_id=str(id_colaborador),
+        cliente_id=str(id_cliente),
+        cliente_nombre=perfil.nombre if perfil else "Cliente Desconocido",
+        servicios_contratados=list(perfil.servicios) if perfil else []
     )
     access_token = security.create_access_token(data=token_data_payload)
     return {"access_token": access_token, "token_type": "bearer"}
@@ -68,18 +49,20 @@ async def google_login_analista(
         request: sch.GoogleLoginRequest,
         db: Session = Depends(db_utils.obtener_bd),
 ):
-    id_info = verify_google_token(request.id_token)
-    persona = crud_users.get_or_create_from_external(db_session=db, id_info=id_info)
-    analista = crud_roles.get_or_create_analyst_role(db, persona)
+    id_info = security.verify_google_token(request.id_token)
+    id_persona, id_analista = crud_users.get_or_create_from_external(
+        db_session=db, id_info=id_info, rol=db_utils.Analista,
+    )
+    crud_roles.get_or_create_analyst_role(db, id_persona, id_analista)
 
     db.commit()  # <-- CORRECCIÓN CLAVE
 
     token_data_payload = sch.TokenData(
         correo=id_info.get("email"),
         nombre=id_info.get("name"),
-        persona_id=str(persona.id_persona),
-        colaborador_id="00000000-0000-0000-0000-000000000000",
-        cliente_id="00000000-0000-0000-0000-000000000000",
+        persona_id=str(id_persona),
+        colaborador_id=security.ID_NULO,
+        cliente_id=security.ID_NULO,
         cliente_nombre="ANALYTICS",
         servicios_contratados=[]
     )
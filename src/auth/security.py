@@ -6,16 +6,27 @@ from jose import JWTError, jwt
 from datetime import datetime, timedelta
 import os
 from pydantic import ValidationError
+from cachetools import TTLCache
+from sqlalchemy.orm import Session
 
 # Importamos nuestros esquemas desde su ubicación en 'util'
 from src.util import util_schemas as sch
+from src.util import util_base_de_datos as db_utils
+from src.util import util_catalogo
 
 ### Configuración de Seguridad
 from src.util import util_keyvault as key
 
 ## Google
-from google.oauth2 import id_token
-from google.auth.transport import requests as grequests
+import re
+import time
+import threading
+from functools import lru_cache
+from typing import Optional
+
+import requests
+from google.auth import exceptions as google_exceptions
+from google.auth import jwt as google_jwt
 
 SECRET_KEY = key.getkeyapi("SECRET-KEY")
 if not SECRET_KEY:
@@ -28,47 +39,180 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 8  # 8 horas
 # Esta es una dependencia de FastAPI para extraer el "Bearer Token" del header.
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/google/login")
 
+# Formato compacto del token: solo IDs, nombre/correo y la versión del formato.
+# El perfil del cliente (nombre y servicios contratados) sale del catálogo en memoria.
+TOKEN_VERSION = 2
+ID_NULO = "00000000-0000-0000-0000-000000000000"   # analistas: sin colaborador ni cliente
+_PERFIL_ANALISTA = util_catalogo.PerfilCliente("ANALYTICS", ())
+_PERFIL_DESCONOCIDO = util_catalogo.PerfilCliente("Cliente Desconocido", ())
+
+# Claims ya verificados por token (evita repetir la verificación HMAC en cada petición)
+_claims_verificados = TTLCache(maxsize=10_000, ttl=300)
+_claims_lock = threading.Lock()
+
 
 ### Funciones Principales
 
 def create_access_token(data: sch.TokenData) -> str:
-    to_encode = data.dict()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode = {
+        "sub": data.persona_id,
+        "col": data.colaborador_id,
+        "cli": data.cliente_id,
+        "nom": data.nombre,
+        "cor": data.correo,
+        "ver": TOKEN_VERSION,
+        "exp": expire,
+    }
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
-def get_current_user(token: str = Depends(oauth2_scheme)) -> sch.TokenData:
+def _decodificar(token: str) -> dict:
+    """Verifica el token una vez y reusa los claims hasta que venza (o salga del caché)."""
+    with _claims_lock:
+        claims = _claims_verificados.get(token)
+    if claims is not None and claims.get("exp", 0) > time.time():
+        return claims
+    claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    with _claims_lock:
+        _claims_verificados[token] = claims
+    return claims
+
+
+def get_current_user(
+        token: str = Depends(oauth2_scheme),
+        db: Session = Depends(db_utils.obtener_bd),
+) -> sch.TokenData:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudieron validar las credenciales",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        token_data = sch.TokenData(**payload)
-    except (JWTError, ValidationError):
+        payload = _decodificar(token)
+        if payload.get("ver") != TOKEN_VERSION:
+            # Tokens emitidos antes del formato compacto (traen el perfil completo)
+            return sch.TokenData(**payload)
+
+        if payload["cli"] == ID_NULO:
+            perfil = _PERFIL_ANALISTA
+        else:
+            perfil = util_catalogo.catalogo.perfil_cliente(db, payload["cli"]) or _PERFIL_DESCONOCIDO
+    except (JWTError, ValidationError, KeyError):
         raise credentials_exception
 
-    return token_data
+    # Los claims vienen firmados por nosotros y el perfil ya está validado en el catálogo
+    return sch.TokenData.model_construct(
+        persona_id=payload["sub"],
+        colaborador_id=payload["col"],
+        cliente_id=payload["cli"],
+        nombre=payload["nom"],
+        correo=payload["cor"],
+        cliente_nombre=perfil.nombre,
+        servicios_contratados=list(perfil.servicios),
+    )
+
+def identidad_limites(authorization: str) -> tuple[Optional[str], Optional[str]]:
+    """
+    (usuario, cliente) del header Authorization para el limitador de peticiones;
+    (None, None) si no es un Bearer válido. Usuario = colaborador, o la persona
+    si es un analista (sin colaborador).
+    """
+    esquema, _, token = authorization.partition(" ")
+    if esquema.lower() != "bearer" or not token:
+        return None, None
+    try:
+        claims = _decodificar(token)
+    except JWTError:
+        return None, None
+    if claims.get("ver") == TOKEN_VERSION:
+        persona, colaborador, cliente = claims.get("sub"), claims.get("col"), claims.get("cli")
+    else:
+        persona, colaborador, cliente = claims.get("persona_id"), claims.get("colaborador_id"), claims.get("cliente_id")
+    usuario = colaborador if colaborador and colaborador != ID_NULO else persona
+    return usuario, (cliente if cliente != ID_NULO else None)
+
 
 # --- FUNCIÓN AUXILIAR PARA VERIFICAR TOKEN (EVITA REPETIR CÓDIGO) ---
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+GOOGLE_CERTS_TTL = 3600      # segundos, si la respuesta no trae max-age
+GOOGLE_CERTS_RECARGA_MINIMA = 60  # segundos entre descargas provocadas por un kid desconocido
+GOOGLE_CLOCK_SKEW = 10       # tolerancia de reloj al validar exp/iat
+
+
+@lru_cache(maxsize=1)
+def get_google_client_id() -> str:
+    """Client ID de Google: se lee una vez de Key Vault por proceso."""
+    return key.getkeyapi("GOOGLE-CLIENT-ID")
+
+
+class _CertificadosGoogle:
+    """
+    Certificados públicos de Google en memoria, con una sesión HTTP reutilizada.
+    Respeta el max-age de la respuesta y vuelve a descargarlos si llega un `kid`
+    desconocido (rotación de llaves), a lo sumo una vez cada
+    GOOGLE_CERTS_RECARGA_MINIMA: tokens con kids inventados no generan una
+    descarga por petición. El caso común no toma el lock.
+    """
+
+    def __init__(self):
+        self._http = requests.Session()
+        self._lock = threading.Lock()
+        self._certs: dict[str, str] = {}
+        self._vence = 0.0
+        self._descargado_en = float("-inf")
+
+    def _descargar(self) -> None:
+        # Se marca antes de pedir: una descarga fallida también cuenta para el intervalo
+        self._descargado_en = time.monotonic()
+        respuesta = self._http.get(GOOGLE_CERTS_URL, timeout=5)
+        respuesta.raise_for_status()
+        max_age = re.search(r"max-age=(\d+)", respuesta.headers.get("Cache-Control", ""))
+        self._certs = respuesta.json()
+        self._vence = time.monotonic() + (int(max_age.group(1)) if max_age else GOOGLE_CERTS_TTL)
+
+    def _hay_que_descargar(self, kid: Optional[str]) -> bool:
+        ahora = time.monotonic()
+        if ahora >= self._vence:
+            return True
+        return bool(kid) and kid not in self._certs and ahora - self._descargado_en >= GOOGLE_CERTS_RECARGA_MINIMA
+
+    def obtener(self, kid: Optional[str]) -> dict[str, str]:
+        if not self._hay_que_descargar(kid):
+            return self._certs
+        with self._lock:
+            # Otro hilo pudo descargarlos mientras esperábamos el lock
+            if self._hay_que_descargar(kid):
+                self._descargar()
+            return self._certs
+
+
+_certificados_google = _CertificadosGoogle()
+
+
 def verify_google_token(id_token_str: str) -> dict:
-    """Verifica el token de Google y devuelve la información del usuario."""
-    google_client_id = key.getkeyapi("GOOGLE-CLIENT-ID")
+    """
+    Verifica el token de Google y devuelve la información del usuario.
+    Usa el client ID y los certificados cacheados: sin llamadas externas en el caso común.
+    """
+    google_client_id = get_google_client_id()
     if not google_client_id:
         raise HTTPException(status_code=500, detail="GOOGLE_CLIENT_ID no configurado")
 
     try:
-        id_info = id_token.verify_oauth2_token(
-            id_token_str, grequests.Request(), google_client_id
+        kid = google_jwt.decode_header(id_token_str).get("kid")
+        id_info = google_jwt.decode(
+            id_token_str,
+            certs=_certificados_google.obtener(kid),
+            audience=google_client_id,
+            clock_skew_in_seconds=GOOGLE_CLOCK_SKEW,
         )
-        if id_info.get("iss") not in (
-                "accounts.google.com",
-                "https://accounts.google.com",
-        ):
+        if id_info.get("iss") not in GOOGLE_ISSUERS:
             raise HTTPException(status_code=401, detail="Issuer inválido")
         return id_info
-    except ValueError as e:
-        raise HTTPException(status_code=401, detail=f"Token de Google inválido: {e}")
\ No newline at end of file
+    except (ValueError, google_exceptions.GoogleAuthError) as e:
+        raise HTTPException(status_code=401, detail=f"Token de Google inválido: {e}")
+    except requests.RequestException as e:
+        raise HTTPException(status_code=503, detail=f"No se pudieron obtener los certificados de Google: {e}")
@@ -1,35 +1,109 @@
 import uuid
+import json
+import base64
 import datetime
-from typing import Optional, List
+import threading
+from typing import Optional, List, NamedTuple
+
+from cachetools import TTLCache
 
 from sqlalchemy.orm import Session
 from sqlalchemy.orm import aliased
 from sqlalchemy import select
 from sqlalchemy import func
+from sqlalchemy import true
+from sqlalchemy import tuple_
+from sqlalchemy import update
+from sqlalchemy import insert
+from sqlalchemy import case
+from sqlalchemy import cast
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 from src.util import util_base_de_datos as db
 from src.util import util_schemas as sch
-from src.crud import crud_escalados
+from src.util import util_sla
+from src.util import util_asignacion
+from src.util import util_eventos
+from src.util import util_cache
+from src.crud import crud_tickets
+from src.crud import crud_contadores
 
 
-def get_analyst_id_for_current_user(db_session: Session, user_info: sch.TokenData) -> uuid.UUID | None:
+# ===== Identidad del analista (cacheada por persona_id) =====
+class AnalistaPrincipal(NamedTuple):
+    id_analista: uuid.UUID
+    nivel: int
+
+
+# persona_id -> AnalistaPrincipal, o None si la persona no es analista.
+# Se invalida al crear/cambiar el rol (invalidate_analyst_principal y aviso de la BD).
+_principales = TTLCache(maxsize=10_000, ttl=300)
+_principales_lock = threading.Lock()
+_NO_CACHEADO = object()
+
+
+def get_analyst_principal(db_session: Session, user_info: sch.TokenData) -> AnalistaPrincipal | None:
     """
-    Busca y devuelve el id_analista del usuario autenticado.
-    Si el usuario no es un analista, devuelve None.
+    Devuelve (id_analista, nivel) del usuario autenticado, o None si no es analista.
+    Solo consulta la tabla analista la primera vez por persona (o tras invalidar/TTL).
     """
     try:
         persona_uuid = uuid.UUID(user_info.persona_id)
     except (ValueError, TypeError):
         return None
 
-    if persona_uuid:
-        analista = db_session.query(db.Analista).filter(
-            db.Analista.id_persona == persona_uuid
-        ).first()
+    with _principales_lock:
+        principal = _principales.get(persona_uuid, _NO_CACHEADO)
+    if principal is not _NO_CACHEADO:
+        return principal
 
-        if analista:
-            return analista.id_analista
+    fila = db_session.query(db.Analista.id_analista, db.Analista.nivel).filter(
+        db.Analista.id_persona == persona_uuid
+    ).first()
+    principal = AnalistaPrincipal(fila.id_analista, fila.nivel) if fila else None
 
-    return None
+    with _principales_lock:
+        _principales[persona_uuid] = principal
+    return principal
+
+
+def invalidate_analyst_principal(persona_id=None) -> None:
+    """Olvida la identidad cacheada de una persona (o de todas si persona_id es None)."""
+    with _principales_lock:
+        if persona_id is None:
+            _principales.clear()
+            return
+        try:
+            _principales.pop(uuid.UUID(str(persona_id)), None)
+        except ValueError:
+            pass
+
+
+def get_analyst_id_for_current_user(db_session: Session, user_info: sch.TokenData) -> uuid.UUID | None:
+    """
+    Busca y devuelve el id_analista del usuario autenticado.
+    Si el usuario no es un analista, devuelve None.
+    """
+    principal = get_analyst_principal(db_session, user_info)
+    return principal.id_analista if principal else None
+
+
+def encode_cursor(updated_at: datetime.datetime, id_ticket: int) -> str:
+    """
+    Cursor opaco de la bandeja: (updated_at o due_at, id_ticket) del último ticket devuelto.
+    """
+    raw = json.dumps({"u": updated_at.isoformat(), "id": id_ticket})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, int]:
+    """
+    Inverso de encode_cursor. Lanza ValueError si el cursor no es válido.
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.datetime.fromisoformat(data["u"]), int(data["id"])
+    except Exception as e:
+        raise ValueError(f"Cursor inválido: {cursor}") from e
 
 
 def get_tickets_by_analyst(
@@ -38,18 +112,170 @@ def get_tickets_by_analyst(
     limit: int = 20,
     offset: int = 0,
     estados: Optional[List[str]] = None,
+    cursor: Optional[str] = None,
+    orden: str = "recientes",
+    sla: Optional[str] = None,
 ):
     """
     Devuelve tickets asignados a un analista específico, paginados.
+
+    - orden="recientes": (updated_at DESC, id_ticket DESC).
+    - orden="prioridad": tickets abiertos por vencimiento (due_at ASC, id_ticket ASC).
+    - sla="en_riesgo" | "vencido": solo tickets abiertos próximos a vencer o ya vencidos.
+    - Con `cursor` se usa paginación keyset (ignora `offset`): costo constante por página.
+    - Sin `cursor` se mantiene LIMIT/OFFSET para los clientes existentes.
+
+    Retorna (rows, total, next_cursor).
     (Solo Tickets; la hidratación masiva se hace con hydrate_ticket_page para evitar N+1).
     """
-    base_q = db_session.query(db.Ticket).filter(db.Ticket.id_analista == analyst_id)
+    T = db.Ticket
+    if (orden == "prioridad" or sla) and not estados:
+        estados = list(util_sla.ESTADOS_ABIERTOS)
+
+    base_q = db_session.query(T).filter(T.id_analista == analyst_id)
     if estados:
-        base_q = base_q.filter(db.Ticket.estado.in_(estados))
+        base_q = base_q.filter(T.estado.in_(estados))
+    if orden == "prioridad":
+        base_q = base_q.filter(T.due_at.is_not(None))
+
+    now = datetime.datetime.utcnow()
+    if sla == "vencido":
+        base_q = base_q.filter(T.due_at < now)
+    elif sla == "en_riesgo":
+        base_q = base_q.filter(T.due_at >= now, T.due_at < now + util_sla.VENTANA_RIESGO)
+
+    # El total sale de los contadores por analista; los filtros de SLA dependen
+    # de la hora, así que ahí se cuenta sobre el índice parcial de abiertos.
+    if sla:
+        total = base_q.count()
+    else:
+        total = crud_contadores.total_por_estados(db_session, analyst_id, estados)
 
-    total = base_q.count()
-    rows = base_q.order_by(db.Ticket.updated_at.desc()).limit(limit).offset(offset).all()
-    return rows, total
+    rows, next_cursor = _keyset_page(base_q, limit, cursor=cursor, offset=offset, orden=orden)
+    return rows, total, next_cursor
+
+
+def _keyset_page(base_q, limit: int, cursor: Optional[str] = None, offset: int = 0, orden: str = "recientes"):
+    """
+    Pagina una query de tickets por (updated_at DESC, id_ticket DESC) o, con
+    orden="prioridad", por (due_at ASC, id_ticket ASC).
+    Con cursor usa keyset; sin cursor, OFFSET. Retorna (rows, next_cursor).
+    """
+    T = db.Ticket
+    if orden == "prioridad":
+        key_col = T.due_at
+        page_q = base_q.order_by(T.due_at.asc(), T.id_ticket.asc())
+    else:
+        key_col = T.updated_at
+        page_q = base_q.order_by(T.updated_at.desc(), T.id_ticket.desc())
+
+    if cursor:
+        valor, id_ticket = decode_cursor(cursor)
+        if orden == "prioridad":
+            page_q = page_q.filter(tuple_(key_col, T.id_ticket) > tuple_(valor, id_ticket))
+        else:
+            page_q = page_q.filter(tuple_(key_col, T.id_ticket) < tuple_(valor, id_ticket))
+    elif offset:
+        page_q = page_q.offset(offset)
+
+    # Pedimos una fila extra para saber si hay página siguiente
+    rows = page_q.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, key_col.key), last.id_ticket)
+    return rows, next_cursor
+
+
+def _with_company_and_service(q):
+    """
+    Agrega a una query de tickets los JOINs hacia empresa (cliente) y servicio.
+    """
+    return (
+        q.outerjoin(db.Colaborador, db.Colaborador.id_colaborador == db.Ticket.id_colaborador)
+        .outerjoin(db.Cliente, db.Cliente.id_cliente == db.Colaborador.id_cliente)
+        .outerjoin(db.ClienteServicio, db.ClienteServicio.id_cliente_servicio == db.Ticket.id_cliente_servicio)
+        .outerjoin(db.Servicio, db.Servicio.id_servicio == db.ClienteServicio.id_servicio)
+    )
+
+
+def search_tickets_by_analyst(
+    db_session: Session,
+    analyst_id,
+    estados: Optional[List[str]] = None,
+    niveles: Optional[List[str]] = None,
+    servicio: Optional[str] = None,
+    empresa: Optional[str] = None,
+    desde: Optional[datetime.date] = None,
+    hasta: Optional[datetime.date] = None,
+    texto: Optional[str] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+):
+    """
+    Búsqueda facetada sobre los tickets de un analista.
+
+    Combina filtros (estado, nivel, servicio, empresa, rango de creación y texto libre
+    sobre el asunto) y devuelve (rows, next_cursor, facets, total), donde `facets` trae
+    los conteos por estado, nivel, servicio y empresa, y `total` los tickets que cumplen
+    los filtros (incluye los que no tienen estado), todo en UNA query con GROUPING SETS.
+    """
+    T = db.Ticket
+    conds = [T.id_analista == analyst_id]
+    if estados:
+        conds.append(T.estado.in_(estados))
+    if niveles:
+        conds.append(T.nivel.in_(niveles))
+    if servicio:
+        conds.append(db.Servicio.nombre == servicio)
+    if empresa:
+        conds.append(db.Cliente.nombre == empresa)
+    if desde:
+        conds.append(T.created_at >= desde)
+    if hasta:
+        conds.append(T.created_at < hasta + datetime.timedelta(days=1))
+    if texto:
+        filtro_texto, _ = crud_tickets.subject_search_clause(texto)
+        conds.append(filtro_texto)
+
+    # --- Página (keyset) ---
+    page_q = db_session.query(T)
+    if servicio or empresa:
+        page_q = _with_company_and_service(page_q)
+    rows, next_cursor = _keyset_page(page_q.filter(*conds), limit, cursor=cursor)
+
+    # --- Facetas en una sola agregación ---
+    facet_cols = {
+        "estado": T.estado,
+        "nivel": T.nivel,
+        "service": db.Servicio.nombre,
+        "company": db.Cliente.nombre,
+    }
+    facet_q = (
+        _with_company_and_service(
+            db_session.query(
+                *[col.label(name) for name, col in facet_cols.items()],
+                *[func.grouping(col).label(f"g_{name}") for name, col in facet_cols.items()],
+                func.count().label("n"),
+            ).select_from(T)
+        )
+        .filter(*conds)
+        # El conjunto vacío () da el total con los mismos filtros
+        .group_by(func.grouping_sets(*[tuple_(col) for col in facet_cols.values()], tuple_()))
+    )
+
+    facets = {name: {} for name in facet_cols}
+    total = 0
+    for r in facet_q:
+        if all(getattr(r, f"g_{name}") == 1 for name in facet_cols):
+            total = r.n
+            continue
+        for name in facet_cols:
+            # grouping(col) == 0 indica que la fila pertenece a la faceta de esa columna
+            if getattr(r, f"g_{name}") == 0 and getattr(r, name) is not None:
+                facets[name][getattr(r, name)] = r.n
+    return rows, next_cursor, facets, total
 
 
 def get_ticket_admin_by_id(db_session: Session, ticket_id: int):
@@ -59,71 +285,188 @@ def get_ticket_admin_by_id(db_session: Session, ticket_id: int):
     return db_session.query(db.Ticket).filter(db.Ticket.id_ticket == ticket_id).first()
 
 
-def get_conversation_by_ticket(db_session: Session, ticket_id: int):
+def _format_date(value) -> Optional[str]:
     """
-    Devuelve la fila de Conversacion asociada a un ticket (si existe).
+    Formatea created_at como dd/mm/aaaa (o None si no es una fecha).
     """
-    return db_session.query(db.Conversacion).filter(db.Conversacion.id_ticket == ticket_id).first()
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.strftime("%d/%m/%Y")
+    return None
+
+
+CONVERSACION_ULTIMOS = 50   # mensajes que trae el detalle; los anteriores se paginan
+
+
+def _ticket_detail_stmt(t):
+    """
+    Arma el SELECT del detalle de ticket en UN solo round trip.
+
+    `t` es la tabla ticket (o un CTE con sus mismas columnas). Usuario, empresa,
+    servicio, último escalado y conversación se resuelven con JOINs y LATERALs.
+    """
+    Col = db.Colaborador
+    Ext = db.External
+    Cli = db.Cliente
+    CS = db.ClienteServicio
+    Srv = db.Servicio
+    Esc = db.Escalado
+    Msg = db.ConversacionMensaje
+
+    ext = (
+        select(Ext.nombre, Ext.correo)
+        .where(Ext.id_persona == Col.id_persona)
+        .limit(1)
+        .lateral("ext")
+    )
+    esc = (
+        select(Esc.motivo)
+        .where(Esc.id_ticket == t.c.id_ticket)
+        .order_by(Esc.id_escalado.desc())
+        .limit(1)
+        .lateral("esc")
+    )
+    # Solo los últimos N mensajes (backward scan sobre la PK), devueltos en orden cronológico
+    ultimos = (
+        select(Msg.secuencia, Msg.rol, Msg.contenido)
+        .where(Msg.id_ticket == t.c.id_ticket)
+        .order_by(Msg.secuencia.desc())
+        .limit(CONVERSACION_ULTIMOS)
+        .correlate(t)
+        .lateral("ultimos")
+    )
+    conv = (
+        select(
+            func.json_agg(
+                aggregate_order_by(
+                    func.json_build_object("role", ultimos.c.rol, "content", ultimos.c.contenido),
+                    ultimos.c.secuencia,
+                )
+            ).label("contenido"),
+            func.min(ultimos.c.secuencia).label("primera_secuencia"),
+        )
+        .select_from(ultimos)
+        .lateral("conv")
+    )
+
+    return (
+        select(
+            t.c.id_ticket,
+            t.c.asunto.label("subject"),
+            t.c.estado.label("status"),
+            t.c.tipo.label("type"),
+            t.c.nivel.label("level"),
+            t.c.diagnostico.label("description"),
+            t.c.created_at,
+            t.c.updated_at,
+            t.c.due_at,
+            ext.c.nombre.label("user"),
+            ext.c.correo.label("email"),
+            Cli.nombre.label("company"),
+            Srv.nombre.label("service"),
+            esc.c.motivo.label("escalation_reason"),
+            conv.c.contenido.label("contenido"),
+            conv.c.primera_secuencia,
+        )
+        .select_from(t)
+        .outerjoin(Col, Col.id_colaborador == t.c.id_colaborador)
+        .outerjoin(ext, true())
+        .outerjoin(Cli, Cli.id_cliente == Col.id_cliente)
+        .outerjoin(CS, CS.id_cliente_servicio == t.c.id_cliente_servicio)
+        .outerjoin(Srv, Srv.id_servicio == CS.id_servicio)
+        .outerjoin(esc, true())
+        .outerjoin(conv, true())
+    )
 
 
-def hydrate_ticket_info(db_session: Session, ticket: db.Ticket):
+def _detail_row_to_info(row) -> dict:
     """
-    Hidratación para un (1) ticket — útil para la pantalla de detalle.
-    (Deja la versión original; para listas usa hydrate_ticket_page).
+    Convierte una fila de _ticket_detail_stmt en el dict con forma de AnalystTicketDetail.
     """
-    info = {
-        "id_ticket": ticket.id_ticket,
-        "subject": getattr(ticket, "asunto", None),
-        "status": getattr(ticket, "estado", None),
-        "type": getattr(ticket, "tipo", None),
-        "date": None,
-        "updated_at": getattr(ticket, "updated_at", None),
-        "user": None,
-        "email": None,
-        "company": None,
-        "service": None,
-        "level": getattr(ticket, "nivel", None),  # <- nuevo
-        "description": getattr(ticket, "diagnostico", None),
-        "escalation_reason": None,
+    return {
+        "id_ticket": row.id_ticket,
+        "subject": row.subject,
+        "status": row.status,
+        "type": row.type,
+        "date": _format_date(row.created_at),
+        "updated_at": row.updated_at,
+        "due_at": row.due_at,
+        "user": row.user,
+        "email": row.email,
+        "company": row.company,
+        "service": row.service,
+        "level": row.level,
+        "description": row.description,
+        "escalation_reason": row.escalation_reason,
+        "conversation": list(row.contenido or []),
+        # Hay mensajes anteriores si el primero devuelto no es el #1
+        "conversation_cursor": row.primera_secuencia if (row.primera_secuencia or 1) > 1 else None,
     }
 
-    # Fecha (created_at)
-    created_at = getattr(ticket, "created_at", None)
-    if isinstance(created_at, (datetime.datetime, datetime.date)):
-        info["date"] = created_at.strftime("%d/%m/%Y")
-
-    # Usuario (colaborador -> persona -> external.nombre/correo) y Empresa (cliente)
-    colaborador = db_session.query(db.Colaborador).filter(db.Colaborador.id_colaborador == ticket.id_colaborador).first()
-    if colaborador:
-        external = db_session.query(db.External).filter(db.External.id_persona == colaborador.id_persona).first()
-        if external:
-            info["user"] = getattr(external, "nombre", None)
-            info["email"] = getattr(external, "correo", None)
-        cliente = db_session.query(db.Cliente).filter(db.Cliente.id_cliente == colaborador.id_cliente).first()
-        if cliente:
-            info["company"] = getattr(cliente, "nombre", None)
-
-    # Servicio
-    cs = db_session.query(db.ClienteServicio).filter(
-        db.ClienteServicio.id_cliente_servicio == ticket.id_cliente_servicio
+
+def get_ticket_detail(db_session: Session, ticket_id: int) -> dict | None:
+    """
+    Devuelve el detalle completo de un ticket (incluida la conversación) en una sola query.
+    Retorna None si el ticket no existe.
+    """
+    t = db.Ticket.__table__
+    row = db_session.execute(
+        _ticket_detail_stmt(t).where(t.c.id_ticket == ticket_id)
     ).first()
-    if cs:
-        servicio = db_session.query(db.Servicio).filter(db.Servicio.id_servicio == cs.id_servicio).first()
-        if servicio:
-            info["service"] = getattr(servicio, "nombre", None)
+    if not row:
+        return None
+    return _detail_row_to_info(row)
 
-    escalation_reason = crud_escalados.get_latest_escalation_reason(db_session, ticket.id_ticket)
-    if escalation_reason:
-        info["escalation_reason"] = escalation_reason
 
-    return info
+# ========= NUEVO =========
+def get_ticket_version(db_session: Session, ticket_id: int):
+    """
+    Versión del detalle de un ticket para su ETag: (updated_at, última secuencia
+    de la conversación). Dos lecturas por PK; None si no existe.
+    """
+    T = db.Ticket
+    Msg = db.ConversacionMensaje
+    ultima = select(func.max(Msg.secuencia)).where(Msg.id_ticket == T.id_ticket).scalar_subquery()
+    return db_session.execute(
+        select(T.updated_at, ultima).where(T.id_ticket == ticket_id)
+    ).first()
+
+
+def get_conversation_page(db_session: Session, ticket_id: int, antes: Optional[int] = None, limit: int = 50):
+    """
+    Página de mensajes de un ticket hacia atrás: los `limit` anteriores a la
+    secuencia `antes` (o los últimos si no viene), en orden cronológico.
+    Keyset sobre la PK (id_ticket, secuencia). Retorna (mensajes, next_cursor).
+    """
+    Msg = db.ConversacionMensaje
+    q = select(Msg.secuencia, Msg.rol, Msg.contenido).where(Msg.id_ticket == ticket_id)
+    if antes is not None:
+        q = q.where(Msg.secuencia < antes)
+    filas = db_session.execute(q.order_by(Msg.secuencia.desc()).limit(limit)).all()
+    filas.reverse()
+
+    mensajes = [{"role": f.rol, "content": f.contenido} for f in filas]
+    next_cursor = filas[0].secuencia if filas and filas[0].secuencia > 1 else None
+    return mensajes, next_cursor
+
+
+def get_inbox_version(db_session: Session, analyst_id) -> int:
+    """
+    Versión de la bandeja de un analista para su ETag: una lectura por PK de
+    `bandeja_version`, que el trigger de ticket incrementa en cada alta, cambio,
+    baja o derivación (migraciones 0011 y 0013). 0 si el analista aún no tiene fila.
+    """
+    V = db.BandejaVersion
+    version = db_session.execute(
+        select(V.version).where(V.id_analista == analyst_id)
+    ).scalar()
+    return version or 0
 
 
-# ========= NUEVO =========
 def hydrate_ticket_page(db_session: Session, tickets: List[db.Ticket]) -> List[dict]:
     """
     Hidratación masiva para una página de tickets (evita N+1).
-    Hace 2 queries en bloque y luego arma los dicts.
+    Hace 3 queries en bloque (colaboradores, servicios y último escalado)
+    y luego arma los dicts; el número de queries no depende del tamaño de página.
     """
     if not tickets:
         return []
@@ -164,6 +507,17 @@ def hydrate_ticket_page(db_session: Session, tickets: List[db.Ticket]) -> List[d
     )
     service_map = {r.id_cliente_servicio: r.service for r in cs_rows}
 
+    # --- Mapa de ticket -> motivo del último escalado (DISTINCT ON) ---
+    Esc = db.Escalado
+    ticket_ids = [t.id_ticket for t in tickets]
+    esc_rows = (
+        db_session.query(Esc.id_ticket, Esc.motivo)
+        .filter(Esc.id_ticket.in_(ticket_ids))
+        .distinct(Esc.id_ticket)
+        .order_by(Esc.id_ticket, Esc.id_escalado.desc())
+    )
+    escalation_map = {r.id_ticket: r.motivo for r in esc_rows}
+
     # --- Armar respuesta final por ticket ---
     resp: List[dict] = []
     for t in tickets:
@@ -174,15 +528,16 @@ def hydrate_ticket_page(db_session: Session, tickets: List[db.Ticket]) -> List[d
             "type": getattr(t, "tipo", None),
             "date": None,
             "updated_at": getattr(t, "updated_at", None),
+            "due_at": getattr(t, "due_at", None),
             "user": None,
             "email": None,
             "company": None,
             "service": None,
+            "level": getattr(t, "nivel", None),
+            "escalation_reason": escalation_map.get(t.id_ticket),
         }
 
-        created_at = getattr(t, "created_at", None)
-        if isinstance(created_at, (datetime.datetime, datetime.date)):
-            info["date"] = created_at.strftime("%d/%m/%Y")
+        info["date"] = _format_date(getattr(t, "created_at", None))
 
         c = colab_map.get(getattr(t, "id_colaborador", None))
         if c:
@@ -200,92 +555,265 @@ def hydrate_ticket_page(db_session: Session, tickets: List[db.Ticket]) -> List[d
 # ======== FIN NUEVO ========
 
 
-def update_ticket_status_db(
-    db_session: Session,
-    ticket_id: int,
-    new_status: str,
-    description: Optional[str] = None,
-):
+# En src/crud/crud_analista.py
+
+def get_analyst_from_token(db_session: Session, current_user: sch.TokenData) -> AnalistaPrincipal | None:
     """
-    Actualiza el estado de un ticket. Si new_status == 'finalizado':
-    - setea closed_at
-    - guarda 'description' en ticket.diagnostico (si viene)
+    Devuelve la identidad del analista (id_analista, nivel) a partir de la
+    información del token del usuario actual, o None si no es analista.
     """
-    ticket = (
-        db_session.query(db.Ticket)
-        .filter(db.Ticket.id_ticket == ticket_id)
-        .first()
-    )
-    if not ticket:
+    if not current_user.persona_id:
         return None
+    return get_analyst_principal(db_session, current_user)
 
-    ticket.estado = new_status
-    ticket.updated_at = datetime.datetime.utcnow()
 
-    if new_status == "finalizado":
-        ticket.closed_at = datetime.datetime.utcnow()
-        if description:
-            ticket.diagnostico = description[:5000]
+def apply_ticket_changes_db(
+    db_session: Session,
+    ticket_id: int,
+    analyst_id,
+    new_status: Optional[str] = None,
+    new_level: Optional[str] = None,
+    description: Optional[str] = None,
+    expected_updated_at: Optional[datetime.datetime] = None,
+) -> dict | None:
+    """
+    Aplica estado, nivel (con su due_at), closed_at y diagnóstico en un solo
+    UPDATE ... RETURNING, y con el mismo round trip devuelve el detalle hidratado
+    (el UPDATE va como CTE dentro del SELECT de _ticket_detail_stmt).
 
-    db_session.commit()
-    db_session.refresh(ticket)
-    return ticket
+    - Solo actualiza si el ticket pertenece a `analyst_id`.
+    - Si viene `expected_updated_at`, solo actualiza si nadie modificó el ticket
+      desde entonces (concurrencia optimista).
 
-def find_random_higher_level_analyst(db_session: Session, current_analyst_id: str):
-    """
-    Busca un analista aleatorio de un nivel superior al actual.
+    Retorna el dict con forma de AnalystTicketDetail, o None si no se actualizó
+    ninguna fila (no existe, no es del analista o hubo conflicto).
     """
-    # 1. Obtener el nivel del analista actual
-    current_analyst = db_session.query(db.Analista).filter(
-        db.Analista.id_analista == current_analyst_id
-    ).first()
+    t = db.Ticket.__table__
+    now = datetime.datetime.utcnow()
+
+    # Fila actual bloqueada: da los valores previos para ajustar contadores
+    prev = t.alias("prev")
+    anterior = (
+        select(prev.c.id_ticket, prev.c.estado, prev.c.nivel)
+        .where(prev.c.id_ticket == ticket_id)
+        .with_for_update()
+        .subquery("anterior")
+    )
 
-    if not current_analyst:
-        return None
+    values = {"updated_at": now}
+    if new_status:
+        values["estado"] = new_status
+        if new_status == "finalizado":
+            values["closed_at"] = now
+            if description:
+                values["diagnostico"] = description[:5000]
+    if new_level:
+        values["nivel"] = new_level
+        plazo = util_sla.SLA_POR_NIVEL.get(new_level)
+        values["due_at"] = t.c.created_at + plazo if plazo else None
+
+    conds = [t.c.id_ticket == anterior.c.id_ticket, t.c.id_analista == analyst_id]
+    if expected_updated_at is not None:
+        conds.append(t.c.updated_at == expected_updated_at)
+
+    actualizado = (
+        update(t)
+        .where(*conds)
+        .values(**values)
+        .returning(
+            *t.c,
+            anterior.c.estado.label("estado_anterior"),
+            anterior.c.nivel.label("nivel_anterior"),
+        )
+        .cte("actualizado")
+    )
+    stmt = _ticket_detail_stmt(actualizado).add_columns(
+        actualizado.c.id_analista,
+        actualizado.c.estado_anterior,
+        actualizado.c.nivel_anterior,
+    )
 
-    # 2. Pedir a la base de datos que busque candidatos de nivel superior,
-    # los ordene aleatoriamente y nos dé el primero que encuentre.
-    return db_session.query(db.Analista).filter(
-        db.Analista.nivel > current_analyst.nivel
-    ).order_by(func.random()).first()
+    row = db_session.execute(stmt).first()
+    if not row:
+        db_session.rollback()
+        return None
 
+    crud_contadores.registrar_cambio(
+        db_session,
+        (row.id_analista, row.estado_anterior, row.nivel_anterior),
+        (row.id_analista, row.status, row.level),
+    )
+    util_eventos.publicar(
+        db_session, "ticket_actualizado", row.id_ticket, [row.id_analista],
+        status=row.status, level=row.level, updated_at=row.updated_at, due_at=row.due_at,
+    )
+    util_cache.invalidar_al_confirmar(db_session, [row.id_ticket], [row.id_analista])
+    db_session.commit()
 
-# En src/crud/crud_analista.py
+    abierto_antes = row.estado_anterior in util_sla.ESTADOS_ABIERTOS
+    abierto_ahora = row.status in util_sla.ESTADOS_ABIERTOS
+    if abierto_antes != abierto_ahora:
+        util_asignacion.indice_analistas.ajustar_carga(row.id_analista, +1 if abierto_ahora else -1)
 
-def get_analyst_from_token(db_session: Session, current_user: sch.TokenData) -> db.Analista | None:
-    """
-    Busca y devuelve el objeto Analista completo a partir de la información
-    del token del usuario actual.
-    """
-    if not current_user.persona_id:
-        return None
+    return _detail_row_to_info(row)
 
-    # Buscamos en la tabla Analista usando el id_persona que está en el token
-    analyst = db_session.query(db.Analista).filter(
-        db.Analista.id_persona == current_user.persona_id
-    ).first()
 
-    return analyst
-def update_ticket_level_db(
+def apply_bulk_changes_db(
     db_session: Session,
-    ticket_id: int,
-    new_level: str,
-):
+    analyst: AnalistaPrincipal,
+    ticket_ids: List[int],
+    new_status: Optional[str] = None,
+    new_level: Optional[str] = None,
+    description: Optional[str] = None,
+    motivo_derivacion: Optional[str] = None,
+) -> List[dict]:
     """
-    Actualiza el nivel (prioridad) de un ticket.
+    Aplica los mismos cambios (estado, nivel y/o derivación) a varios tickets en
+    UNA transacción:
+
+    1. Un SELECT ... FOR UPDATE valida pertenencia de todos los tickets a la vez.
+    2. Un UPDATE set-based para estado/nivel/due_at/closed_at/diagnóstico.
+    3. Un UPDATE con CASE para reasignar y un INSERT multi-fila en escalado.
+    4. Un único INSERT ... ON CONFLICT con los deltas agregados de contadores.
+
+    Retorna un dict por ticket (en el orden pedido) con forma de BulkTicketResult.
     """
-    ticket = (
-        db_session.query(db.Ticket)
-        .filter(db.Ticket.id_ticket == ticket_id)
-        .first()
-    )
-    if not ticket:
-        return None
+    t = db.Ticket.__table__
+    now = datetime.datetime.utcnow()
+    ids = list(dict.fromkeys(ticket_ids))
+    resultados = {i: {"id_ticket": i, "ok": False} for i in ids}
+
+    # 1) Pertenencia + valores previos, con las filas bloqueadas
+    previos = {
+        r.id_ticket: r
+        for r in db_session.execute(
+            select(t.c.id_ticket, t.c.id_analista, t.c.estado, t.c.nivel)
+            .where(t.c.id_ticket.in_(ids))
+            .with_for_update()
+        )
+    }
+    propios = []
+    for i in ids:
+        prev = previos.get(i)
+        if not prev:
+            resultados[i]["error"] = "Ticket no encontrado."
+        elif prev.id_analista != analyst.id_analista:
+            resultados[i]["error"] = "No autorizado para modificar este ticket."
+        else:
+            propios.append(i)
+
+    # Estado/nivel final de cada ticket propio (para contadores y derivación)
+    finales = {
+        i: [analyst.id_analista, new_status or previos[i].estado, new_level or previos[i].nivel]
+        for i in propios
+    }
 
-    # Actualizamos el nivel y la fecha de modificación
-    ticket.nivel = new_level
-    ticket.updated_at = datetime.datetime.utcnow()
+    # 2) Estado y nivel en un solo UPDATE
+    if propios and (new_status or new_level):
+        values = {"updated_at": now}
+        if new_status:
+            values["estado"] = new_status
+            if new_status == "finalizado":
+                values["closed_at"] = now
+                if description:
+                    values["diagnostico"] = description[:5000]
+        if new_level:
+            values["nivel"] = new_level
+            plazo = util_sla.SLA_POR_NIVEL.get(new_level)
+            values["due_at"] = t.c.created_at + plazo if plazo else None
+        db_session.execute(
+            update(t).where(t.c.id_ticket.in_(propios), t.c.id_analista == analyst.id_analista).values(**values)
+        )
 
-    db_session.commit()
-    db_session.refresh(ticket)
-    return ticket
+    # 3) Derivación: destinos elegidos en memoria, luego un UPDATE y un INSERT
+    reservas = []
+    if propios and motivo_derivacion:
+        router_derivaciones = util_asignacion.enrutador_derivaciones
+        for i in propios:
+            if finales[i][1] not in util_sla.ESTADOS_ABIERTOS:
+                resultados[i]["error"] = "Solo se pueden derivar tickets abiertos."
+                continue
+            destino = router_derivaciones.elegir_superior(db_session, analyst.id_analista, analyst.nivel)
+            if destino is None:
+                resultados[i]["error"] = "No se encontraron analistas de nivel superior disponibles."
+                continue
+            reservas.append((i, destino))
+            finales[i][0] = destino
+            resultados[i]["derivado_a"] = destino
+
+        if reservas:
+            destinos = dict(reservas)
+            db_session.execute(
+                update(t)
+                .where(t.c.id_ticket.in_(list(destinos)))
+                .values(
+                    # CAST explícito: un CASE de parámetros sin tipo se resolvería a text
+                    id_analista=cast(case(destinos, value=t.c.id_ticket), t.c.id_analista.type),
+                    updated_at=now,
+                )
+            )
+            db_session.execute(
+                insert(db.Escalado),
+                [
+                    {
+                        "id_ticket": i,
+                        "id_analista_solicitante": analyst.id_analista,
+                        "id_analista_derivado": destino,
+                        "motivo": motivo_derivacion,
+                    }
+                    for i, destino in reservas
+                ],
+            )
+
+    # 4) Contadores: un delta por clave, agregado para todo el lote
+    deltas: dict = {}
+    for i in propios:
+        antes = (analyst.id_analista, previos[i].estado, previos[i].nivel)
+        despues = tuple(finales[i])
+        if antes != despues:
+            deltas[antes] = deltas.get(antes, 0) - 1
+            deltas[despues] = deltas.get(despues, 0) + 1
+
+    # Eventos para la bandeja: uno por ticket propio (derivados: al anterior y al nuevo dueño)
+    eventos = []
+    for i in propios:
+        r = resultados[i]
+        if "derivado_a" in r:
+            eventos.append({"tipo": "ticket_derivado", "id_ticket": i,
+                            "analistas": [analyst.id_analista, r["derivado_a"]],
+                            "id_analista": r["derivado_a"], "status": finales[i][1], "level": finales[i][2]})
+        elif new_status or new_level:
+            eventos.append({"tipo": "ticket_actualizado", "id_ticket": i, "analistas": [analyst.id_analista],
+                            "status": finales[i][1], "level": finales[i][2]})
+
+    try:
+        crud_contadores.aplicar_deltas(db_session, deltas)
+        util_eventos.publicar_lote(db_session, eventos)
+        util_cache.invalidar_al_confirmar(
+            db_session, propios, [analyst.id_analista] + [destino for _, destino in reservas]
+        )
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        for i, destino in reservas:
+            util_asignacion.enrutador_derivaciones.revertir(analyst.id_analista, destino)
+        raise
+
+    # Carga del índice: tickets propios que cruzaron abierto <-> cerrado
+    delta_carga = 0
+    for i in propios:
+        abierto_antes = previos[i].estado in util_sla.ESTADOS_ABIERTOS
+        abierto_ahora = finales[i][1] in util_sla.ESTADOS_ABIERTOS
+        if abierto_antes != abierto_ahora:
+            delta_carga += 1 if abierto_ahora else -1
+    if delta_carga:
+        util_asignacion.indice_analistas.ajustar_carga(analyst.id_analista, delta_carga)
+
+    # Si la derivación falló pero estado/nivel se aplicaron, el resultado lo refleja igual
+    for i in propios:
+        r = resultados[i]
+        r["ok"] = "error" not in r
+        r["status"], r["level"] = finales[i][1], finales[i][2]
+        if new_status or new_level or "derivado_a" in r:
+            r["updated_at"] = now
+    return [resultados[i] for i in ids]
@@ -0,0 +1,203 @@
+import datetime
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from src.util import util_tareas
+
+# Nombre de la marca de agua en rollup_marca
+MARCA_ROLLUP = "ticket_diario"
+# Llave de pg_advisory_xact_lock para que dos corridas no se pisen
+_LOCK_ROLLUP = 7_301_036
+# Margen para no perder tickets cuyo updated_at quedó por debajo de la marca al confirmar tarde
+MARGEN_MARCA = datetime.timedelta(minutes=5)
+# Cada cuánto corre el pipeline incremental en el trabajador de tareas
+ROLLUP_CADA_SEGUNDOS = 15 * 60
+
+AGRUPACIONES = {
+    "nivel": "r.nivel",
+    "cliente": "c.nombre",
+    "servicio": "s.nombre",
+    "fecha": "r.fecha::text",
+}
+
+_SQL_DIAS_AFECTADOS = text("""
+    SELECT DISTINCT d FROM (
+        SELECT created_at::date AS d FROM ticket WHERE updated_at > :marca
+        UNION
+        SELECT closed_at::date FROM ticket WHERE updated_at > :marca AND closed_at IS NOT NULL
+        UNION
+        SELECT t.created_at::date
+        FROM escalado e JOIN ticket t ON t.id_ticket = e.id_ticket
+        WHERE e.id_escalado > :ultimo_escalado
+    ) x
+    WHERE d IS NOT NULL
+""")
+
+_SQL_RECALCULAR_DIAS = text("""
+    INSERT INTO rollup_ticket_diario
+        (fecha, id_cliente, id_servicio, nivel, creados, escalados, cerrados, cerrados_en_sla, segundos_cierre)
+    SELECT fecha, id_cliente, id_servicio, nivel,
+           sum(creados), sum(escalados), sum(cerrados), sum(cerrados_en_sla), sum(segundos_cierre)
+    FROM (
+        SELECT t.created_at::date AS fecha, cs.id_cliente, cs.id_servicio, t.nivel::text AS nivel,
+               1 AS creados,
+               CASE WHEN EXISTS (SELECT 1 FROM escalado e WHERE e.id_ticket = t.id_ticket) THEN 1 ELSE 0 END AS escalados,
+               0 AS cerrados, 0 AS cerrados_en_sla, 0::bigint AS segundos_cierre
+        FROM ticket t
+        JOIN cliente_servicio cs ON cs.id_cliente_servicio = t.id_cliente_servicio
+        WHERE t.created_at >= :desde AND t.created_at < :hasta AND t.created_at::date = ANY(:dias)
+        UNION ALL
+        SELECT t.closed_at::date, cs.id_cliente, cs.id_servicio, t.nivel::text,
+               0, 0, 1,
+               CASE WHEN t.due_at IS NOT NULL AND t.closed_at <= t.due_at THEN 1 ELSE 0 END,
+               extract(epoch FROM t.closed_at - t.created_at)::bigint
+        FROM ticket t
+        JOIN cliente_servicio cs ON cs.id_cliente_servicio = t.id_cliente_servicio
+        WHERE t.closed_at >= :desde AND t.closed_at < :hasta AND t.closed_at::date = ANY(:dias)
+    ) x
+    WHERE nivel IS NOT NULL
+    GROUP BY fecha, id_cliente, id_servicio, nivel
+""")
+
+
+def actualizar_rollups(db_session: Session, completo: bool = False) -> int:
+    """
+    Recalcula rollup_ticket_diario solo para los días tocados desde la última corrida
+    (tickets creados/actualizados/cerrados y nuevos escalados). Con completo=True
+    reconstruye todos los días. Devuelve la cantidad de días recalculados.
+    """
+    db_session.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _LOCK_ROLLUP})
+    marca = db_session.execute(
+        text("SELECT ultimo_updated_at, ultimo_id_escalado FROM rollup_marca WHERE nombre = :n"),
+        {"n": MARCA_ROLLUP},
+    ).first()
+    nueva_marca = db_session.execute(text(
+        "SELECT (SELECT max(updated_at) FROM ticket), (SELECT max(id_escalado) FROM escalado)"
+    )).first()
+
+    if completo or not marca or marca[0] is None:
+        desde_marca, ultimo_escalado = datetime.datetime.min, 0
+    else:
+        desde_marca, ultimo_escalado = marca[0] - MARGEN_MARCA, marca[1] or 0
+
+    dias = [
+        r[0] for r in db_session.execute(
+            _SQL_DIAS_AFECTADOS, {"marca": desde_marca, "ultimo_escalado": ultimo_escalado}
+        )
+    ]
+
+    if dias:
+        rango = {
+            "dias": dias,
+            "desde": min(dias),
+            "hasta": max(dias) + datetime.timedelta(days=1),
+        }
+        db_session.execute(text("DELETE FROM rollup_ticket_diario WHERE fecha = ANY(:dias)"), rango)
+        db_session.execute(_SQL_RECALCULAR_DIAS, rango)
+
+    db_session.execute(
+        text("""
+            INSERT INTO rollup_marca (nombre, ultimo_updated_at, ultimo_id_escalado, procesado_en)
+            VALUES (:n, :u, :e, now())
+            ON CONFLICT (nombre) DO UPDATE SET
+                ultimo_updated_at = EXCLUDED.ultimo_updated_at,
+                ultimo_id_escalado = EXCLUDED.ultimo_id_escalado,
+                procesado_en = EXCLUDED.procesado_en
+        """),
+        {"n": MARCA_ROLLUP, "u": nueva_marca[0], "e": nueva_marca[1]},
+    )
+    db_session.commit()
+    return len(dias)
+
+
+@util_tareas.periodica("actualizar_rollups", ROLLUP_CADA_SEGUNDOS)
+def _actualizar_rollups_periodico(db_session: Session) -> None:
+    recalculados = actualizar_rollups(db_session)
+    if recalculados:
+        print(f"Rollups actualizados: {recalculados} días recalculados.")
+
+
+def _ratio(numerador: np.ndarray, denominador: np.ndarray, escala: float = 1.0) -> list[Optional[float]]:
+    """
+    Divide elemento a elemento; None donde el denominador es 0.
+    """
+    out = np.divide(numerador, denominador * escala, out=np.zeros(len(numerador)), where=denominador > 0)
+    return [round(float(v), 4) if d > 0 else None for v, d in zip(out, denominador)]
+
+
+def obtener_metricas(
+    db_session: Session,
+    desde: datetime.date,
+    hasta: datetime.date,
+    agrupar: str = "nivel",
+) -> dict:
+    """
+    Métricas de SLA y throughput entre `desde` y `hasta` (inclusive), leídas solo de
+    los rollups diarios y agregadas con NumPy por la dimensión `agrupar`
+    (nivel, cliente, servicio o fecha).
+    """
+    dimension = AGRUPACIONES[agrupar]
+    filas = db_session.execute(
+        text(f"""
+            SELECT {dimension} AS clave,
+                   r.creados, r.escalados, r.cerrados, r.cerrados_en_sla, r.segundos_cierre
+            FROM rollup_ticket_diario r
+            LEFT JOIN cliente c ON c.id_cliente = r.id_cliente
+            LEFT JOIN servicio s ON s.id_servicio = r.id_servicio
+            WHERE r.fecha BETWEEN :desde AND :hasta
+        """),
+        {"desde": desde, "hasta": hasta},
+    ).all()
+
+    if not filas:
+        return {"grupos": [], "totales": _metricas(np.array(["total"]), np.zeros((1, 5)))[0]}
+
+    claves = np.array([str(f[0]) if f[0] is not None else "Sin dato" for f in filas])
+    valores = np.array([f[1:] for f in filas], dtype=np.float64)
+
+    etiquetas, inversa = np.unique(claves, return_inverse=True)
+    # Suma por grupo de cada métrica: (n_grupos x 5)
+    por_grupo = np.zeros((len(etiquetas), valores.shape[1]))
+    np.add.at(por_grupo, inversa, valores)
+
+    return {
+        "grupos": _metricas(etiquetas, por_grupo),
+        "totales": _metricas(np.array(["total"]), valores.sum(axis=0, keepdims=True))[0],
+    }
+
+
+def _metricas(etiquetas, sumas: np.ndarray) -> list[dict]:
+    """
+    Convierte las sumas (creados, escalados, cerrados, cerrados_en_sla, segundos_cierre)
+    en métricas por grupo.
+    """
+    creados, escalados, cerrados, en_sla, segundos = sumas.T
+    cumplimiento = _ratio(en_sla, cerrados)
+    horas_cierre = _ratio(segundos, cerrados, escala=3600.0)
+    tasa_escalamiento = _ratio(escalados, creados)
+    return [
+        {
+            "clave": str(etiqueta),
+            "creados": int(creados[i]),
+            "cerrados": int(cerrados[i]),
+            "escalados": int(escalados[i]),
+            "cumplimiento_sla": cumplimiento[i],
+            "tiempo_medio_cierre_horas": horas_cierre[i],
+            "tasa_escalamiento": tasa_escalamiento[i],
+        }
+        for i, etiqueta in enumerate(np.atleast_1d(etiquetas))
+    ]
+
+
+if __name__ == "__main__":
+    # La API lo corre cada ROLLUP_CADA_SEGUNDOS en el trabajador de tareas. A mano (p. ej.
+    # para reconstruir tras un backfill): python -m src.crud.crud_analitica [--completo]
+    import sys
+    from src.util import util_base_de_datos as db
+
+    with Session(db.engine) as session:
+        recalculados = actualizar_rollups(session, completo="--completo" in sys.argv)
+    print(f"Rollups actualizados: {recalculados} días recalculados.")
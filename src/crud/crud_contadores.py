@@ -0,0 +1,189 @@
+import uuid
+from typing import Optional, List
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from src.util import util_base_de_datos as db
+from src.util import util_tareas
+
+# Clave de un contador: (id_analista, estado, nivel)
+ClaveContador = tuple
+
+# Cada cuánto corre reconciliar_contadores en el trabajador de tareas
+RECONCILIAR_CADA_SEGUNDOS = 24 * 3600
+
+
+def aplicar_deltas(db_session: Session, deltas: dict[ClaveContador, int]) -> None:
+    """
+    Suma los deltas a los contadores en un solo INSERT ... ON CONFLICT DO UPDATE.
+    No hace commit: debe ir en la misma transacción que la mutación del ticket.
+    """
+    filas = [
+        {"id_analista": analista, "estado": estado, "nivel": nivel, "total": delta}
+        for (analista, estado, nivel), delta in deltas.items()
+        if analista and estado and nivel and delta
+    ]
+    if not filas:
+        return
+
+    C = db.ContadorAnalista
+    stmt = insert(C).values(filas)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[C.id_analista, C.estado, C.nivel],
+        set_={"total": C.total + stmt.excluded.total},
+    )
+    db_session.execute(stmt)
+
+
+def registrar_cambio(
+    db_session: Session,
+    antes: Optional[ClaveContador],
+    despues: Optional[ClaveContador],
+) -> None:
+    """
+    Mueve un ticket de un contador a otro (antes -> despues). Usar None para
+    altas (antes) o bajas (despues).
+    """
+    deltas: dict[ClaveContador, int] = {}
+    if antes:
+        deltas[antes] = deltas.get(antes, 0) - 1
+    if despues:
+        deltas[despues] = deltas.get(despues, 0) + 1
+    aplicar_deltas(db_session, deltas)
+
+
+def registrar_cambio_diferido(
+    db_session: Session,
+    antes: Optional[ClaveContador],
+    despues: Optional[ClaveContador],
+) -> None:
+    """
+    Igual que registrar_cambio, pero deja el ajuste en el outbox (misma transacción)
+    para que lo aplique el trabajador de util_tareas fuera del camino crítico.
+    """
+    # Un cambio que no mueve el ticket de contador no encola nada
+    if antes == despues:
+        return
+    # Un ticket sin analista (p. ej. sin analistas disponibles al crearlo) no cuenta
+    deltas = []
+    if antes and antes[0] is not None:
+        deltas.append([str(antes[0]), antes[1], antes[2], -1])
+    if despues and despues[0] is not None:
+        deltas.append([str(despues[0]), despues[1], despues[2], +1])
+    if deltas:
+        util_tareas.encolar(db_session, "contadores", {"deltas": deltas})
+
+
+def incrementar_version_bandejas(db_session: Session, analistas) -> None:
+    """
+    Incrementa `bandeja_version` de los analistas dados (sin commit). El trigger de
+    ticket ya lo hace en cada mutación; esto cubre los cambios que solo tocan los
+    contadores (deltas diferidos, reconciliación), que cambian el total de la bandeja.
+    """
+    filas = [{"id_analista": a, "version": 1} for a in sorted({str(a) for a in analistas if a})]
+    if not filas:
+        return
+
+    V = db.BandejaVersion
+    stmt = insert(V).values(filas)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[V.id_analista],
+        set_={"version": V.version + 1},
+    )
+    db_session.execute(stmt)
+
+
+@util_tareas.manejador("contadores")
+def _aplicar_deltas_diferidos(db_session: Session, payload: dict) -> None:
+    deltas: dict[ClaveContador, int] = {}
+    for analista, estado, nivel, delta in payload.get("deltas", []):
+        deltas[(analista, estado, nivel)] = deltas.get((analista, estado, nivel), 0) + delta
+    aplicar_deltas(db_session, deltas)
+    # El total de la bandeja cambió después del commit del ticket: nuevo ETag
+    incrementar_version_bandejas(db_session, (analista for analista, _, _ in deltas))
+
+
+def total_por_estados(db_session: Session, analyst_id, estados: Optional[List[str]] = None) -> int:
+    """
+    Total de tickets de un analista (opcionalmente filtrado por estados) leído de los contadores.
+    """
+    C = db.ContadorAnalista
+    q = db_session.query(func.coalesce(func.sum(C.total), 0)).filter(C.id_analista == analyst_id)
+    if estados:
+        q = q.filter(C.estado.in_(estados))
+    return int(q.scalar())
+
+
+def resumen_analista(db_session: Session, analyst_id) -> dict:
+    """
+    Devuelve {"total", "por_estado", "por_nivel"} de un analista con una sola lectura de contadores.
+    """
+    C = db.ContadorAnalista
+    filas = db_session.query(C.estado, C.nivel, C.total).filter(
+        C.id_analista == analyst_id, C.total != 0
+    ).all()
+
+    por_estado: dict[str, int] = {}
+    por_nivel: dict[str, int] = {}
+    for estado, nivel, total in filas:
+        por_estado[estado] = por_estado.get(estado, 0) + total
+        por_nivel[nivel] = por_nivel.get(nivel, 0) + total
+    return {"total": sum(por_estado.values()), "por_estado": por_estado, "por_nivel": por_nivel}
+
+
+def reconciliar_contadores(db_session: Session) -> dict[ClaveContador, int]:
+    """
+    Verifica los contadores contra la tabla ticket y corrige las diferencias.
+    Devuelve los deltas aplicados (vacío si todo estaba consistente).
+
+    Bloquea contador_analista mientras compara: las mutaciones concurrentes esperan
+    a que termine, así su cambio en ticket y en el contador se ven juntos.
+    """
+    db_session.execute(text("LOCK TABLE contador_analista IN EXCLUSIVE MODE"))
+
+    T = db.Ticket
+    C = db.ContadorAnalista
+    reales = {
+        (a, e, n): total
+        for a, e, n, total in db_session.query(T.id_analista, T.estado, T.nivel, func.count())
+        .filter(T.id_analista.is_not(None), T.estado.is_not(None), T.nivel.is_not(None))
+        .group_by(T.id_analista, T.estado, T.nivel)
+    }
+    actuales = {(a, e, n): total for a, e, n, total in db_session.query(C.id_analista, C.estado, C.nivel, C.total)}
+
+    # Los deltas aún en el outbox se aplicarán después: se descuentan del objetivo
+    pendientes = db_session.execute(text(
+        "SELECT payload FROM outbox_tarea WHERE tipo = 'contadores' AND estado = 'pendiente'"
+    )).scalars()
+    for payload in pendientes:
+        for analista, estado, nivel, delta in payload.get("deltas", []):
+            clave = (uuid.UUID(analista), estado, nivel)
+            reales[clave] = reales.get(clave, 0) - delta
+
+    deltas = {
+        clave: reales.get(clave, 0) - actuales.get(clave, 0)
+        for clave in reales.keys() | actuales.keys()
+        if reales.get(clave, 0) != actuales.get(clave, 0)
+    }
+    aplicar_deltas(db_session, deltas)
+    incrementar_version_bandejas(db_session, (analista for analista, _, _ in deltas))
+    db_session.commit()
+    return deltas
+
+
+@util_tareas.periodica("reconciliar_contadores", RECONCILIAR_CADA_SEGUNDOS)
+def _reconciliar_periodico(db_session: Session) -> None:
+    corregidos = reconciliar_contadores(db_session)
+    if corregidos:
+        print(f"Contadores corregidos: {corregidos}")
+
+
+if __name__ == "__main__":
+    # La API lo corre a diario en el trabajador de tareas; a mano: python -m src.crud.crud_contadores
+    with Session(db.engine) as session:
+        corregidos = reconciliar_contadores(session)
+    if corregidos:
+        print(f"Contadores corregidos: {corregidos}")
+    else:
+        print("Contadores consistentes.")
@@ -1,55 +1,68 @@
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 from src.util import util_base_de_datos as db
+from src.util import util_catalogo
+from src.crud import crud_analista
 from fastapi import HTTPException
 
 
-def get_or_create_collaborator_role(db_session: Session, persona: db.Persona) -> db.Colaborador:
+def get_gmail_client_id(db_session: Session):
     """
-    Busca el rol de colaborador para una persona asociado al cliente 'Gmail'.
-    Si no existe, lo crea.
+    Id del cliente "Gmail" (desde el catálogo en memoria, sin query en el caso común).
     """
-    # Primero, asegurar que el cliente "Gmail" exista.
-    gmail_client = db_session.query(db.Cliente).filter(db.Cliente.nombre == "Gmail").first()
-    if not gmail_client:
+    gmail_client_id = util_catalogo.catalogo.id_cliente_por_nombre(db_session, "Gmail")
+    if not gmail_client_id:
         # Este es un error de configuración del servidor, por eso el status 500.
         raise HTTPException(status_code=500,
                             detail="Configuración de servidor incorrecta: El cliente 'Gmail' no existe.")
+    return gmail_client_id
 
-    # Buscar si ya existe el rol de colaborador para este cliente.
-    collaborator_role = db_session.query(db.Colaborador).filter_by(
-        id_persona=persona.id_persona,
-        id_cliente=gmail_client.id_cliente
-    ).first()
 
-    if collaborator_role:
-        return collaborator_role
+def _insert_role(db_session: Session, rol, valores: dict, *filtro):
+    """
+    INSERT ... ON CONFLICT DO NOTHING RETURNING id del rol; si otro login lo creó
+    al mismo tiempo (conflicto con el índice único), se relee.
+    """
+    id_rol = list(rol.__table__.primary_key.columns)[0]
+    creado = db_session.execute(
+        insert(rol).values(**valores).on_conflict_do_nothing().returning(id_rol)
+    ).scalar()
+    if creado is not None:
+        return creado
+    return db_session.execute(select(id_rol).where(*filtro).limit(1)).scalar()
 
-    # Si no existe, lo creamos.
-    print(f"Asignando rol de Colaborador (Cliente: Gmail) a la persona {persona.id_persona}")
-    new_collaborator_role = db.Colaborador(
-        id_persona=persona.id_persona,
-        id_cliente=gmail_client.id_cliente
+
+def get_or_create_collaborator_role(db_session: Session, id_persona, id_colaborador=None):
+    """
+    Devuelve el id del rol de colaborador de una persona asociado al cliente 'Gmail'.
+    Si no existe (id_colaborador None tras la lectura del login), lo crea.
+    Retorna (id_colaborador, id_cliente).
+    """
+    gmail_client_id = get_gmail_client_id(db_session)
+    if id_colaborador:
+        return id_colaborador, gmail_client_id
+
+    print(f"Asignando rol de Colaborador (Cliente: Gmail) a la persona {id_persona}")
+    C = db.Colaborador
+    id_colaborador = _insert_role(
+        db_session, C, {"id_persona": id_persona, "id_cliente": gmail_client_id},
+        C.id_persona == id_persona, C.id_cliente == gmail_client_id,
     )
-    db_session.add(new_collaborator_role)
-    # Hacemos flush para que el objeto tenga su ID antes del commit final
-    db_session.flush()
-    return new_collaborator_role
+    return id_colaborador, gmail_client_id
 
 
-def get_or_create_analyst_role(db_session: Session, persona: db.Persona) -> db.Analista:
+def get_or_create_analyst_role(db_session: Session, id_persona, id_analista=None):
     """
-    Busca el rol de analista para una persona.
-    Si no existe, lo crea con nivel 1.
+    Devuelve el id del rol de analista de una persona.
+    Si no existe (id_analista None tras la lectura del login), lo crea con nivel 1.
     """
-    analyst_role = db_session.query(db.Analista).filter_by(id_persona=persona.id_persona).first()
-
-    if analyst_role:
-        return analyst_role
+    if id_analista:
+        return id_analista
 
-    # Si no existe, lo creamos con nivel 1.
-    print(f"Asignando rol de Analista (Nivel 1) a la persona {persona.id_persona}")
-    new_analyst_role = db.Analista(id_persona=persona.id_persona, nivel=1)
-    db_session.add(new_analyst_role)
-    # Hacemos flush para que el objeto tenga su ID antes del commit final
-    db_session.flush()
-    return new_analyst_role
\ No newline at end of file
+    print(f"Asignando rol de Analista (Nivel 1) a la persona {id_persona}")
+    A = db.Analista
+    id_analista = _insert_role(db_session, A, {"id_persona": id_persona, "nivel": 1}, A.id_persona == id_persona)
+    # La persona pudo quedar cacheada como "no analista"
+    crud_analista.invalidate_analyst_principal(id_persona)
+    return id_analista
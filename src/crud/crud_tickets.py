@@ -1,9 +1,35 @@
+import re
 import uuid
 import datetime
+import difflib
+import unicodedata
+from typing import Optional
 
-from sqlalchemy.orm import Session
+from sqlalchemy import func, or_, literal, literal_column, insert
+from sqlalchemy.orm import Session, selectinload
 from src.util import util_base_de_datos as db
 from src.util import util_schemas as sch
+from src.util import util_sla
+from src.util import util_asignacion
+from src.util import util_eventos
+from src.util import util_cache
+from src.util import util_catalogo
+from src.crud import crud_contadores
+
+def _ticket_eager_options():
+    """
+    Opciones de carga anticipada para las relaciones que usan las herramientas
+    del agente (analista -> persona -> external y cliente_servicio -> servicio).
+    Evita un lazy-load por ticket al formatear listados.
+    """
+    return (
+        selectinload(db.Ticket.analista)
+        .selectinload(db.Analista.persona)
+        .selectinload(db.Persona.external_collection),
+        selectinload(db.Ticket.cliente_servicio)
+        .selectinload(db.ClienteServicio.servicio),
+    )
+
 
 def create_ticket_db(
     db_session: Session,
@@ -11,70 +37,81 @@ def create_ticket_db(
     asunto: str,
     tipo: str,
     nivel: str,
-    nombre_servicio: str
+    nombre_servicio: str,
+    conversation: Optional[list[dict]] = None,
     ) -> db.Ticket:
     """
     Crea un nuevo Ticket. Se asegura de tener la informacíón completa.
-    Asigna por defecto al analista 'Ana Lytics' si existe.
+    Lo asigna al analista de nivel de entrada con menor carga (ver util_asignacion).
+
+    Ticket y conversación se guardan en UNA transacción. Contadores y notificación
+    a la bandeja quedan en el outbox (util_tareas) y se procesan en segundo plano.
     """
 
-    cliente_servicio = (
-        db_session.query(db.ClienteServicio)
-        .join(db.Servicio)  # Hacemos un JOIN con la tabla Servicio para poder filtrar por nombre
-        .filter(
-            db.ClienteServicio.id_cliente == user_info.cliente_id,
-            db.Servicio.nombre.ilike(f"%{nombre_servicio}%")  # Búsqueda flexible por nombre
-        )
-        .first()
-    )
+    # Servicio contratado resuelto desde el catálogo en memoria (exacto, subcadena o difuso)
+    id_cliente_servicio = util_catalogo.catalogo.resolver_servicio(db_session, user_info.cliente_id, nombre_servicio)
 
-    if not cliente_servicio:
+    if not id_cliente_servicio:
         # Si la IA infiere un servicio que el cliente no tiene, lanzamos un error claro.
         raise ValueError(
             f"No se pudo encontrar el servicio '{nombre_servicio}' entre los servicios contratados por el cliente.")
 
-    # Asignación por defecto a 'Ana Lytics' (si existe)
-    analyst_id = None
-    try:
-        default_ext = db_session.query(db.External).filter(
-            db.External.nombre.ilike("Ana Lytics")
-        ).first()
-        if default_ext and getattr(default_ext, "persona", None):
-            ana = db_session.query(db.Analista).filter(
-                db.Analista.id_persona == default_ext.persona.id_persona
-            ).first()
-            if ana:
-                analyst_id = ana.id_analista
-    except Exception:
-        analyst_id = None
+    # Asignación al analista de entrada con menos tickets abiertos
+    analyst_id = util_asignacion.indice_analistas.asignar_ticket_nuevo(db_session)
 
+    # created_at explícito: due_at queda a exactamente un SLA de la creación, como al
+    # cambiar de nivel (apply_ticket_changes_db) y en el backfill de la migración 0003
+    ahora = datetime.datetime.utcnow()
     new_ticket = db.Ticket(
         asunto=asunto,
         tipo=tipo,
         id_colaborador=user_info.colaborador_id,
-        id_cliente_servicio=cliente_servicio.id_cliente_servicio,
+        id_cliente_servicio=id_cliente_servicio,
         nivel=nivel,
         estado="aceptado",
         id_analista=analyst_id,
+        created_at=ahora,
+        updated_at=ahora,
+        due_at=util_sla.calcular_vencimiento(nivel, ahora),
     )
-    db_session.add(new_ticket)
-    db_session.commit()
+    try:
+        db_session.add(new_ticket)
+        db_session.flush()  # necesitamos id_ticket para la conversación y el outbox
+        if conversation:
+            _insertar_mensajes(db_session, new_ticket.id_ticket, conversation)
+        crud_contadores.registrar_cambio_diferido(db_session, None, (analyst_id, "aceptado", nivel))
+        util_eventos.publicar_diferido(
+            db_session, "ticket_creado", new_ticket.id_ticket, [analyst_id],
+            subject=asunto, status="aceptado", level=nivel, due_at=new_ticket.due_at,
+        )
+        util_cache.invalidar_al_confirmar(db_session, analistas=[analyst_id])
+        db_session.commit()
+    except Exception:
+        # Liberamos la reserva hecha en el índice si el ticket no llegó a guardarse
+        db_session.rollback()
+        util_asignacion.indice_analistas.ajustar_carga(analyst_id, -1)
+        raise
     db_session.refresh(new_ticket)
     return new_ticket
 
 
-def save_conversation_db(db_session: Session, ticket_id: int, conversation: list[dict]):
+def _insertar_mensajes(db_session: Session, ticket_id: int, conversation: list[dict]) -> int:
     """
-    Guarda la conversación en la tabla `conversacion` asociada a un ticket.
+    Inserta los mensajes de un ticket nuevo en `conversacion_mensaje` desde la
+    secuencia 1 (un solo INSERT multi-fila, sin commit). Retorna la cantidad insertada.
     """
-    new_conversacion = db.Conversacion(
-        id_ticket=ticket_id,
-        contenido=conversation
-    )
-    db_session.add(new_conversacion)
-    db_session.commit()
-    db_session.refresh(new_conversacion)
-    return new_conversacion
+    filas = [
+        {
+            "id_ticket": ticket_id,
+            "secuencia": i,
+            "rol": msg.get("role") or "agent",
+            "contenido": str(msg.get("content") or ""),
+        }
+        for i, msg in enumerate(conversation, start=1)
+    ]
+    if filas:
+        db_session.execute(insert(db.ConversacionMensaje), filas)
+    return len(filas)
 
 
 def get_ticket_by_id_db(db_session: Session, ticket_id: int, user_info: sch.TokenData) -> db.Ticket | None:
@@ -87,7 +124,7 @@ def get_ticket_by_id_db(db_session: Session, ticket_id: int, user_info: sch.Toke
     except Exception:
         return None
 
-    ticket = db_session.query(db.Ticket).filter(
+    ticket = db_session.query(db.Ticket).options(*_ticket_eager_options()).filter(
         db.Ticket.id_ticket == ticket_id,
         db.Ticket.id_colaborador == colaborador_uuid
     ).first()
@@ -98,51 +135,164 @@ def get_ticket_by_id_db(db_session: Session, ticket_id: int, user_info: sch.Toke
     return ticket
 
 
-def get_all_open_tickets(db_session: Session, user_info: sch.TokenData) -> list[db.Ticket]:
+def get_all_open_tickets(
+    db_session: Session,
+    user_info: sch.TokenData,
+    limit: int | None = None,
+) -> tuple[list[db.Ticket], dict[tuple[str, str], int]]:
     """
-    Devuelve todos los tickets abiertos (no finalizados) del colaborador actual.
+    Devuelve los tickets abiertos (no finalizados) del colaborador actual, del más
+    reciente al más antiguo, junto con los conteos por (nivel, estado) sin aplicar el límite.
     """
     try:
         colaborador_uuid = uuid.UUID(user_info.colaborador_id)
     except Exception:
-        return []
+        return [], {}
 
-    return db_session.query(db.Ticket).filter(
+    base_q = db_session.query(db.Ticket).filter(
         db.Ticket.id_colaborador == colaborador_uuid,
         db.Ticket.estado != "finalizado"
-    ).all()
+    )
+    return _page_with_counts(base_q, limit)
 
-def get_all_tickets(db_session: Session, user_info: sch.TokenData) -> list[db.Ticket]:
+def get_all_tickets(
+    db_session: Session,
+    user_info: sch.TokenData,
+    limit: int | None = None,
+) -> tuple[list[db.Ticket], dict[tuple[str, str], int]]:
     """
-    Devuelve todos los tickets del colaborador actual.
+    Devuelve los tickets del colaborador actual, del más reciente al más antiguo,
+    junto con los conteos por (nivel, estado) sin aplicar el límite.
     """
     try:
         colaborador_uuid = uuid.UUID(user_info.colaborador_id)
     except Exception:
-        return []
+        return [], {}
 
-    return db_session.query(db.Ticket).filter(
+    base_q = db_session.query(db.Ticket).filter(
         db.Ticket.id_colaborador == colaborador_uuid
-    ).all()
+    )
+    return _page_with_counts(base_q, limit)
+
+
+def _page_with_counts(base_q, limit: int | None) -> tuple[list[db.Ticket], dict[tuple[str, str], int]]:
+    """
+    Aplica orden, límite y carga anticipada a una query de tickets.
+    Devuelve (filas, conteos por (nivel, estado)) con un único GROUP BY para los totales.
+    """
+    conteos_q = (
+        base_q.with_entities(db.Ticket.nivel, db.Ticket.estado, func.count())
+        .group_by(db.Ticket.nivel, db.Ticket.estado)
+    )
+    conteos = {(nivel, estado): n for nivel, estado, n in conteos_q}
+
+    page_q = (
+        base_q.options(*_ticket_eager_options())
+        .order_by(db.Ticket.created_at.desc(), db.Ticket.id_ticket.desc())
+    )
+    if limit is not None:
+        page_q = page_q.limit(limit)
+    return page_q.all(), conteos
+
+
+# Configuración de texto de Postgres (debe coincidir con el índice de la migración 0002)
+TS_CONFIG = literal_column("'spanish'::regconfig")
+
+
+def subject_search_clause(subject: str):
+    """
+    Devuelve (filtro, rank) para buscar tickets por asunto en Postgres:
+    full-text en español (tsvector) o similitud por trigramas (pg_trgm),
+    ambos servidos por índices GIN.
+    """
+    documento = func.to_tsvector(TS_CONFIG, db.Ticket.asunto)
+    consulta = func.plainto_tsquery(TS_CONFIG, subject)
+    filtro = or_(
+        documento.op("@@")(consulta),
+        literal(subject).op("<%")(db.Ticket.asunto),
+    )
+    rank = func.ts_rank_cd(documento, consulta) + func.word_similarity(subject, db.Ticket.asunto)
+    return filtro, rank
+
+
+def _normalizar_terminos(texto: str) -> list[str]:
+    """
+    Minúsculas, sin tildes y con un stemming simple (quita plurales), para la búsqueda en memoria.
+    """
+    sin_tildes = unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode()
+    terminos = []
+    for palabra in re.findall(r"\w+", sin_tildes.lower()):
+        if len(palabra) < 3:
+            continue
+        if palabra.endswith("es") and len(palabra) > 4:
+            palabra = palabra[:-2]
+        elif palabra.endswith("s") and len(palabra) > 3:
+            palabra = palabra[:-1]
+        terminos.append(palabra)
+    return terminos
+
+
+def _rank_subject_in_memory(tickets: list[db.Ticket], subject: str, limit: int) -> list[db.Ticket]:
+    """
+    Fallback sin Postgres (p. ej. SQLite en pruebas): ordena por términos en común
+    y similitud de texto.
+    """
+    consulta = _normalizar_terminos(subject)
+    if not consulta:
+        return []
+
+    puntuados = []
+    for t in tickets:
+        terminos = _normalizar_terminos(t.asunto)
+        comunes = sum(1 for q in consulta if any(w.startswith(q) or q.startswith(w) for w in terminos))
+        similitud = difflib.SequenceMatcher(None, " ".join(consulta), " ".join(terminos)).ratio()
+        if comunes or similitud >= 0.6:
+            puntuados.append((comunes / len(consulta) + similitud, t))
 
+    puntuados.sort(key=lambda x: x[0], reverse=True)
+    return [t for _, t in puntuados[:limit]]
 
-def get_tickets_by_subject(db_session: Session, subject: str, user_info: sch.TokenData) -> list[db.Ticket]:
+
+def get_tickets_by_subject(
+    db_session: Session,
+    subject: str,
+    user_info: sch.TokenData,
+    limit: int = 5,
+) -> list[db.Ticket]:
     """
-    Busca tickets por coincidencia parcial en el asunto, para el colaborador actual.
+    Busca los `limit` tickets del colaborador actual más relevantes para un texto
+    (no solo coincidencias exactas: "reportes PDF" encuentra "Error al generar reporte en PDF").
     """
     try:
         colaborador_uuid = uuid.UUID(user_info.colaborador_id)
     except Exception:
         return []
 
-    return db_session.query(db.Ticket).filter(
-        db.Ticket.id_colaborador == colaborador_uuid,
-        db.Ticket.asunto.ilike(f"%{subject}%")
-    ).all()
+    base_q = db_session.query(db.Ticket).options(*_ticket_eager_options()).filter(
+        db.Ticket.id_colaborador == colaborador_uuid
+    )
+
+    if db_session.get_bind().dialect.name != "postgresql":
+        return _rank_subject_in_memory(base_q.all(), subject, limit)
+
+    filtro, rank = subject_search_clause(subject)
+    return (
+        base_q.filter(filtro)
+        .order_by(rank.desc(), db.Ticket.id_ticket.desc())
+        .limit(limit)
+        .all()
+    )
 
 # ... (resto de tus funciones CRUD de tickets)
 
 def reassign_ticket_db(db_session: Session, ticket: db.Ticket, new_analyst_id: str) -> db.Ticket:
     """Actualiza el id_analista de un ticket existente."""
+    crud_contadores.registrar_cambio(
+        db_session,
+        (ticket.id_analista, ticket.estado, ticket.nivel),
+        (new_analyst_id, ticket.estado, ticket.nivel),
+    )
+    util_cache.invalidar_al_confirmar(db_session, [ticket.id_ticket], [ticket.id_analista, new_analyst_id])
     ticket.id_analista = new_analyst_id
+    ticket.updated_at = datetime.datetime.utcnow()  # mueve el ETag/orden de la bandeja
     return ticket
\ No newline at end of file
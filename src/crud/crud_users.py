@@ -1,54 +1,80 @@
+from sqlalchemy import select, update, literal, and_
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
-from sqlalchemy.orm.exc import NoResultFound
 
 # Importamos las clases de la BD desde nuestro archivo de conexión
 from src.util import util_base_de_datos as db
 
+PROVIDER = "google"
 
-def get_or_create_from_external(db_session: Session, id_info: dict) -> db.Persona:
+
+def _perfil(id_info: dict) -> dict:
+    return {
+        "correo": id_info.get("email"),
+        "nombre": id_info.get("name"),
+        "hd": id_info.get("hd"),
+    }
+
+
+def get_or_create_from_external(
+    db_session: Session,
+    id_info: dict,
+    rol=None,
+    rol_filtro: tuple = (),
+) -> tuple:
     """
     Busca una persona por su login de Google. Si no existe, la crea.
-    Su única responsabilidad es gestionar los registros de Persona y External.
-    No se encarga de asignar roles.
+    Gestiona Persona y External; no asigna roles, pero si se indica `rol`
+    (db.Colaborador o db.Analista) trae su id en la misma lectura.
+
+    Camino común (usuario conocido, perfil sin cambios): un solo SELECT y
+    ninguna escritura. Retorna (id_persona, id del rol o None).
+    No hace commit: la función que llama maneja la transacción.
     """
-    provider = "google"
+    E = db.External
     provider_id = id_info.get("sub")
-    email = id_info.get("email")
-    name = id_info.get("name")
-    hosted_domain = id_info.get("hd")
-
-    try:
-        # 1. Busca si la identidad externa (la cuenta de Google) ya existe
-        external_identity = db_session.query(db.External).filter(
-            db.External.provider == provider,
-            db.External.id_provider == provider_id
-        ).one()
-
-        # Si existe, actualizamos sus datos por si cambiaron y devolvemos la persona
-        print(f"Usuario encontrado en la BD: {email}")
-        external_identity.correo = email
-        external_identity.nombre = name
-        external_identity.hd = hosted_domain
-        # NO hacemos commit aquí. La función que llama es la responsable de la transacción.
-        return external_identity.persona
-
-    except NoResultFound:
-        # 2. Si no existe, creamos la Persona y el External
-        print(f"Usuario nuevo. Creando perfil para: {email}")
-
-        new_persona = db.Persona()
-        db_session.add(new_persona)
-        db_session.flush()
-
-        new_external = db.External(
-            id_persona=new_persona.id_persona,
-            provider=provider,
-            id_provider=provider_id,
-            correo=email,
-            nombre=name,
-            hd=hosted_domain
+    perfil = _perfil(id_info)
+
+    columnas = [E.id_persona, E.correo, E.nombre, E.hd]
+    q = select(*columnas).where(E.provider == PROVIDER, E.id_provider == provider_id)
+    if rol is not None:
+        id_rol = list(rol.__table__.primary_key.columns)[0]
+        q = q.add_columns(id_rol.label("id_rol")).outerjoin(
+            rol, and_(rol.id_persona == E.id_persona, *rol_filtro)
+        )
+    fila = db_session.execute(q.limit(1)).first()
+
+    if fila:
+        # Solo escribimos si el perfil de Google cambió
+        if (fila.correo, fila.nombre, fila.hd) != (perfil["correo"], perfil["nombre"], perfil["hd"]):
+            db_session.execute(
+                update(E).where(E.provider == PROVIDER, E.id_provider == provider_id).values(**perfil)
+            )
+        return fila.id_persona, (fila.id_rol if rol is not None else None)
+
+    # Usuario nuevo: persona + external en un solo statement (CTE). Si otro login
+    # concurrente la creó primero, el ON CONFLICT no inserta y se relee.
+    print(f"Usuario nuevo. Creando perfil para: {perfil['correo']}")
+    P = db.Persona
+    nueva_persona = db.Persona.__table__.insert().returning(P.id_persona).cte("nueva_persona")
+    stmt = (
+        insert(E)
+        .from_select(
+            ["id_persona", "provider", "id_provider", "correo", "nombre", "hd"],
+            select(
+                nueva_persona.c.id_persona, literal(PROVIDER), literal(provider_id),
+                literal(perfil["correo"]), literal(perfil["nombre"]), literal(perfil["hd"]),
+            ),
         )
-        db_session.add(new_external)
+        .on_conflict_do_nothing()
+        .returning(E.id_persona)
+    )
+    with db_session.begin_nested() as savepoint:
+        id_persona = db_session.execute(stmt).scalar()
+        if id_persona is None:
+            savepoint.rollback()  # descarta la persona huérfana
+    if id_persona is None:
+        fila = db_session.execute(q.limit(1)).first()
+        return fila.id_persona, (fila.id_rol if rol is not None else None)
+    return id_persona, None
 
-        # El commit será manejado por la función que llama a esta.
-        return new_persona
\ No newline at end of file
@@ -0,0 +1,42 @@
+-- migracion: sin-transaccion
+-- 0001: índices para las consultas más frecuentes (bandeja del analista,
+-- herramientas del agente, detalle de ticket y login).
+
+-- Bandeja del analista: filtro por estado + orden keyset (updated_at, id_ticket)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_ticket_analista_estado_updated
+    ON ticket (id_analista, estado, updated_at DESC, id_ticket DESC);
+
+-- Bandeja del analista sin filtro de estado
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_ticket_analista_updated
+    ON ticket (id_analista, updated_at DESC, id_ticket DESC);
+
+-- Herramientas del agente: tickets (abiertos) del colaborador, más recientes primero
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_ticket_colaborador_estado
+    ON ticket (id_colaborador, estado);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_ticket_colaborador_created
+    ON ticket (id_colaborador, created_at DESC, id_ticket DESC);
+
+-- Último escalado por ticket (LATERAL / DISTINCT ON)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_escalado_ticket
+    ON escalado (id_ticket, id_escalado DESC);
+
+-- Conversación por ticket
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_conversacion_ticket
+    ON conversacion (id_ticket);
+
+-- Login y resolución de identidades
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_external_provider
+    ON external (provider, id_provider);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_external_persona
+    ON external (id_persona);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_analista_persona
+    ON analista (id_persona);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_colaborador_persona_cliente
+    ON colaborador (id_persona, id_cliente);
+
+ANALYZE ticket;
+ANALYZE escalado;
+ANALYZE conversacion;
+ANALYZE external;
+ANALYZE analista;
+ANALYZE colaborador;
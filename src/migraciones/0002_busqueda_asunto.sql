@@ -0,0 +1,12 @@
+-- migracion: sin-transaccion
+-- 0002: búsqueda por asunto (full-text en español + similitud por trigramas).
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Debe coincidir con crud_tickets.subject_search_clause: to_tsvector('spanish', asunto)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_ticket_asunto_fts
+    ON ticket USING gin (to_tsvector('spanish'::regconfig, asunto));
+
+-- Soporta el operador de similitud por palabra (<%) y también ILIKE '%texto%'
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_ticket_asunto_trgm
+    ON ticket USING gin (asunto gin_trgm_ops);
@@ -0,0 +1,19 @@
+-- migracion: sin-transaccion
+-- 0003: vencimiento (SLA) por ticket según su nivel.
+-- Debe coincidir con util_sla.SLA_POR_NIVEL.
+
+ALTER TABLE ticket ADD COLUMN IF NOT EXISTS due_at timestamp;
+
+UPDATE ticket
+SET due_at = created_at + CASE nivel
+        WHEN 'crítico' THEN interval '4 hours'
+        WHEN 'alto' THEN interval '1 day'
+        WHEN 'medio' THEN interval '2 days'
+        WHEN 'bajo' THEN interval '4 days'
+    END
+WHERE due_at IS NULL;
+
+-- Cola por prioridad del analista (solo tickets abiertos)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_ticket_analista_due_abiertos
+    ON ticket (id_analista, due_at, id_ticket)
+    WHERE estado IN ('aceptado', 'en atención');
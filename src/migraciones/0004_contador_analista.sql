@@ -0,0 +1,18 @@
+-- 0004: contadores de tickets por analista x estado x nivel.
+-- Se mantienen en la misma transacción que cada mutación de ticket
+-- (ver crud_contadores) y se reconcilian con crud_contadores.reconciliar_contadores.
+
+CREATE TABLE IF NOT EXISTS contador_analista (
+    id_analista uuid NOT NULL REFERENCES analista (id_analista) ON DELETE CASCADE,
+    estado text NOT NULL,
+    nivel text NOT NULL,
+    total integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_analista, estado, nivel)
+);
+
+INSERT INTO contador_analista (id_analista, estado, nivel, total)
+SELECT id_analista, estado::text, nivel::text, count(*)
+FROM ticket
+WHERE id_analista IS NOT NULL AND estado IS NOT NULL AND nivel IS NOT NULL
+GROUP BY id_analista, estado, nivel
+ON CONFLICT DO NOTHING;
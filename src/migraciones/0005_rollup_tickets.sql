@@ -0,0 +1,28 @@
+-- migracion: sin-transaccion
+-- 0005: agregados diarios para analítica (SLA, tiempos de cierre, escalamientos y volumen).
+-- Los mantiene crud_analitica.actualizar_rollups de forma incremental.
+
+CREATE TABLE IF NOT EXISTS rollup_ticket_diario (
+    fecha date NOT NULL,
+    id_cliente uuid NOT NULL,
+    id_servicio uuid NOT NULL,
+    nivel text NOT NULL,
+    creados integer NOT NULL DEFAULT 0,          -- tickets creados ese día
+    escalados integer NOT NULL DEFAULT 0,        -- de los creados ese día, cuántos fueron derivados
+    cerrados integer NOT NULL DEFAULT 0,         -- tickets cerrados ese día
+    cerrados_en_sla integer NOT NULL DEFAULT 0,  -- de los cerrados, cuántos antes de due_at
+    segundos_cierre bigint NOT NULL DEFAULT 0,   -- suma de (closed_at - created_at) de los cerrados
+    PRIMARY KEY (fecha, id_cliente, id_servicio, nivel)
+);
+
+-- Marca de agua del último procesamiento incremental
+CREATE TABLE IF NOT EXISTS rollup_marca (
+    nombre text PRIMARY KEY,
+    ultimo_updated_at timestamp,
+    ultimo_id_escalado bigint,
+    procesado_en timestamp NOT NULL DEFAULT now()
+);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_ticket_updated_at ON ticket (updated_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_ticket_created_at ON ticket (created_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_ticket_closed_at ON ticket (closed_at) WHERE closed_at IS NOT NULL;
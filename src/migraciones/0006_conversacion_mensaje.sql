@@ -0,0 +1,28 @@
+-- 0006: conversación como una fila por mensaje (antes: un JSON con todo el hilo
+-- en conversacion.contenido). Permite leer solo los últimos N mensajes y paginar
+-- hacia atrás por (id_ticket, secuencia). Postgres comprime (TOAST) los
+-- contenidos largos automáticamente.
+
+CREATE TABLE IF NOT EXISTS conversacion_mensaje (
+    id_ticket integer NOT NULL REFERENCES ticket (id_ticket) ON DELETE CASCADE,
+    secuencia integer NOT NULL,
+    rol text NOT NULL,
+    contenido text NOT NULL,
+    created_at timestamp NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+    PRIMARY KEY (id_ticket, secuencia)
+);
+
+-- Backfill desde los JSON existentes (en el orden del arreglo)
+INSERT INTO conversacion_mensaje (id_ticket, secuencia, rol, contenido)
+SELECT c.id_ticket,
+       row_number() OVER (PARTITION BY c.id_ticket ORDER BY c.ctid, m.ord),
+       coalesce(m.msg ->> 'role', 'agent'),
+       coalesce(m.msg ->> 'content', '')
+FROM conversacion c
+CROSS JOIN LATERAL jsonb_array_elements(
+    CASE WHEN jsonb_typeof(c.contenido::jsonb) = 'array' THEN c.contenido::jsonb ELSE '[]'::jsonb END
+) WITH ORDINALITY AS m (msg, ord)
+WHERE c.id_ticket IS NOT NULL
+ON CONFLICT DO NOTHING;
+
+ANALYZE conversacion_mensaje;
@@ -0,0 +1,20 @@
+-- 0007: outbox de tareas diferidas (ver util_tareas).
+-- Las tareas se insertan en la misma transacción que la mutación que las origina
+-- y un trabajador en segundo plano las toma con FOR UPDATE SKIP LOCKED.
+
+CREATE TABLE IF NOT EXISTS outbox_tarea (
+    id_tarea bigserial PRIMARY KEY,
+    tipo text NOT NULL,
+    payload jsonb NOT NULL DEFAULT '{}'::jsonb,
+    estado text NOT NULL DEFAULT 'pendiente',   -- pendiente | hecho | fallido
+    intentos integer NOT NULL DEFAULT 0,
+    disponible_en timestamptz NOT NULL DEFAULT now(),
+    ultimo_error text,
+    creado_en timestamptz NOT NULL DEFAULT now(),
+    procesado_en timestamptz
+);
+
+-- Cola: solo las pendientes, en orden de disponibilidad
+CREATE INDEX IF NOT EXISTS ix_outbox_tarea_pendiente
+    ON outbox_tarea (disponible_en, id_tarea)
+    WHERE estado = 'pendiente';
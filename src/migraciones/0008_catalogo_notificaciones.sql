@@ -0,0 +1,24 @@
+-- 0008: avisos de cambios en el catálogo (cliente, servicio, cliente_servicio).
+-- util_catalogo escucha el canal 'catalogo_cambios' y recarga su copia en memoria.
+
+CREATE OR REPLACE FUNCTION notificar_cambio_catalogo() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('catalogo_cambios', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tr_catalogo_cliente ON cliente;
+CREATE TRIGGER tr_catalogo_cliente
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON cliente
+    FOR EACH STATEMENT EXECUTE FUNCTION notificar_cambio_catalogo();
+
+DROP TRIGGER IF EXISTS tr_catalogo_servicio ON servicio;
+CREATE TRIGGER tr_catalogo_servicio
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON servicio
+    FOR EACH STATEMENT EXECUTE FUNCTION notificar_cambio_catalogo();
+
+DROP TRIGGER IF EXISTS tr_catalogo_cliente_servicio ON cliente_servicio;
+CREATE TRIGGER tr_catalogo_cliente_servicio
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON cliente_servicio
+    FOR EACH STATEMENT EXECUTE FUNCTION notificar_cambio_catalogo();
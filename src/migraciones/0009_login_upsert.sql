@@ -0,0 +1,24 @@
+-- 0009: índices únicos para el login con INSERT ... ON CONFLICT (crud_users / crud_roles).
+-- Solo se crean si no hay duplicados previos; si los hay se avisa y el login sigue
+-- funcionando (el ON CONFLICT DO NOTHING simplemente no tendrá contra qué chocar).
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM external GROUP BY provider, id_provider HAVING count(*) > 1) THEN
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_external_provider ON external (provider, id_provider);
+    ELSE
+        RAISE WARNING 'external tiene identidades duplicadas: no se creó ux_external_provider';
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM colaborador GROUP BY id_persona, id_cliente HAVING count(*) > 1) THEN
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_colaborador_persona_cliente ON colaborador (id_persona, id_cliente);
+    ELSE
+        RAISE WARNING 'colaborador tiene roles duplicados: no se creó ux_colaborador_persona_cliente';
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM analista GROUP BY id_persona HAVING count(*) > 1) THEN
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_analista_persona ON analista (id_persona);
+    ELSE
+        RAISE WARNING 'analista tiene roles duplicados: no se creó ux_analista_persona';
+    END IF;
+END $$;
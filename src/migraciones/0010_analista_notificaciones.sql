@@ -0,0 +1,21 @@
+-- 0010: aviso de cambios en analista (alta, baja o cambio de nivel).
+-- crud_analista cachea (id_analista, nivel) por persona y se invalida con este canal.
+
+CREATE OR REPLACE FUNCTION notificar_cambio_analista() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('analista_cambios', OLD.id_persona::text);
+    ELSE
+        PERFORM pg_notify('analista_cambios', NEW.id_persona::text);
+        IF TG_OP = 'UPDATE' AND OLD.id_persona IS DISTINCT FROM NEW.id_persona THEN
+            PERFORM pg_notify('analista_cambios', OLD.id_persona::text);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tr_analista_cambios ON analista;
+CREATE TRIGGER tr_analista_cambios
+    AFTER INSERT OR UPDATE OR DELETE ON analista
+    FOR EACH ROW EXECUTE FUNCTION notificar_cambio_analista();
@@ -0,0 +1,33 @@
+-- 0011: versión de la bandeja de cada analista para el ETag de /analista/conversaciones.
+-- Un trigger sobre ticket la incrementa en la misma transacción que cualquier alta,
+-- cambio o baja de un ticket de ese analista (y de ambos analistas al derivar),
+-- así el ETag se arma con una lectura por PK en lugar de count(*) + max(updated_at).
+
+CREATE TABLE IF NOT EXISTS bandeja_version (
+    id_analista uuid PRIMARY KEY REFERENCES analista (id_analista) ON DELETE CASCADE,
+    version bigint NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION incrementar_bandeja_version() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP <> 'DELETE' AND NEW.id_analista IS NOT NULL THEN
+        INSERT INTO bandeja_version (id_analista, version) VALUES (NEW.id_analista, 1)
+        ON CONFLICT (id_analista) DO UPDATE SET version = bandeja_version.version + 1;
+    END IF;
+    IF TG_OP <> 'INSERT' AND OLD.id_analista IS NOT NULL
+       AND OLD.id_analista IS DISTINCT FROM (CASE WHEN TG_OP = 'UPDATE' THEN NEW.id_analista END) THEN
+        INSERT INTO bandeja_version (id_analista, version) VALUES (OLD.id_analista, 1)
+        ON CONFLICT (id_analista) DO UPDATE SET version = bandeja_version.version + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tr_ticket_bandeja_version ON ticket;
+CREATE TRIGGER tr_ticket_bandeja_version
+    AFTER INSERT OR UPDATE OR DELETE ON ticket
+    FOR EACH ROW EXECUTE FUNCTION incrementar_bandeja_version();
+
+INSERT INTO bandeja_version (id_analista, version)
+SELECT id_analista, 0 FROM analista
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,13 @@
+-- migracion: sin-transaccion
+-- 0012: retención del outbox y turnos de los jobs periódicos (ver util_tareas).
+
+-- La purga recorre las tareas 'hecho' por antigüedad
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_outbox_tarea_hecho
+    ON outbox_tarea (procesado_en)
+    WHERE estado = 'hecho';
+
+-- Próxima ejecución de cada job periódico; el trabajador que reclama el turno lo corre
+CREATE TABLE IF NOT EXISTS tarea_periodica (
+    nombre text PRIMARY KEY,
+    proxima_en timestamptz NOT NULL
+);
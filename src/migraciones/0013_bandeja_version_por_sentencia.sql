@@ -0,0 +1,57 @@
+-- 0013: bandeja_version se incrementa una vez por sentencia en lugar de por fila.
+-- Con el trigger por fila de 0011 un UPDATE masivo (cambios en bloque, derivaciones)
+-- volvía a escribir la fila del analista una vez por ticket. Ahora cada sentencia
+-- suma 1 por analista afectado, en orden de id para que dos sentencias concurrentes
+-- no se bloqueen en orden cruzado.
+--
+-- Costo asumido: la fila de bandeja_version de un analista sigue siendo un punto
+-- caliente de escritura. Dos transacciones que tocan tickets del mismo analista se
+-- serializan en ella hasta el commit. Es aceptable para la tasa de cambios por
+-- analista de la bandeja y a cambio el ETag se resuelve con una lectura por PK.
+
+CREATE OR REPLACE FUNCTION incrementar_bandeja_version_sentencia() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO bandeja_version (id_analista, version)
+        SELECT DISTINCT id_analista, 1 FROM nuevos WHERE id_analista IS NOT NULL ORDER BY id_analista
+        ON CONFLICT (id_analista) DO UPDATE SET version = bandeja_version.version + 1;
+    ELSIF TG_OP = 'UPDATE' THEN
+        -- Ambos analistas al derivar: el que lo tenía y el que lo recibe
+        INSERT INTO bandeja_version (id_analista, version)
+        SELECT id_analista, 1 FROM (
+            SELECT id_analista FROM nuevos UNION SELECT id_analista FROM viejos
+        ) afectados
+        WHERE id_analista IS NOT NULL
+        ORDER BY id_analista
+        ON CONFLICT (id_analista) DO UPDATE SET version = bandeja_version.version + 1;
+    ELSE
+        INSERT INTO bandeja_version (id_analista, version)
+        SELECT DISTINCT id_analista, 1 FROM viejos WHERE id_analista IS NOT NULL ORDER BY id_analista
+        ON CONFLICT (id_analista) DO UPDATE SET version = bandeja_version.version + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tr_ticket_bandeja_version ON ticket;
+DROP TRIGGER IF EXISTS tr_ticket_bandeja_version_insert ON ticket;
+DROP TRIGGER IF EXISTS tr_ticket_bandeja_version_update ON ticket;
+DROP TRIGGER IF EXISTS tr_ticket_bandeja_version_delete ON ticket;
+
+-- Una tabla de transición por evento: Postgres no admite REFERENCING con varios eventos
+CREATE TRIGGER tr_ticket_bandeja_version_insert
+    AFTER INSERT ON ticket
+    REFERENCING NEW TABLE AS nuevos
+    FOR EACH STATEMENT EXECUTE FUNCTION incrementar_bandeja_version_sentencia();
+
+CREATE TRIGGER tr_ticket_bandeja_version_update
+    AFTER UPDATE ON ticket
+    REFERENCING OLD TABLE AS viejos NEW TABLE AS nuevos
+    FOR EACH STATEMENT EXECUTE FUNCTION incrementar_bandeja_version_sentencia();
+
+CREATE TRIGGER tr_ticket_bandeja_version_delete
+    AFTER DELETE ON ticket
+    REFERENCING OLD TABLE AS viejos
+    FOR EACH STATEMENT EXECUTE FUNCTION incrementar_bandeja_version_sentencia();
+
+DROP FUNCTION IF EXISTS incrementar_bandeja_version();
@@ -4,49 +4,62 @@ from src.util import util_schemas as sch
 from src.crud import crud_tickets
 from src.util import util_base_de_datos as db
 
+# Máximo de tickets que se devuelven al LLM en un listado (los más recientes).
+MAX_TICKETS_LISTADO = 10
+# Máximo de tickets devueltos por la búsqueda por asunto (los más relevantes).
+MAX_TICKETS_BUSQUEDA = 5
+# Largo máximo del asunto en las filas compactas del listado.
+MAX_ASUNTO_LISTADO = 60
+
+ORDEN_NIVELES = ["crítico", "alto", "medio", "bajo"]
+
 
 class ToolBusqueda:
-    def __init__(self, db: Session, user_info: sch.TokenData):
+    def __init__(self, db: Session, user_info: sch.TokenData, limite_listado: int = MAX_TICKETS_LISTADO):
         self.db = db
         self.user_info = user_info
+        self.limite_listado = limite_listado
 
-    def _format_ticket_details(self, ticket: db.Ticket) -> str:
-        """
-        Función auxiliar para formatear los detalles de un ticket en un texto legible.
-        """
-
-        nombre_analista = "Aún no asignado"
+    @staticmethod
+    def _nombre_analista(ticket: db.Ticket) -> str:
         try:
             # Intentamos acceder directamente a través de la relación correcta
-            nombre_analista = ticket.analista.persona.external_collection[0].nombre
+            return ticket.analista.persona.external_collection[0].nombre
         except (AttributeError, IndexError):
             # Capturamos dos posibles errores:
             # 1. AttributeError: Si ticket.analista o .persona es None.
             # 2. IndexError: Si .external_collection existe pero está vacía.
-            # Si ocurre alguno, simplemente continuamos, manteniendo "Aún no asignado".
-            pass
+            return "Aún no asignado"
 
+    @staticmethod
+    def _nombre_servicio(ticket: db.Ticket) -> str:
         try:
-            nombre_servicio = ticket.cliente_servicio.servicio.nombre
+            return ticket.cliente_servicio.servicio.nombre
         except Exception:
-            nombre_servicio = "No disponible"
-        
-        fecha_creacion = "-"
+            return "No disponible"
+
+    @staticmethod
+    def _fecha_creacion(ticket: db.Ticket) -> str:
         if hasattr(ticket, "created_at") and ticket.created_at:
             try:
-                fecha_creacion = ticket.created_at.strftime("%d/%m/%Y")
+                return ticket.created_at.strftime("%d/%m/%Y")
             except Exception:
-                fecha_creacion = "-"
+                pass
+        return "-"
 
+    def _format_ticket_details(self, ticket: db.Ticket) -> str:
+        """
+        Función auxiliar para formatear los detalles de un ticket en un texto legible.
+        """
         details = (
             f"  - **ID:** #{ticket.id_ticket}\n"
             f"  - **Asunto:** {ticket.asunto}\n"
-            f"  - **Servicio:** {nombre_servicio}\n"
+            f"  - **Servicio:** {self._nombre_servicio(ticket)}\n"
             f"  - **Nivel:** {ticket.nivel}\n"
             f"  - **Tipo:** {ticket.tipo}\n"
             f"  - **Estado:** {ticket.estado}"
-            f"  - **Analista:** {nombre_analista}"
-            f"  - **Fecha de Creación:** {fecha_creacion}"
+            f"  - **Analista:** {self._nombre_analista(ticket)}"
+            f"  - **Fecha de Creación:** {self._fecha_creacion(ticket)}"
         )
 
         if ticket.estado == 'finalizado' and ticket.diagnostico:
@@ -54,6 +67,48 @@ class ToolBusqueda:
 
         return details
 
+    def _format_ticket_row(self, ticket: db.Ticket) -> str:
+        """
+        Fila compacta (separada por '|') para listados; el detalle completo se
+        obtiene con buscar_ticket_por_id.
+        """
+        asunto = (ticket.asunto or "").replace("|", "/")
+        if len(asunto) > MAX_ASUNTO_LISTADO:
+            asunto = asunto[:MAX_ASUNTO_LISTADO - 1] + "…"
+        return "|".join([
+            f"#{ticket.id_ticket}",
+            asunto,
+            self._nombre_servicio(ticket),
+            str(ticket.nivel),
+            str(ticket.estado),
+            self._nombre_analista(ticket),
+            self._fecha_creacion(ticket),
+        ])
+
+    def _format_listado(self, tickets: list[db.Ticket], conteos: dict[tuple[str, str], int]) -> str:
+        """
+        Listado compacto: una línea de cabecera con conteos por nivel y estado,
+        y una fila por ticket (hasta limite_listado).
+        """
+        total = sum(conteos.values())
+        por_nivel: dict[str, int] = {}
+        por_estado: dict[str, int] = {}
+        for (nivel, estado), n in conteos.items():
+            por_nivel[nivel] = por_nivel.get(nivel, 0) + n
+            por_estado[estado] = por_estado.get(estado, 0) + n
+
+        niveles = sorted(por_nivel, key=lambda n: ORDEN_NIVELES.index(n) if n in ORDEN_NIVELES else len(ORDEN_NIVELES))
+        niveles_txt = ", ".join(f"{n} {por_nivel[n]}" for n in niveles)
+        estados_txt = ", ".join(f"{e} {c}" for e, c in sorted(por_estado.items(), key=lambda x: -x[1]))
+
+        lineas = [
+            f"Total: {total} | Nivel: {niveles_txt} | Estado: {estados_txt}",
+            f"Mostrando {len(tickets)} más recientes (detalle completo con buscar_ticket_por_id):",
+            "ID|Asunto|Servicio|Nivel|Estado|Analista|Creado",
+            *(self._format_ticket_row(t) for t in tickets),
+        ]
+        return "\n".join(lineas)
+
     def get_tools(self) -> list:
         """
         Fábrica que construye y devuelve una LISTA de todas las herramientas de búsqueda.
@@ -71,31 +126,33 @@ class ToolBusqueda:
         @tool
         def listar_tickets_abiertos() -> str:
             """Lista todos los tickets abiertos (no finalizados) del colaborador actual. Úsalo si el usuario pregunta por 'mis tickets abiertos'."""
-            tickets = crud_tickets.get_all_open_tickets(self.db, self.user_info)
+            tickets, conteos = crud_tickets.get_all_open_tickets(
+                self.db, self.user_info, limit=self.limite_listado
+            )
             if not tickets:
                 return "Usted no tiene tickets abiertos actualmente."
 
-            tickets_formateados = [self._format_ticket_details(t) for t in tickets]
-            respuesta_final = "\n\n".join(tickets_formateados)
-            return f"He encontrado los siguientes tickets abiertos:\n{respuesta_final}"
+            return self._format_listado(tickets, conteos)
 
         @tool
         def listar_tickets() -> str:
             """Lista todos los tickets del colaborador actual. Úsalo si el usuario pregunta por 'todos mis tickets'."""
-            tickets = crud_tickets.get_all_tickets(self.db, self.user_info)
+            tickets, conteos = crud_tickets.get_all_tickets(
+                self.db, self.user_info, limit=self.limite_listado
+            )
             if not tickets:
                 return "Usted no tiene tickets actualmente."
 
-            tickets_formateados = [self._format_ticket_details(t) for t in tickets]
-            respuesta_final = "\n\n".join(tickets_formateados)
-            return f"He encontrado los siguientes tickets:\n{respuesta_final}"
+            return self._format_listado(tickets, conteos)
 
         @tool
         def buscar_tickets_por_asunto(asunto: str) -> str:
-            """Busca tickets cuyo asunto coincida parcialmente con un texto."""
-            tickets = crud_tickets.get_tickets_by_subject(self.db, asunto, self.user_info)
+            """Busca los tickets cuyo asunto se parezca a un texto, ordenados por relevancia."""
+            tickets = crud_tickets.get_tickets_by_subject(
+                self.db, asunto, self.user_info, limit=MAX_TICKETS_BUSQUEDA
+            )
             if not tickets:
-                return f"No encontré tickets cuyo asunto contenga '{asunto}'."
+                return f"No encontré tickets con un asunto parecido a '{asunto}'."
 
             tickets_formateados = [self._format_ticket_details(t) for t in tickets]
             respuesta_final = "\n\n".join(tickets_formateados)
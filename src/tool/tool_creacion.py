@@ -40,20 +40,19 @@ class ToolCreacion:
             de la conversación completa.
             """
             try:
+                # La conversación viaja con el ticket: ambos se guardan en una sola transacción
+                state = memory.get({"configurable": {"thread_id": self.thread_id}})
+                messages = state["channel_values"]["messages"] if state else []
+                conversation = util_formatear_conversacion.format_conversation(messages)
+
                 ticket = crud_tickets.create_ticket_db(
                     db_session=self.db,
                     user_info=self.user_info,
                     asunto=asunto,
                     tipo=tipo.value,
                     nivel=nivel.value,
-                    nombre_servicio=nombre_servicio
-                )
-
-                state = memory.get({"configurable": {"thread_id": self.thread_id}})
-                messages = state["channel_values"]["messages"] if state else []
-                conversation = util_formatear_conversacion.format_conversation(messages)
-                crud_tickets.save_conversation_db(
-                    db_session=self.db, ticket_id=ticket.id_ticket, conversation=conversation,
+                    nombre_servicio=nombre_servicio,
+                    conversation=conversation,
                 )
 
                 # Fecha/hora exacta de creación del ticket
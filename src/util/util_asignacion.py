@@ -0,0 +1,305 @@
+# src/util/util_asignacion.py
+import heapq
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from src.util import util_base_de_datos as db
+from src.util import util_sla
+
+# Nivel de analista que recibe los tickets nuevos (los niveles superiores reciben derivaciones)
+NIVEL_ENTRADA = 1
+
+
+class IndiceAnalistas:
+    """
+    Índice en memoria de analistas por nivel con su carga de tickets abiertos.
+
+    Mantiene un heap (carga, id) por nivel: elegir al menos cargado y actualizar
+    su carga cuesta O(log n). Las entradas desactualizadas se descartan al salir
+    del heap (borrado perezoso). Se refresca desde la tabla ticket cada `ttl`
+    segundos, lo que también corrige la deriva entre procesos.
+
+    La carga se cuenta sobre ticket (índice parcial de abiertos de la migración
+    0003) y no sobre contador_analista: las altas ajustan los contadores por el
+    outbox, así que estos van por detrás de las asignaciones ya confirmadas.
+    """
+
+    def __init__(self, ttl_segundos: float = 60.0):
+        self.ttl_segundos = ttl_segundos
+        self._lock = threading.Lock()
+        self._lock_refresco = threading.Lock()   # un solo refresco a la vez
+        self._heaps: dict[int, list] = {}
+        self._carga: dict = {}
+        self._nivel: dict = {}
+        self._cargado_en = 0.0
+        # Ajustes hechos mientras corre la query de un refresco (se re-aplican al final)
+        self._ajustes_en_refresco: Optional[dict] = None
+
+    def refrescar(self, db_session: Session) -> None:
+        """
+        Recarga analistas y cargas (tickets abiertos) en una sola query.
+        Las reservas hechas mientras corre la query se conservan.
+        """
+        with self._lock_refresco:
+            self._recargar(db_session)
+
+    def _recargar(self, db_session: Session) -> None:
+        """Debe llamarse con _lock_refresco tomado."""
+        with self._lock:
+            self._ajustes_en_refresco = {}
+        try:
+            A = db.Analista
+            T = db.Ticket
+            filas = (
+                db_session.query(A.id_analista, A.nivel, func.count(T.id_ticket))
+                .outerjoin(T, (T.id_analista == A.id_analista) & T.estado.in_(util_sla.ESTADOS_ABIERTOS))
+                .group_by(A.id_analista, A.nivel)
+                .all()
+            )
+        except Exception:
+            with self._lock:
+                self._ajustes_en_refresco = None
+            raise
+
+        with self._lock:
+            ajustes = self._ajustes_en_refresco
+            self._ajustes_en_refresco = None
+            heaps: dict[int, list] = {}
+            for id_analista, nivel, carga in filas:
+                carga = max(int(carga) + ajustes.get(id_analista, 0), 0)
+                heaps.setdefault(nivel, []).append((carga, str(id_analista), id_analista))
+            for heap in heaps.values():
+                heapq.heapify(heap)
+
+            self._heaps = heaps
+            self._carga = {entry[2]: entry[0] for heap in heaps.values() for entry in heap}
+            self._nivel = {id_analista: nivel for id_analista, nivel, _ in filas}
+            self._cargado_en = time.monotonic()
+
+    def _asegurar_fresco(self, db_session: Session) -> None:
+        """
+        Refresca si venció el TTL. Solo un hilo refresca; los demás siguen con los
+        datos actuales, salvo que el índice nunca se haya cargado (entonces esperan).
+        """
+        with self._lock:
+            cargado_en = self._cargado_en
+        if time.monotonic() - cargado_en <= self.ttl_segundos:
+            return
+        if not self._lock_refresco.acquire(blocking=not cargado_en):
+            return
+        try:
+            # Otro hilo pudo haber refrescado mientras se esperaba el lock
+            if time.monotonic() - self._cargado_en > self.ttl_segundos:
+                self._recargar(db_session)
+        finally:
+            self._lock_refresco.release()
+
+    def _tope(self, nivel: int):
+        """
+        Devuelve la entrada vigente de menor carga del nivel (sin sacarla), limpiando las obsoletas.
+        Debe llamarse con el lock tomado.
+        """
+        heap = self._heaps.get(nivel)
+        while heap:
+            carga, _, id_analista = heap[0]
+            if self._carga.get(id_analista) == carga and self._nivel.get(id_analista) == nivel:
+                return heap[0]
+            heapq.heappop(heap)
+        return None
+
+    def _ajustar(self, id_analista, delta: int) -> None:
+        """
+        Cambia la carga de un analista y re-inserta su entrada. Debe llamarse con el lock tomado.
+        """
+        if self._ajustes_en_refresco is not None:
+            self._ajustes_en_refresco[id_analista] = self._ajustes_en_refresco.get(id_analista, 0) + delta
+        if id_analista not in self._carga:
+            return
+        carga = max(self._carga[id_analista] + delta, 0)
+        self._carga[id_analista] = carga
+        heapq.heappush(self._heaps[self._nivel[id_analista]], (carga, str(id_analista), id_analista))
+
+    def ajustar_carga(self, id_analista, delta: int) -> None:
+        """
+        Suma `delta` a la carga de un analista (p. ej. -1 al cerrar o al derivar un ticket).
+        """
+        with self._lock:
+            self._ajustar(id_analista, delta)
+
+    def elegir_menos_cargado(self, db_session: Session, niveles) -> Optional[object]:
+        """
+        Elige al analista con menos tickets abiertos entre los `niveles` dados y le
+        reserva el ticket (carga + 1) de forma atómica. Devuelve su id o None.
+        """
+        self._asegurar_fresco(db_session)
+        with self._lock:
+            return self._reservar_menos_cargado(niveles)
+
+    def _reservar_menos_cargado(self, niveles) -> Optional[object]:
+        """Debe llamarse con el lock tomado."""
+        candidatos = [t for t in (self._tope(n) for n in niveles) if t]
+        if not candidatos:
+            return None
+        _, _, elegido = min(candidatos)
+        self._ajustar(elegido, +1)
+        return elegido
+
+    def reservar_derivacion(self, db_session: Session, id_analista_actual, nivel_actual: int,
+                            estrategia: "EstrategiaDerivacion") -> Optional[object]:
+        """
+        Elige con `estrategia` un analista de nivel superior a `nivel_actual` y, en
+        la misma sección crítica, le pasa un ticket de carga desde el analista actual.
+        Devuelve el id elegido o None.
+        """
+        self._asegurar_fresco(db_session)
+        with self._lock:
+            niveles = sorted(n for n in self._heaps if n > nivel_actual)
+            elegido = estrategia.elegir(VistaCandidatos(self, niveles, id_analista_actual))
+            if elegido is not None:
+                self._ajustar(elegido, +1)
+                self._ajustar(id_analista_actual, -1)
+        return elegido
+
+    def liberar_derivacion(self, id_analista_actual, elegido) -> None:
+        """Deshace reservar_derivacion (la derivación no se confirmó)."""
+        with self._lock:
+            self._ajustar(elegido, -1)
+            self._ajustar(id_analista_actual, +1)
+
+    def carga(self, id_analista) -> Optional[int]:
+        """Carga actual (tickets abiertos) de un analista según el índice."""
+        with self._lock:
+            return self._carga.get(id_analista)
+
+    def asignar_ticket_nuevo(self, db_session: Session) -> Optional[object]:
+        """
+        Analista para un ticket nuevo: el menos cargado del nivel de entrada o,
+        si no hay ninguno, del nivel existente más bajo.
+        """
+        self._asegurar_fresco(db_session)
+        with self._lock:
+            if not self._heaps:
+                return None
+            nivel = NIVEL_ENTRADA if NIVEL_ENTRADA in self._heaps else min(self._heaps)
+            return self._reservar_menos_cargado([nivel])
+
+
+# =======================================================================
+# Derivaciones (escalamiento a un nivel superior)
+# =======================================================================
+
+class VistaCandidatos:
+    """
+    Candidatos de una derivación: los analistas de `niveles`, sin `excluir`.
+    La arma IndiceAnalistas.reservar_derivacion con su lock tomado y solo es
+    válida durante esa llamada.
+    """
+
+    def __init__(self, indice: IndiceAnalistas, niveles: list[int], excluir):
+        self._indice = indice
+        self.niveles = niveles
+        self.excluir = excluir
+
+    def menos_cargado(self) -> Optional[object]:
+        """El de menor carga (O(log n) por nivel con el heap; desempata por id)."""
+        topes = []
+        for nivel in self.niveles:
+            tope = self._indice._tope(nivel)
+            if tope and tope[2] == self.excluir:
+                # Caso raro (el actual figura en un nivel superior): recorrido del nivel
+                tope = min(((c, k, a) for a, c, k in self._del_nivel(nivel)), default=None)
+            if tope:
+                topes.append(tope)
+        return min(topes)[2] if topes else None
+
+    def ids(self) -> list:
+        """Todos los candidatos en orden estable (por id)."""
+        return sorted((a for n in self.niveles for a, _, _ in self._del_nivel(n)), key=str)
+
+    def carga(self, id_analista) -> int:
+        return self._indice._carga.get(id_analista, 0)
+
+    def _del_nivel(self, nivel: int):
+        for id_analista, n in self._indice._nivel.items():
+            if n == nivel and id_analista != self.excluir and id_analista in self._indice._carga:
+                yield id_analista, self._indice._carga[id_analista], str(id_analista)
+
+
+class EstrategiaDerivacion(ABC):
+    """Estrategia para elegir el destino de una derivación entre los candidatos."""
+
+    @abstractmethod
+    def elegir(self, candidatos: VistaCandidatos) -> Optional[object]:
+        """Devuelve el id del analista elegido o None si no hay candidatos."""
+
+
+class EstrategiaMenorCarga(EstrategiaDerivacion):
+    """El analista con menos tickets abiertos entre los niveles candidatos."""
+
+    def elegir(self, candidatos):
+        return candidatos.menos_cargado()
+
+
+class EstrategiaRoundRobin(EstrategiaDerivacion):
+    """Rota entre los analistas de los niveles candidatos, en orden estable."""
+
+    def __init__(self):
+        self._turnos: dict[tuple, int] = {}
+
+    def elegir(self, candidatos):
+        ids = candidatos.ids()
+        if not ids:
+            return None
+        clave = tuple(candidatos.niveles)
+        turno = self._turnos.get(clave, 0)
+        self._turnos[clave] = turno + 1
+        return ids[turno % len(ids)]
+
+
+ESTRATEGIAS: dict[str, EstrategiaDerivacion] = {
+    "menor_carga": EstrategiaMenorCarga(),
+    "round_robin": EstrategiaRoundRobin(),
+}
+
+
+def registrar_estrategia(nombre: str, estrategia: EstrategiaDerivacion) -> None:
+    """Permite agregar estrategias de derivación propias."""
+    ESTRATEGIAS[nombre] = estrategia
+
+
+class EnrutadorDerivaciones:
+    """
+    Elige el analista de nivel superior al que se deriva un ticket usando el índice
+    en memoria (sin ORDER BY random() sobre la tabla analista).
+
+    La elección y la reserva de carga ocurren en una sola sección crítica del
+    índice: derivaciones concurrentes ven la carga ya reservada y no se
+    amontonan en el mismo destino.
+    """
+
+    def __init__(self, indice: IndiceAnalistas, estrategia: str = "menor_carga"):
+        self.indice = indice
+        self.estrategia = estrategia
+
+    def elegir_superior(self, db_session: Session, id_analista_actual, nivel_actual: int) -> Optional[object]:
+        """
+        Devuelve el id del analista destino (o None) y mueve un ticket de carga
+        del analista actual al elegido. Solo para tickets abiertos.
+        """
+        return self.indice.reservar_derivacion(
+            db_session, id_analista_actual, nivel_actual, ESTRATEGIAS[self.estrategia]
+        )
+
+    def revertir(self, id_analista_actual, elegido) -> None:
+        """Deshace la reserva de elegir_superior si la derivación no se confirmó."""
+        self.indice.liberar_derivacion(id_analista_actual, elegido)
+
+
+# Instancias compartidas por el proceso
+indice_analistas = IndiceAnalistas()
+enrutador_derivaciones = EnrutadorDerivaciones(indice_analistas)
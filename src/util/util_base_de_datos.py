@@ -6,15 +6,18 @@ from sqlalchemy.orm import Session
 import os
 from src.util import util_keyvault as key
 
-USER = key.getkeyapi("PGUSER")
-PASSWORD = key.getkeyapi("PGPASSWORD")
-HOST = key.getkeyapi("PGHOST")
-PORT = key.getkeyapi("PGPORT")
-DB_NAME = key.getkeyapi("PGDATABASE")
+# DATABASE_URL en el entorno permite apuntar a otra base (p. ej. una local para pruebas)
+DATABASE_URL = os.getenv("DATABASE_URL")
+if not DATABASE_URL:
+    USER = key.getkeyapi("PGUSER")
+    PASSWORD = key.getkeyapi("PGPASSWORD")
+    HOST = key.getkeyapi("PGHOST")
+    PORT = key.getkeyapi("PGPORT")
+    DB_NAME = key.getkeyapi("PGDATABASE")
 
-DATABASE_URL = (
-    f"postgresql+psycopg2://{USER}:{PASSWORD}@{HOST}:{PORT}/analyticsdb?sslmode=require"
-)
+    DATABASE_URL = (
+        f"postgresql+psycopg2://{USER}:{PASSWORD}@{HOST}:{PORT}/analyticsdb?sslmode=require"
+    )
 
 if not DATABASE_URL:
     # Si no encuentra la URL, detiene la aplicación para evitar errores
@@ -24,6 +27,10 @@ if not DATABASE_URL:
 # Se crea una sola vez cuando la aplicación se inicia.
 engine = create_engine(DATABASE_URL)
 
+# Las migraciones NO se aplican aquí (se importaría en cada worker): son un paso
+# explícito del despliegue, `python -m src.util.util_migraciones`. main.py se niega
+# a arrancar si quedan migraciones pendientes.
+
 # --- 2. MAPEO AUTOMÁTICO DEL ORM ---
 # Aquí le decimos a SQLAlchemy que "aprenda" la estructura de la base de datos
 # en lugar de definirla nosotros a mano.
@@ -31,6 +38,7 @@ engine = create_engine(DATABASE_URL)
 # Preparamos las variables para que existan incluso si el mapeo falla
 Base = None
 Persona = Cliente = Servicio = ClienteDominio = Colaborador = Analista = External = ClienteServicio = Ticket = Conversacion = Escalado = None
+ContadorAnalista = ConversacionMensaje = BandejaVersion = None
 
 try:
     # Creamos una base para el automapeo
@@ -51,6 +59,9 @@ try:
     Ticket = Base.classes.ticket
     Conversacion = Base.classes.conversacion
     Escalado = Base.classes.escalado
+    ContadorAnalista = Base.classes.contador_analista
+    ConversacionMensaje = Base.classes.conversacion_mensaje
+    BandejaVersion = Base.classes.bandeja_version
 
     print("Conexión y mapeo a la base de datos exitosos.")
 
@@ -0,0 +1,243 @@
+# src/util/util_cache.py
+"""
+Caché de vistas hidratadas del analista (detalle de ticket y páginas de bandeja).
+
+- Backend en proceso (LRU + TTL con cachetools) por defecto; si hay REDIS_URL y
+  el paquete `redis` está instalado se usa Redis. Cualquier cliente con
+  get/set(ex=)/delete/incr sirve (p. ej. un stand-in local en desarrollo).
+- Claves:
+    detalle:{id_ticket}
+    bandeja:{id_analista}:{generación}:{hash de parámetros}
+  Invalidar la bandeja de un analista = subir su generación (las páginas viejas
+  quedan huérfanas y expiran solas).
+- El detalle se guarda junto a su versión (ETag) y se descarta si no coincide,
+  así una lectura que compite con un commit no deja datos viejos servibles.
+- La invalidación se registra en la sesión y se aplica en after_commit, así un
+  rollback no borra nada y nadie re-cachea datos previos al commit.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Optional, Iterable
+
+from cachetools import TTLCache
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+TTL_DETALLE = 120        # segundos
+TTL_BANDEJA = 30
+MAX_ENTRADAS = 5000      # solo backend en memoria
+_PENDIENTE = "cache_pendiente"
+
+
+def _a_json(valor) -> str:
+    return json.dumps(
+        valor, default=lambda o: o.isoformat() if hasattr(o, "isoformat") else str(o),
+        separators=(",", ":"),
+    )
+
+
+# =======================================================================
+# BACKENDS
+# =======================================================================
+
+class BackendMemoria:
+    """LRU con TTL por proceso (TTL del LRU = el mayor; cada entrada guarda su propio vencimiento)."""
+
+    def __init__(self, max_entradas: int = MAX_ENTRADAS, ttl: int = max(TTL_DETALLE, TTL_BANDEJA)):
+        self._datos = TTLCache(maxsize=max_entradas, ttl=ttl)
+        self._contadores: dict[str, int] = {}  # generaciones: fuera del LRU para que no se desalojen
+        self._lock = threading.Lock()
+
+    def get(self, clave: str) -> Optional[str]:
+        with self._lock:
+            if clave in self._contadores:
+                return str(self._contadores[clave])
+            entrada = self._datos.get(clave)
+        if not entrada:
+            return None
+        valor, vence = entrada
+        return valor if vence is None or vence > time.monotonic() else None
+
+    def set(self, clave: str, valor: str, ex: Optional[int] = None) -> None:
+        with self._lock:
+            self._datos[clave] = (valor, time.monotonic() + ex if ex else None)
+
+    def delete(self, *claves: str) -> None:
+        with self._lock:
+            for c in claves:
+                self._datos.pop(c, None)
+
+    def incr(self, clave: str) -> int:
+        with self._lock:
+            self._contadores[clave] = self._contadores.get(clave, 0) + 1
+            return self._contadores[clave]
+
+
+class BackendRedis:
+    """Adaptador mínimo sobre un cliente Redis (o compatible)."""
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+
+    def get(self, clave: str) -> Optional[str]:
+        valor = self.cliente.get(clave)
+        return valor.decode("utf-8") if isinstance(valor, bytes) else valor
+
+    def set(self, clave: str, valor: str, ex: Optional[int] = None) -> None:
+        self.cliente.set(clave, valor, ex=ex)
+
+    def delete(self, *claves: str) -> None:
+        if claves:
+            self.cliente.delete(*claves)
+
+    def incr(self, clave: str) -> int:
+        return int(self.cliente.incr(clave))
+
+
+def _backend_por_defecto():
+    url = os.getenv("REDIS_URL")
+    if url:
+        try:
+            import redis
+            return BackendRedis(redis.Redis.from_url(url))
+        except ImportError:
+            print("REDIS_URL definido pero el paquete 'redis' no está instalado; se usa caché en memoria.")
+    return BackendMemoria()
+
+
+# =======================================================================
+# CACHÉ DE VISTAS
+# =======================================================================
+
+class CacheVistas:
+
+    def __init__(self, backend=None):
+        self.backend = backend or _backend_por_defecto()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "obsoletos": 0, "escrituras": 0, "invalidaciones": 0, "errores": 0}
+        self._edad_total = 0.0   # suma de la edad de las entradas servidas (staleness)
+        self._edad_max = 0.0
+
+    def configurar_backend(self, backend) -> None:
+        """Reemplaza el backend (p. ej. un stand-in de Redis en desarrollo)."""
+        self.backend = backend
+
+    # --- Lectura / escritura genéricas ---
+    def _leer(self, clave: str, es_valida=None):
+        try:
+            crudo = self.backend.get(clave)
+        except Exception as e:
+            print(f"Error leyendo caché ({clave}): {e}")
+            self._contar("errores")
+            return None
+        if crudo is None:
+            self._contar("misses")
+            return None
+        entrada = json.loads(crudo)
+        if es_valida and not es_valida(entrada["v"]):
+            self._contar("obsoletos")
+            return None
+        edad = time.time() - entrada["t"]
+        with self._lock:
+            self._stats["hits"] += 1
+            self._edad_total += edad
+            self._edad_max = max(self._edad_max, edad)
+        return entrada["v"]
+
+    def _escribir(self, clave: str, valor, ttl: int) -> None:
+        try:
+            self.backend.set(clave, _a_json({"t": time.time(), "v": valor}), ex=ttl)
+            self._contar("escrituras")
+        except Exception as e:
+            print(f"Error escribiendo caché ({clave}): {e}")
+            self._contar("errores")
+
+    def _contar(self, nombre: str) -> None:
+        with self._lock:
+            self._stats[nombre] += 1
+
+    # --- Detalle ---
+    def obtener_detalle(self, id_ticket: int, version: str) -> Optional[dict]:
+        """
+        Devuelve el detalle cacheado solo si fue guardado con la misma `version`
+        (el ETag actual). Una versión distinta cuenta como entrada obsoleta.
+        """
+        entrada = self._leer(f"detalle:{id_ticket}", lambda v: v.get("version") == version)
+        return entrada["info"] if entrada else None
+
+    def guardar_detalle(self, id_ticket: int, version: str, info: dict) -> None:
+        self._escribir(f"detalle:{id_ticket}", {"version": version, "info": info}, TTL_DETALLE)
+
+    # --- Bandeja ---
+    def _generacion(self, id_analista) -> str:
+        try:
+            return self.backend.get(f"gen:{id_analista}") or "0"
+        except Exception:
+            return "0"
+
+    def clave_bandeja(self, id_analista, *parametros) -> str:
+        h = hashlib.sha1(_a_json(parametros).encode("utf-8")).hexdigest()[:16]
+        return f"bandeja:{id_analista}:{self._generacion(id_analista)}:{h}"
+
+    def obtener_bandeja(self, clave: str) -> Optional[dict]:
+        return self._leer(clave)
+
+    def guardar_bandeja(self, clave: str, pagina: dict) -> None:
+        self._escribir(clave, pagina, TTL_BANDEJA)
+
+    # --- Invalidación ---
+    def invalidar(self, tickets: Iterable[int] = (), analistas: Iterable = ()) -> None:
+        """Invalida ya (usar invalidar_al_confirmar dentro de una transacción)."""
+        try:
+            claves = [f"detalle:{t}" for t in set(tickets)]
+            self.backend.delete(*claves)
+            for a in {str(a) for a in analistas if a}:
+                self.backend.incr(f"gen:{a}")
+            with self._lock:
+                self._stats["invalidaciones"] += len(claves) + len({str(a) for a in analistas if a})
+        except Exception as e:
+            print(f"Error invalidando caché: {e}")
+            self._contar("errores")
+
+    def metricas(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            lecturas = s["hits"] + s["misses"] + s["obsoletos"]
+            s["hit_ratio"] = round(s["hits"] / lecturas, 4) if lecturas else None
+            s["edad_media_hit_s"] = round(self._edad_total / s["hits"], 2) if s["hits"] else None
+            s["edad_max_hit_s"] = round(self._edad_max, 2)
+        s["backend"] = type(self.backend).__name__
+        return s
+
+
+# Instancia compartida por el proceso
+cache_vistas = CacheVistas()
+
+
+# =======================================================================
+# INVALIDACIÓN LIGADA A LA TRANSACCIÓN
+# =======================================================================
+
+def invalidar_al_confirmar(db_session: Session, tickets: Iterable[int] = (), analistas: Iterable = ()) -> None:
+    """
+    Registra tickets/analistas a invalidar cuando la sesión haga commit.
+    Si la transacción hace rollback, lo registrado se descarta.
+    """
+    pendiente = db_session.info.setdefault(_PENDIENTE, {"tickets": set(), "analistas": set()})
+    pendiente["tickets"].update(t for t in tickets if t is not None)
+    pendiente["analistas"].update(str(a) for a in analistas if a)
+
+
+@event.listens_for(Session, "after_commit")
+def _aplicar_invalidaciones(db_session: Session) -> None:
+    pendiente = db_session.info.pop(_PENDIENTE, None)
+    if pendiente:
+        cache_vistas.invalidar(pendiente["tickets"], pendiente["analistas"])
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_invalidaciones(db_session: Session) -> None:
+    db_session.info.pop(_PENDIENTE, None)
@@ -0,0 +1,187 @@
+# src/util/util_catalogo.py
+"""
+Catálogo en memoria de clientes, servicios y contratos (cliente_servicio).
+
+Lo usan la creación de tickets (resolver el servicio por nombre), los logins
+(el cliente "Gmail") y get_current_user, que arma el perfil del cliente (nombre
+y servicios contratados) desde aquí en vez de llevarlo dentro del JWT.
+
+Se carga al iniciar la app y se refresca cada `ttl` segundos o al recibir una
+notificación en el canal CANAL (triggers de la migración 0008).
+"""
+import time
+import difflib
+import threading
+import unicodedata
+from typing import Optional, NamedTuple
+
+from sqlalchemy.orm import Session
+
+from src.util import util_base_de_datos as db
+from src.util import util_schemas as sch
+
+CANAL = "catalogo_cambios"
+RECARGA_MINIMA = 5.0        # segundos: evita recargar en cada búsqueda fallida
+SIMILITUD_MINIMA = 0.75     # coincidencia difusa (difflib) para nombres de servicio
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sin tildes y con espacios colapsados."""
+    sin_tildes = unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode()
+    return " ".join(sin_tildes.lower().split())
+
+
+class PerfilCliente(NamedTuple):
+    nombre: str
+    servicios: tuple  # (sch.ServicioInfo, ...) ya validados: solo lectura
+
+
+class CatalogoServicios:
+
+    def __init__(self, ttl_segundos: float = 300.0):
+        self.ttl_segundos = ttl_segundos
+        self._lock = threading.Lock()
+        self._lock_recarga = threading.Lock()           # una sola recarga a la vez
+        self._clientes: dict[str, str] = {}              # id_cliente -> nombre
+        self._clientes_por_nombre: dict[str, str] = {}   # nombre normalizado -> id_cliente
+        self._contratos: dict[str, list] = {}            # id_cliente -> [(id_cliente_servicio, id_servicio, nombre, normalizado)]
+        self._perfiles: dict[str, PerfilCliente] = {}    # id_cliente -> perfil armado (se reconstruye al recargar)
+        self._cargado_en = 0.0
+        self.version = 0                                 # sube en cada recarga
+
+    def refrescar(self, db_session: Session) -> None:
+        """Recarga clientes y contratos (dos queries)."""
+        with self._lock_recarga:
+            self._recargar(db_session)
+
+    def _recargar(self, db_session: Session) -> None:
+        """Debe llamarse con _lock_recarga tomado."""
+        clientes = db_session.query(db.Cliente.id_cliente, db.Cliente.nombre).all()
+        contratos = (
+            db_session.query(
+                db.ClienteServicio.id_cliente_servicio,
+                db.ClienteServicio.id_cliente,
+                db.Servicio.id_servicio,
+                db.Servicio.nombre,
+            )
+            .join(db.Servicio, db.Servicio.id_servicio == db.ClienteServicio.id_servicio)
+            .all()
+        )
+
+        por_cliente: dict[str, list] = {}
+        for id_cs, id_cliente, id_servicio, nombre in contratos:
+            por_cliente.setdefault(str(id_cliente), []).append((id_cs, id_servicio, nombre, normalizar(nombre)))
+
+        perfiles = {
+            str(i): PerfilCliente(nombre, tuple(
+                sch.ServicioInfo(id_servicio=str(id_servicio), nombre=nombre_servicio)
+                for _, id_servicio, nombre_servicio, _ in por_cliente.get(str(i), [])
+            ))
+            for i, nombre in clientes
+        }
+
+        with self._lock:
+            self._clientes = {str(i): nombre for i, nombre in clientes}
+            self._clientes_por_nombre = {normalizar(nombre): str(i) for i, nombre in clientes}
+            self._contratos = por_cliente
+            self._perfiles = perfiles
+            self._cargado_en = time.monotonic()
+            self.version += 1
+
+    def invalidar(self) -> None:
+        """Fuerza la recarga en el próximo acceso."""
+        self._cargado_en = 0.0
+
+    def _asegurar_fresco(self, db_session: Session) -> None:
+        """
+        Recarga si venció el TTL. Solo un hilo recarga; los demás siguen con los
+        datos actuales, salvo que no haya datos válidos (nunca cargado o invalidado).
+        """
+        cargado_en = self._cargado_en
+        if time.monotonic() - cargado_en <= self.ttl_segundos:
+            return
+        if not self._lock_recarga.acquire(blocking=not cargado_en):
+            return
+        try:
+            # Otro hilo pudo haber recargado mientras se esperaba el lock
+            if time.monotonic() - self._cargado_en > self.ttl_segundos:
+                self._recargar(db_session)
+        finally:
+            self._lock_recarga.release()
+
+    def _recargar_si_viejo(self, db_session: Session) -> bool:
+        """
+        Ante un faltante, recarga una vez (el dato pudo crearse después de la última
+        carga). Con varios faltantes a la vez recarga uno solo y los demás esperan
+        ese resultado. Devuelve True si vale la pena volver a buscar.
+        """
+        if time.monotonic() - self._cargado_en <= RECARGA_MINIMA:
+            return False
+        with self._lock_recarga:
+            # Si otro hilo recargó mientras se esperaba el lock, basta con volver a buscar
+            if time.monotonic() - self._cargado_en > RECARGA_MINIMA:
+                self._recargar(db_session)
+        return True
+
+    # --- Clientes ---
+    def nombre_cliente(self, db_session: Session, id_cliente) -> Optional[str]:
+        self._asegurar_fresco(db_session)
+        nombre = self._clientes.get(str(id_cliente))
+        if nombre is None and self._recargar_si_viejo(db_session):
+            nombre = self._clientes.get(str(id_cliente))
+        return nombre
+
+    def id_cliente_por_nombre(self, db_session: Session, nombre: str) -> Optional[str]:
+        self._asegurar_fresco(db_session)
+        id_cliente = self._clientes_por_nombre.get(normalizar(nombre))
+        if id_cliente is None and self._recargar_si_viejo(db_session):
+            id_cliente = self._clientes_por_nombre.get(normalizar(nombre))
+        return id_cliente
+
+    def perfil_cliente(self, db_session: Session, id_cliente) -> Optional[PerfilCliente]:
+        """Nombre del cliente y servicios contratados (para armar el TokenData)."""
+        self._asegurar_fresco(db_session)
+        perfil = self._perfiles.get(str(id_cliente))
+        if perfil is None and self._recargar_si_viejo(db_session):
+            perfil = self._perfiles.get(str(id_cliente))
+        return perfil
+
+    # --- Servicios contratados ---
+    def servicios_de_cliente(self, db_session: Session, id_cliente) -> list[tuple]:
+        """[(id_servicio, nombre)] contratados por el cliente."""
+        self._asegurar_fresco(db_session)
+        return [(id_servicio, nombre) for _, id_servicio, nombre, _ in self._contratos.get(str(id_cliente), [])]
+
+    def resolver_servicio(self, db_session: Session, id_cliente, nombre_servicio: str):
+        """
+        Devuelve el id_cliente_servicio del servicio contratado que corresponde a
+        `nombre_servicio`, o None. Orden: coincidencia exacta (normalizada), luego
+        por subcadena (equivalente al ILIKE '%nombre%' anterior) y por último
+        difusa con difflib.
+        """
+        self._asegurar_fresco(db_session)
+        encontrado = self._buscar_servicio(id_cliente, nombre_servicio)
+        if encontrado is None and self._recargar_si_viejo(db_session):
+            encontrado = self._buscar_servicio(id_cliente, nombre_servicio)
+        return encontrado
+
+    def _buscar_servicio(self, id_cliente, nombre_servicio: str):
+        contratos = self._contratos.get(str(id_cliente), [])
+        buscado = normalizar(nombre_servicio)
+        if not contratos or not buscado:
+            return None
+
+        for id_cs, _, _, normalizado in contratos:
+            if normalizado == buscado:
+                return id_cs
+        for id_cs, _, _, normalizado in contratos:
+            if buscado in normalizado:
+                return id_cs
+
+        por_nombre = {normalizado: id_cs for id_cs, _, _, normalizado in contratos}
+        cercanos = difflib.get_close_matches(buscado, list(por_nombre), n=1, cutoff=SIMILITUD_MINIMA)
+        return por_nombre[cercanos[0]] if cercanos else None
+
+
+# Instancia compartida por el proceso
+catalogo = CatalogoServicios()
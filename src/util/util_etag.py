@@ -0,0 +1,46 @@
+# src/util/util_etag.py
+"""
+ETags débiles para GET condicionales (detalle de ticket y bandeja del analista).
+
+El ETag se calcula con una lectura indexada barata (versión del recurso), así un
+refresco sin cambios responde 304 sin hidratar ni serializar nada.
+"""
+import json
+import hashlib
+from typing import Optional
+
+from fastapi import Response
+
+CACHE_CONTROL = "private, no-cache"  # el navegador guarda, pero siempre revalida
+
+
+def etag_debil(*partes) -> str:
+    """Arma un ETag débil (W/"...") a partir de los valores que definen la versión."""
+    crudo = json.dumps(partes, default=str, separators=(",", ":"))
+    return f'W/"{hashlib.sha1(crudo.encode("utf-8")).hexdigest()[:20]}"'
+
+
+def coincide(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Compara If-None-Match con el ETag actual usando comparación débil
+    (se ignora el prefijo W/), aceptando listas separadas por comas y "*".
+    """
+    if not if_none_match:
+        return False
+    actual = etag.removeprefix("W/")
+    for candidato in if_none_match.split(","):
+        candidato = candidato.strip()
+        if candidato == "*" or candidato.removeprefix("W/") == actual:
+            return True
+    return False
+
+
+def no_modificado(etag: str) -> Response:
+    """Respuesta 304 sin cuerpo."""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def marcar(response: Response, etag: str) -> None:
+    """Agrega ETag y Cache-Control a una respuesta 200."""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
@@ -0,0 +1,240 @@
+# src/util/util_eventos.py
+"""
+Eventos de tickets en tiempo real para la bandeja del analista.
+
+- Publicación: las mutaciones llaman a `publicar`/`publicar_lote` ANTES de su
+  commit. pg_notify es transaccional: el evento solo sale si la transacción se
+  confirma, y no se emite nada si hace rollback.
+- Distribución: `HubEventos` mantiene un hilo con LISTEN sobre una conexión
+  dedicada y reparte cada evento (en memoria) a las colas asyncio de los
+  analistas conectados que figuran en el evento.
+
+Los eventos son deltas ("ticket_creado", "ticket_actualizado", "ticket_derivado")
+con los campos que cambian en la bandeja, así el cliente no vuelve a pedir páginas.
+"""
+import json
+import time
+import select
+import asyncio
+import threading
+from collections import deque
+from typing import Optional, List
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from src.util import util_tareas
+
+CANAL = "ticket_eventos"
+MAX_COLA_CLIENTE = 100       # eventos pendientes por conexión antes de pedir resync
+ESPERA_RECONEXION = 5        # segundos entre reintentos del LISTEN
+
+
+# =======================================================================
+# PUBLICACIÓN (dentro de la transacción de la mutación)
+# =======================================================================
+
+def _evento(tipo: str, id_ticket: int, analistas, **datos) -> str:
+    evento = {
+        "tipo": tipo,
+        "id_ticket": id_ticket,
+        "analistas": [str(a) for a in analistas if a],
+        "ts": time.time(),
+        **datos,
+    }
+    return json.dumps(evento, default=str)
+
+
+def publicar(db_session: Session, tipo: str, id_ticket: int, analistas, **datos) -> None:
+    """
+    Encola un evento con pg_notify en la transacción actual (no hace commit).
+    `analistas` son los ids que deben recibirlo (dueño actual y, si cambió, el anterior).
+    """
+    db_session.execute(
+        text("SELECT pg_notify(:canal, :payload)"),
+        {"canal": CANAL, "payload": _evento(tipo, id_ticket, analistas, **datos)},
+    )
+
+
+def publicar_lote(db_session: Session, eventos: List[dict]) -> None:
+    """
+    Publica varios eventos en un solo round trip (pg_notify sobre unnest).
+    Cada evento es un dict con "tipo", "id_ticket", "analistas" y datos extra.
+    """
+    if not eventos:
+        return
+    payloads = [
+        _evento(e["tipo"], e["id_ticket"], e["analistas"], **{k: v for k, v in e.items()
+                                                             if k not in ("tipo", "id_ticket", "analistas")})
+        for e in eventos
+    ]
+    db_session.execute(
+        text("SELECT pg_notify(:canal, p) FROM unnest(CAST(:payloads AS text[])) AS p"),
+        {"canal": CANAL, "payloads": payloads},
+    )
+
+
+def publicar_diferido(db_session: Session, tipo: str, id_ticket: int, analistas, **datos) -> None:
+    """
+    Deja el evento en el outbox (misma transacción); el trabajador de util_tareas
+    lo publica después con pg_notify.
+    """
+    util_tareas.encolar(db_session, "evento_ticket", {
+        "tipo": tipo, "id_ticket": id_ticket, "analistas": [str(a) for a in analistas if a], "datos": datos,
+    })
+
+
+@util_tareas.manejador("evento_ticket")
+def _publicar_evento_diferido(db_session: Session, payload: dict) -> None:
+    publicar(db_session, payload["tipo"], payload["id_ticket"], payload["analistas"], **payload.get("datos", {}))
+
+
+# =======================================================================
+# HUB DE DISTRIBUCIÓN
+# =======================================================================
+
+class HubEventos:
+    """
+    Un LISTEN por proceso y fan-out en memoria a los analistas suscritos.
+
+    El hilo de escucha no toca asyncio directamente: entrega cada evento al loop
+    de cada suscriptor con call_soon_threadsafe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._suscriptores: dict[str, set] = {}   # id_analista -> {(loop, cola)}
+        self._hilo: Optional[threading.Thread] = None
+        self._detener = threading.Event()
+        self._latencias = deque(maxlen=1000)       # ms entre el NOTIFY y la entrega
+        self._contadores = {"recibidos": 0, "entregas": 0, "resyncs": 0, "reconexiones": 0}
+        self._oyentes: dict = {}                   # canal extra -> función(payload)
+
+    # --- Ciclo de vida ---
+    def iniciar(self) -> None:
+        """Arranca el hilo de LISTEN si aún no corre (al iniciar la app o en la primera suscripción)."""
+        with self._lock:
+            if self._hilo and self._hilo.is_alive():
+                return
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._escuchar, name="hub-eventos", daemon=True)
+            self._hilo.start()
+
+    def detener(self) -> None:
+        self._detener.set()
+
+    def escuchar_canal(self, canal: str, funcion) -> None:
+        """
+        Reusa la conexión de LISTEN para otro canal (p. ej. cambios de catálogo).
+        Registrar antes de `iniciar`: los canales se suscriben al conectar.
+        """
+        self._oyentes[canal] = funcion
+
+    def _escuchar(self) -> None:
+        # Import diferido: la BD se conecta al importar util_base_de_datos
+        from src.util import util_base_de_datos as db
+
+        while not self._detener.is_set():
+            raw = None
+            try:
+                raw = db.engine.raw_connection()
+                conn = raw.driver_connection
+                conn.autocommit = True
+                canales = [CANAL, *self._oyentes]
+                with conn.cursor() as cur:
+                    for canal in canales:
+                        cur.execute(f"LISTEN {canal}")
+                print(f"Hub de eventos escuchando los canales {canales}.")
+
+                while not self._detener.is_set():
+                    if select.select([conn], [], [], ESPERA_RECONEXION) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        aviso = conn.notifies.pop(0)
+                        oyente = self._oyentes.get(aviso.channel)
+                        if oyente:
+                            try:
+                                oyente(aviso.payload)
+                            except Exception as e:
+                                print(f"Error en el oyente del canal '{aviso.channel}': {e}")
+                        else:
+                            self._despachar(aviso.payload)
+            except Exception as e:
+                print(f"Error en el hub de eventos: {e}")
+                self._contadores["reconexiones"] += 1
+                time.sleep(ESPERA_RECONEXION)
+            finally:
+                if raw is not None:
+                    try:
+                        raw.invalidate()
+                    except Exception:
+                        pass
+
+    def _despachar(self, payload: str) -> None:
+        try:
+            evento = json.loads(payload)
+        except ValueError:
+            return
+        self._contadores["recibidos"] += 1
+
+        with self._lock:
+            destinos = [
+                s for analista in evento.get("analistas", [])
+                for s in self._suscriptores.get(analista, ())
+            ]
+        for loop, cola in destinos:
+            loop.call_soon_threadsafe(self._encolar, cola, evento)
+
+    def _encolar(self, cola: asyncio.Queue, evento: dict) -> None:
+        # Corre en el loop del suscriptor
+        if cola.full():
+            # Cliente lento: descartamos lo pendiente y le pedimos recargar la bandeja
+            while not cola.empty():
+                cola.get_nowait()
+            cola.put_nowait({"tipo": "resync"})
+            self._contadores["resyncs"] += 1
+            return
+        cola.put_nowait(evento)
+        self._contadores["entregas"] += 1
+        if "ts" in evento:
+            self._latencias.append((time.time() - evento["ts"]) * 1000)
+
+    # --- Suscripciones ---
+    def suscribir(self, id_analista) -> asyncio.Queue:
+        """Registra una conexión del analista y devuelve su cola de eventos."""
+        self.iniciar()
+        cola: asyncio.Queue = asyncio.Queue(maxsize=MAX_COLA_CLIENTE)
+        with self._lock:
+            self._suscriptores.setdefault(str(id_analista), set()).add((asyncio.get_running_loop(), cola))
+        return cola
+
+    def desuscribir(self, id_analista, cola: asyncio.Queue) -> None:
+        with self._lock:
+            subs = self._suscriptores.get(str(id_analista))
+            if not subs:
+                return
+            subs.difference_update({s for s in subs if s[1] is cola})
+            if not subs:
+                self._suscriptores.pop(str(id_analista), None)
+
+    # --- Métricas ---
+    def metricas(self) -> dict:
+        with self._lock:
+            conexiones = sum(len(s) for s in self._suscriptores.values())
+            analistas = len(self._suscriptores)
+        latencias = sorted(self._latencias)
+        p = lambda q: round(latencias[min(len(latencias) - 1, int(q * len(latencias)))], 2) if latencias else None
+        return {
+            "conexiones": conexiones,
+            "analistas_conectados": analistas,
+            "escuchando": bool(self._hilo and self._hilo.is_alive()),
+            **self._contadores,
+            "latencia_ms_p50": p(0.50),
+            "latencia_ms_p95": p(0.95),
+            "latencia_ms_max": round(latencias[-1], 2) if latencias else None,
+        }
+
+
+# Instancia compartida por el proceso
+hub_eventos = HubEventos()
@@ -0,0 +1,276 @@
+# src/util/util_limites.py
+"""
+Límite de peticiones (token bucket) por colaborador y por cliente.
+
+- Cada grupo de rutas (prefijo) tiene su presupuesto: capacidad (ráfaga) y
+  tasa de recarga (tokens por segundo). Una petición consume un token del
+  bucket del usuario y, si aplica, uno del bucket del cliente; se rechaza si
+  cualquiera de los dos está vacío (y entonces no se consume ninguno).
+- Sin token válido se limita por IP (el endpoint igual responderá 401). La IP
+  es la de scope["client"]: detrás de un proxy, uvicorn la toma de
+  X-Forwarded-For solo si la conexión viene de FORWARDED_ALLOW_IPS (ver
+  Dockerfile); sin eso todas las peticiones comparten la IP del proxy.
+- Backend en proceso por defecto; con REDIS_URL (y el paquete `redis`) el
+  estado se comparte entre workers con un script Lua atómico. Cualquier
+  cliente con `eval` sirve (p. ej. un stand-in local en desarrollo).
+- Cabeceras: RateLimit-Limit / RateLimit-Remaining / RateLimit-Reset en todas
+  las respuestas limitadas, y Retry-After en los 429.
+"""
+import os
+import json
+import math
+import time
+import threading
+from typing import Optional, NamedTuple
+
+from cachetools import TTLCache
+from fastapi.concurrency import run_in_threadpool
+
+MAX_BUCKETS = 100_000         # solo backend en memoria
+TTL_BUCKET_INACTIVO = 3600    # segundos; un bucket desalojado vuelve lleno
+
+
+class Presupuesto(NamedTuple):
+    capacidad: int            # tokens máximos (ráfaga permitida)
+    por_segundo: float        # tokens que se recuperan por segundo
+
+
+class Grupo(NamedTuple):
+    nombre: str
+    prefijo: str
+    usuario: Presupuesto
+    cliente: Optional[Presupuesto] = None   # None: sin límite por cliente
+
+
+# El chat consume cuota del LLM: es el más restrictivo. Se evalúa en orden.
+GRUPOS = (
+    Grupo("chat", "/api/chat", Presupuesto(10, 10 / 60), Presupuesto(60, 120 / 60)),
+    Grupo("analista", "/api/analista", Presupuesto(120, 4.0)),
+    Grupo("analitica", "/api/analitica", Presupuesto(20, 30 / 60), Presupuesto(60, 1.0)),
+    Grupo("auth", "/api/auth", Presupuesto(10, 10 / 60)),
+)
+
+
+class Resultado(NamedTuple):
+    permitido: bool
+    limite: int               # capacidad del bucket más restrictivo
+    restantes: int
+    reinicio: float           # segundos hasta volver a estar lleno
+    reintentar: float         # segundos hasta tener 1 token (solo si se rechaza)
+
+
+# =======================================================================
+# BACKENDS
+# =======================================================================
+
+class BackendMemoria:
+    """Buckets en un dict por proceso: (tokens, último instante)."""
+
+    def __init__(self, max_buckets: int = MAX_BUCKETS):
+        self._buckets = TTLCache(maxsize=max_buckets, ttl=TTL_BUCKET_INACTIVO)
+        self._lock = threading.Lock()
+
+    def consumir(self, claves: list, presupuestos: list) -> Resultado:
+        ahora = time.monotonic()
+        with self._lock:
+            niveles = []
+            for clave, p in zip(claves, presupuestos):
+                tokens, antes = self._buckets.get(clave, (p.capacidad, ahora))
+                niveles.append(min(p.capacidad, tokens + (ahora - antes) * p.por_segundo))
+
+            permitido = all(t >= 1 for t in niveles)
+            if permitido:
+                niveles = [t - 1 for t in niveles]
+            for clave, t in zip(claves, niveles):
+                self._buckets[clave] = (t, ahora)
+        return _resumir(permitido, niveles, presupuestos)
+
+
+# Mismo algoritmo que BackendMemoria, atómico en Redis. ARGV: capacidad y tasa por clave.
+_SCRIPT_LUA = """
+local t = redis.call('TIME')
+local ahora = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local niveles = {}
+local permitido = 1
+for i = 1, #KEYS do
+    local cap = tonumber(ARGV[2 * i - 1])
+    local tasa = tonumber(ARGV[2 * i])
+    local s = redis.call('HMGET', KEYS[i], 't', 'ts')
+    local tokens = tonumber(s[1]) or cap
+    local antes = tonumber(s[2]) or ahora
+    tokens = math.min(cap, tokens + math.max(0, ahora - antes) * tasa)
+    if tokens < 1 then permitido = 0 end
+    niveles[i] = tokens
+end
+for i = 1, #KEYS do
+    local cap = tonumber(ARGV[2 * i - 1])
+    local tasa = tonumber(ARGV[2 * i])
+    if permitido == 1 then niveles[i] = niveles[i] - 1 end
+    redis.call('HSET', KEYS[i], 't', niveles[i], 'ts', ahora)
+    redis.call('EXPIRE', KEYS[i], math.ceil(cap / tasa) + 1)
+    niveles[i] = tostring(niveles[i])
+end
+return {permitido, niveles}
+"""
+
+
+class BackendRedis:
+    """Buckets compartidos entre procesos (reloj de Redis, un round trip por petición)."""
+
+    def __init__(self, cliente, prefijo: str = "rl:"):
+        self.cliente = cliente
+        self.prefijo = prefijo
+
+    def consumir(self, claves: list, presupuestos: list) -> Resultado:
+        args = [v for p in presupuestos for v in (p.capacidad, p.por_segundo)]
+        permitido, niveles = self.cliente.eval(
+            _SCRIPT_LUA, len(claves), *[self.prefijo + c for c in claves], *args
+        )
+        niveles = [float(n.decode() if isinstance(n, bytes) else n) for n in niveles]
+        return _resumir(bool(int(permitido)), niveles, presupuestos)
+
+
+def _resumir(permitido: bool, niveles: list, presupuestos: list) -> Resultado:
+    """Reporta el bucket más restrictivo (el de menos tokens restantes)."""
+    i = min(range(len(niveles)), key=lambda k: niveles[k])
+    p = presupuestos[i]
+    reintentar = 0.0
+    if not permitido:
+        reintentar = max((1 - t) / q.por_segundo for t, q in zip(niveles, presupuestos) if t < 1)
+    return Resultado(
+        permitido=permitido,
+        limite=p.capacidad,
+        restantes=max(0, math.floor(niveles[i])),
+        reinicio=(p.capacidad - niveles[i]) / p.por_segundo,
+        reintentar=reintentar,
+    )
+
+
+def _backend_por_defecto():
+    url = os.getenv("REDIS_URL")
+    if url:
+        try:
+            import redis
+            return BackendRedis(redis.Redis.from_url(url))
+        except ImportError:
+            print("REDIS_URL definido pero el paquete 'redis' no está instalado; se usan límites en memoria.")
+    return BackendMemoria()
+
+
+# =======================================================================
+# LIMITADOR
+# =======================================================================
+
+class Limitador:
+
+    def __init__(self, grupos=GRUPOS, backend=None):
+        self.grupos = grupos
+        self.backend = backend or _backend_por_defecto()
+        self._contadores = {"permitidas": 0, "rechazadas": 0, "errores": 0}
+
+    def configurar_backend(self, backend) -> None:
+        """Reemplaza el backend (p. ej. un stand-in de Redis en desarrollo)."""
+        self.backend = backend
+
+    def grupo_de(self, ruta: str) -> Optional[Grupo]:
+        for grupo in self.grupos:
+            if ruta == grupo.prefijo or ruta.startswith(grupo.prefijo + "/"):
+                return grupo
+        return None
+
+    def consumir(self, grupo: Grupo, usuario: Optional[str], cliente: Optional[str], ip: str) -> Optional[Resultado]:
+        """
+        Consume un token para la petición. Devuelve None si el backend falla:
+        ante un error se deja pasar (no bloqueamos la API por el limitador).
+        """
+        claves = [f"{grupo.nombre}:u:{usuario}" if usuario else f"{grupo.nombre}:ip:{ip}"]
+        presupuestos = [grupo.usuario]
+        if usuario and cliente and grupo.cliente:
+            claves.append(f"{grupo.nombre}:c:{cliente}")
+            presupuestos.append(grupo.cliente)
+        try:
+            resultado = self.backend.consumir(claves, presupuestos)
+        except Exception as e:
+            print(f"Error en el limitador de peticiones: {e}")
+            self._contadores["errores"] += 1
+            return None
+        self._contadores["permitidas" if resultado.permitido else "rechazadas"] += 1
+        return resultado
+
+    def metricas(self) -> dict:
+        return {**self._contadores, "backend": type(self.backend).__name__}
+
+
+# Instancia compartida por el proceso
+limitador = Limitador()
+
+
+# =======================================================================
+# MIDDLEWARE (ASGI puro: no envuelve el cuerpo, así el SSE no se ve afectado)
+# =======================================================================
+
+def _cabeceras(resultado: Resultado) -> list:
+    return [
+        (b"ratelimit-limit", str(resultado.limite).encode()),
+        (b"ratelimit-remaining", str(resultado.restantes).encode()),
+        (b"ratelimit-reset", str(math.ceil(resultado.reinicio)).encode()),
+    ]
+
+
+class LimiteMiddleware:
+    """
+    `identificar(authorization)` devuelve (usuario, cliente) a partir del
+    header Authorization, o (None, None) si no hay un token válido.
+    """
+
+    def __init__(self, app, identificar, limitador: Limitador = limitador):
+        self.app = app
+        self.identificar = identificar
+        self.limitador = limitador
+
+    @staticmethod
+    def _ip(scope) -> str:
+        # uvicorn (--proxy-headers) ya reemplazó el client por la IP real si el proxy es confiable
+        cliente = scope.get("client")
+        return cliente[0] if cliente else "desconocida"
+
+    def _consumir(self, grupo: Grupo, autorizacion: str, ip: str):
+        usuario, cliente = self.identificar(autorizacion) if autorizacion else (None, None)
+        return self.limitador.consumir(grupo, usuario, cliente, ip)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+        grupo = self.limitador.grupo_de(scope["path"])
+        if grupo is None:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        autorizacion = headers.get(b"authorization", b"").decode("latin-1")
+        # Decodificar el JWT y el eval de Redis bloquean: van al threadpool, no al event loop
+        resultado = await run_in_threadpool(self._consumir, grupo, autorizacion, self._ip(scope))
+        if resultado is None:
+            return await self.app(scope, receive, send)
+
+        if not resultado.permitido:
+            cuerpo = json.dumps({"detail": "Demasiadas peticiones, intenta de nuevo en unos segundos."}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": _cabeceras(resultado) + [
+                    (b"retry-after", str(math.ceil(resultado.reintentar)).encode()),
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(cuerpo)).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": cuerpo})
+            return
+
+        extra = _cabeceras(resultado)
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                mensaje["headers"] = list(mensaje.get("headers", [])) + extra
+            await send(mensaje)
+
+        await self.app(scope, receive, enviar)
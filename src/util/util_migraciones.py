@@ -0,0 +1,157 @@
+# src/util/util_migraciones.py
+"""
+Migraciones SQL versionadas (src/migraciones/NNNN_descripcion.sql).
+
+Se aplican como paso explícito del despliegue, una sola vez y antes de levantar
+la API (ver Dockerfile):
+
+    python -m src.util.util_migraciones
+
+Si una migración falla el proceso termina con error y las siguientes no se
+aplican; main.py además se niega a arrancar con migraciones pendientes.
+
+Una migración cuya primera línea es `-- migracion: sin-transaccion` corre fuera
+de una transacción, sentencia por sentencia, para poder usar
+CREATE INDEX CONCURRENTLY (no bloquea escrituras sobre la tabla). Sus
+sentencias deben ser idempotentes (IF NOT EXISTS) y no puede contener bloques
+$$ ... $$.
+"""
+import re
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+# Los scripts viven en src/migraciones con el formato NNNN_descripcion.sql
+MIGRACIONES_DIR = Path(__file__).resolve().parent.parent / "migraciones"
+_NOMBRE_MIGRACION = re.compile(r"^(\d{4})_([\w\-]+)\.sql$")
+_SIN_TRANSACCION = "-- migracion: sin-transaccion"
+_INDICE_CONCURRENTE = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.IGNORECASE
+)
+
+# Llave para pg_advisory_lock: evita que dos despliegues apliquen la misma migración
+_LOCK_MIGRACIONES = 7_301_026
+
+
+def listar_migraciones() -> list[tuple[int, str, Path]]:
+    """
+    Devuelve las migraciones disponibles ordenadas por versión: (version, nombre, ruta).
+    """
+    migraciones = []
+    for ruta in MIGRACIONES_DIR.glob("*.sql"):
+        match = _NOMBRE_MIGRACION.match(ruta.name)
+        if match:
+            migraciones.append((int(match.group(1)), match.group(2), ruta))
+    return sorted(migraciones)
+
+
+def _crear_tabla_control(engine: Engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migracion ("
+            " version integer PRIMARY KEY,"
+            " nombre text NOT NULL,"
+            " aplicada_en timestamptz NOT NULL DEFAULT now())"
+        ))
+
+
+def migraciones_pendientes(engine: Engine) -> list[str]:
+    """Nombres (NNNN_descripcion) de las migraciones que aún no se aplicaron."""
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT to_regclass('schema_migracion')")).scalar() is None:
+            aplicadas = set()
+        else:
+            aplicadas = set(conn.execute(text("SELECT version FROM schema_migracion")).scalars())
+    return [f"{v:04d}_{n}" for v, n, _ in listar_migraciones() if v not in aplicadas]
+
+
+def _sentencias(sql: str) -> list[str]:
+    """Parte un script en sentencias (`;` a fin de línea), sin los bloques solo de comentarios."""
+    partes = re.split(r";[ \t]*$", sql, flags=re.MULTILINE)
+    return [p.strip() for p in partes if re.sub(r"--.*$", "", p, flags=re.MULTILINE).strip()]
+
+
+def _ejecutar_script(conn, sql: str) -> None:
+    # Cursor DBAPI sin parámetros: el driver no interpreta los '%' del script (p. ej. en ILIKE '%x%')
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(sql)
+    finally:
+        cursor.close()
+
+
+def _aplicar_sin_transaccion(engine: Engine, version: int, nombre: str, sql: str) -> bool:
+    if "$$" in sql:
+        raise ValueError(f"La migración {version:04d}_{nombre} no puede usar $$ fuera de una transacción.")
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": _LOCK_MIGRACIONES})
+        try:
+            if conn.execute(text("SELECT 1 FROM schema_migracion WHERE version = :v"), {"v": version}).first():
+                return False
+
+            print(f"Aplicando migración {version:04d}_{nombre} (sin transacción)...")
+            # Un CREATE INDEX CONCURRENTLY que falló deja el índice INVALID y el
+            # IF NOT EXISTS lo saltaría al reintentar: se borran antes.
+            invalidos = conn.execute(text(
+                "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE NOT i.indisvalid AND c.relname = ANY(:nombres)"
+            ), {"nombres": _INDICE_CONCURRENTE.findall(sql)}).scalars().all()
+            for indice in invalidos:
+                conn.exec_driver_sql(f'DROP INDEX CONCURRENTLY IF EXISTS "{indice}"')
+
+            for sentencia in _sentencias(sql):
+                _ejecutar_script(conn, sentencia)
+            conn.execute(
+                text("INSERT INTO schema_migracion (version, nombre) VALUES (:v, :n)"),
+                {"v": version, "n": nombre},
+            )
+            return True
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _LOCK_MIGRACIONES})
+
+
+def _aplicar_en_transaccion(engine: Engine, version: int, nombre: str, sql: str) -> bool:
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _LOCK_MIGRACIONES})
+        if conn.execute(text("SELECT 1 FROM schema_migracion WHERE version = :v"), {"v": version}).first():
+            return False
+
+        print(f"Aplicando migración {version:04d}_{nombre}...")
+        _ejecutar_script(conn, sql)
+        conn.execute(
+            text("INSERT INTO schema_migracion (version, nombre) VALUES (:v, :n)"),
+            {"v": version, "n": nombre},
+        )
+        return True
+
+
+def aplicar_migraciones(engine: Engine) -> list[str]:
+    """
+    Aplica, en orden, las migraciones que aún no figuran en `schema_migracion`.
+
+    Cada migración corre en su propia transacción (o sentencia por sentencia si
+    está marcada como sin-transaccion). Si una falla, la excepción se propaga y
+    no se aplican las siguientes. Devuelve los nombres de las migraciones aplicadas.
+    """
+    _crear_tabla_control(engine)
+
+    aplicadas = []
+    for version, nombre, ruta in listar_migraciones():
+        sql = ruta.read_text(encoding="utf-8")
+        if sql.startswith(_SIN_TRANSACCION):
+            aplicada = _aplicar_sin_transaccion(engine, version, nombre, sql)
+        else:
+            aplicada = _aplicar_en_transaccion(engine, version, nombre, sql)
+        if aplicada:
+            aplicadas.append(f"{version:04d}_{nombre}")
+    return aplicadas
+
+
+if __name__ == "__main__":
+    # Uso: python -m src.util.util_migraciones  (paso de despliegue, antes de uvicorn)
+    from src.util import util_base_de_datos as db
+
+    pendientes = aplicar_migraciones(db.engine)
+    print(f"Migraciones aplicadas: {pendientes or 'ninguna pendiente'}")
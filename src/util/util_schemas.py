@@ -1,6 +1,6 @@
 # src/util_schemas.py
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 import uuid
 import datetime
 
@@ -73,6 +73,10 @@ class AnalystMessage(BaseModel):
     role: str
     content: str
 
+class AnalystConversationPage(BaseModel):
+    items: List[AnalystMessage]
+    next_cursor: Optional[int] = None
+
 class AnalystTicketItem(BaseModel):
     id_ticket: int
     subject: str
@@ -81,12 +85,34 @@ class AnalystTicketItem(BaseModel):
     status: Optional[str] = None
     date: Optional[str] = None  # ISO o dd/mm/aaaa
     updated_at: Optional[datetime.datetime] = None
+    due_at: Optional[datetime.datetime] = None
+    level: Optional[str] = None
+    escalation_reason: Optional[str] = None
 
 class AnalystTicketPage(BaseModel):
     items: List[AnalystTicketItem]
     total: int
     limit: int
     offset: int
+    next_cursor: Optional[str] = Field(None, description="Cursor para pedir la página siguiente (keyset)")
+
+class AnalystSearchFacets(BaseModel):
+    estado: Dict[str, int] = Field(default_factory=dict)
+    nivel: Dict[str, int] = Field(default_factory=dict)
+    service: Dict[str, int] = Field(default_factory=dict)
+    company: Dict[str, int] = Field(default_factory=dict)
+
+class AnalystTicketSearchPage(BaseModel):
+    items: List[AnalystTicketItem]
+    total: int
+    limit: int
+    next_cursor: Optional[str] = None
+    facets: AnalystSearchFacets
+
+class AnalystSummary(BaseModel):
+    total: int
+    por_estado: Dict[str, int] = Field(default_factory=dict)
+    por_nivel: Dict[str, int] = Field(default_factory=dict)
 
 class AnalystTicketDetail(BaseModel):
     id_ticket: int
@@ -99,7 +125,11 @@ class AnalystTicketDetail(BaseModel):
     date: Optional[str] = None
     status: Optional[str] = None
     conversation: List[AnalystMessage]
+    conversation_cursor: Optional[int] = Field(
+        None, description="Si hay mensajes anteriores, valor para ?antes= en /conversaciones/{id}/mensajes"
+    )
     updated_at: Optional[datetime.datetime] = Field(None, description="Fecha de la última actualización del ticket")
+    due_at: Optional[datetime.datetime] = Field(None, description="Fecha límite de atención según el nivel (SLA)")
     level: Optional[str] = None
     description: Optional[str] = None
     escalation_reason: Optional[str] = None
@@ -113,4 +143,48 @@ class DerivarTicketRequest(BaseModel):
 class UpdateTicketStatusRequest(BaseModel):
     status: str
     description: Optional[str] = None
-    level: Optional[str] = None
\ No newline at end of file
+    level: Optional[str] = None
+    expected_updated_at: Optional[datetime.datetime] = Field(
+        None, description="updated_at que el cliente vio; si el ticket cambió desde entonces se responde 409."
+    )
+
+# === Esquemas para operaciones masivas del analista ===
+class BulkTicketRequest(BaseModel):
+    ticket_ids: List[int] = Field(..., min_length=1, max_length=200)
+    status: Optional[str] = None
+    level: Optional[str] = None
+    description: Optional[str] = None
+    motivo_derivacion: Optional[str] = Field(
+        None, min_length=10, description="Si viene, deriva los tickets a analistas de nivel superior."
+    )
+
+class BulkTicketResult(BaseModel):
+    id_ticket: int
+    ok: bool
+    error: Optional[str] = None
+    status: Optional[str] = None
+    level: Optional[str] = None
+    updated_at: Optional[datetime.datetime] = None
+    derivado_a: Optional[uuid.UUID] = None
+
+class BulkTicketResponse(BaseModel):
+    actualizados: int
+    results: List[BulkTicketResult]
+
+# === Esquemas para Analítica ===
+
+class AnalyticsGroup(BaseModel):
+    clave: str
+    creados: int
+    cerrados: int
+    escalados: int
+    cumplimiento_sla: Optional[float] = Field(None, description="Cerrados dentro del SLA / cerrados")
+    tiempo_medio_cierre_horas: Optional[float] = None
+    tasa_escalamiento: Optional[float] = Field(None, description="Creados que fueron derivados / creados")
+
+class AnalyticsResponse(BaseModel):
+    desde: datetime.date
+    hasta: datetime.date
+    agrupar: str
+    grupos: List[AnalyticsGroup]
+    totales: AnalyticsGroup
@@ -0,0 +1,28 @@
+# src/util/util_sla.py
+import datetime
+from typing import Optional
+
+# Tiempos de atención por nivel (los mismos que conoce el agente en su prompt)
+SLA_POR_NIVEL = {
+    "crítico": datetime.timedelta(hours=4),
+    "alto": datetime.timedelta(days=1),
+    "medio": datetime.timedelta(days=2),
+    "bajo": datetime.timedelta(days=4),
+}
+
+# Estados en los que el SLA sigue corriendo
+ESTADOS_ABIERTOS = ("aceptado", "en atención")
+
+# Un ticket abierto está "en riesgo" si vence dentro de esta ventana
+VENTANA_RIESGO = datetime.timedelta(hours=2)
+
+
+def calcular_vencimiento(nivel: str, desde: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+    """
+    Devuelve la fecha límite de atención (due_at) para un ticket del nivel dado,
+    contada desde su creación. None si el nivel no tiene SLA definido.
+    """
+    plazo = SLA_POR_NIVEL.get(nivel)
+    if plazo is None or desde is None:
+        return None
+    return desde + plazo
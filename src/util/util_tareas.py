@@ -0,0 +1,253 @@
+# src/util/util_tareas.py
+"""
+Cola de tareas diferidas con outbox durable.
+
+- `encolar` inserta la tarea en `outbox_tarea` dentro de la transacción actual:
+  si la mutación hace commit la tarea queda guardada; si hace rollback, no existe.
+- `TrabajadorTareas` corre en un hilo del proceso. Toma lotes con
+  FOR UPDATE SKIP LOCKED (varios workers no se pisan) y un "lease": si el proceso
+  cae a mitad de una tarea, vuelve a estar disponible al vencer el lease.
+- Cada tarea se ejecuta en su propia transacción junto con su marca de 'hecho',
+  así los manejadores que solo escriben en la BD se aplican exactamente una vez.
+- Si falla se reintenta con backoff exponencial hasta MAX_INTENTOS ('fallido').
+- Las tareas 'hecho' se borran por lotes pasado RETENCION_SEGUNDOS (las
+  'fallido' se conservan para revisarlas).
+
+Los manejadores se registran por tipo con el decorador `manejador`. Los jobs
+periódicos (p. ej. la purga del outbox) se registran con `periodica`; el mismo
+trabajador los corre y `tarea_periodica` garantiza que, con varios procesos,
+cada uno se ejecute una sola vez por intervalo.
+"""
+import json
+import time
+import threading
+from typing import Callable
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+MAX_INTENTOS = 8
+LEASE_SEGUNDOS = 60
+BACKOFF_MAX_SEGUNDOS = 300
+TAMANO_LOTE = 20
+ESPERA_SEGUNDOS = 2.0          # sondeo cuando no hay aviso de tareas nuevas
+RETENCION_SEGUNDOS = 7 * 24 * 3600   # cuánto se conservan las tareas 'hecho'
+LOTE_PURGA = 5000
+PURGA_CADA_SEGUNDOS = 3600
+REVISION_PERIODICAS_SEGUNDOS = 30    # cada cuánto se consulta si toca algún job periódico
+_NUEVAS = "tareas_nuevas"
+
+_MANEJADORES: dict[str, Callable[[Session, dict], None]] = {}
+# nombre -> (cada_segundos, f(db_session))
+_PERIODICAS: dict[str, tuple[float, Callable[[Session], None]]] = {}
+
+
+def manejador(tipo: str):
+    """Registra la función que procesa las tareas de `tipo`: f(db_session, payload)."""
+    def registrar(funcion):
+        _MANEJADORES[tipo] = funcion
+        return funcion
+    return registrar
+
+
+def encolar(db_session: Session, tipo: str, payload: dict) -> None:
+    """Agrega una tarea al outbox en la transacción actual (no hace commit)."""
+    db_session.execute(
+        text("INSERT INTO outbox_tarea (tipo, payload) VALUES (:tipo, CAST(:payload AS jsonb))"),
+        {"tipo": tipo, "payload": json.dumps(payload, default=str)},
+    )
+    db_session.info[_NUEVAS] = True
+
+
+def periodica(nombre: str, cada_segundos: float):
+    """
+    Registra un job que el trabajador corre cada `cada_segundos`: f(db_session).
+    El job hace su propio commit.
+    """
+    def registrar(funcion):
+        _PERIODICAS[nombre] = (cada_segundos, funcion)
+        return funcion
+    return registrar
+
+
+_SQL_TOMAR = text("""
+    UPDATE outbox_tarea
+    SET intentos = intentos + 1,
+        disponible_en = now() + make_interval(secs => :lease)
+    WHERE id_tarea IN (
+        SELECT id_tarea FROM outbox_tarea
+        WHERE estado = 'pendiente' AND disponible_en <= now()
+        ORDER BY disponible_en, id_tarea
+        LIMIT :lote
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id_tarea, tipo, payload, intentos
+""")
+
+# Reclama el turno de un job periódico: devuelve fila solo si nunca corrió o ya venció
+_SQL_TURNO_PERIODICA = text("""
+    INSERT INTO tarea_periodica (nombre, proxima_en)
+    VALUES (:nombre, now() + make_interval(secs => :cada))
+    ON CONFLICT (nombre) DO UPDATE SET proxima_en = EXCLUDED.proxima_en
+    WHERE tarea_periodica.proxima_en <= now()
+    RETURNING nombre
+""")
+
+_SQL_PURGAR = text("""
+    DELETE FROM outbox_tarea
+    WHERE id_tarea IN (
+        SELECT id_tarea FROM outbox_tarea
+        WHERE estado = 'hecho' AND procesado_en < now() - make_interval(secs => :retencion)
+        ORDER BY procesado_en
+        LIMIT :lote
+        FOR UPDATE SKIP LOCKED
+    )
+""")
+
+
+def purgar_hechas(db_session: Session, retencion: float = RETENCION_SEGUNDOS, lote: int = LOTE_PURGA) -> int:
+    """
+    Borra las tareas 'hecho' procesadas hace más de `retencion` segundos, en lotes
+    de `lote` con un commit por lote (no retiene locks largos). Devuelve cuántas borró.
+    """
+    borradas = 0
+    while True:
+        n = db_session.execute(_SQL_PURGAR, {"retencion": retencion, "lote": lote}).rowcount
+        db_session.commit()
+        borradas += n
+        if n < lote:
+            return borradas
+
+
+@periodica("purgar_outbox", PURGA_CADA_SEGUNDOS)
+def _purgar_outbox(db_session: Session) -> None:
+    borradas = purgar_hechas(db_session)
+    if borradas:
+        print(f"Outbox: {borradas} tareas hechas purgadas.")
+
+
+class TrabajadorTareas:
+
+    def __init__(self, lote: int = TAMANO_LOTE, espera: float = ESPERA_SEGUNDOS):
+        self.lote = lote
+        self.espera = espera
+        self._hilo = None
+        self._detener = threading.Event()
+        self._aviso = threading.Event()
+        self._revisar_periodicas_en: dict[str, float] = {}
+
+    # --- Ciclo de vida ---
+    def iniciar(self) -> None:
+        if self._hilo and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="trabajador-tareas", daemon=True)
+        self._hilo.start()
+
+    def detener(self) -> None:
+        self._detener.set()
+        self._aviso.set()
+
+    def despertar(self) -> None:
+        """Avisa que hay tareas nuevas (evita esperar al próximo sondeo)."""
+        self._aviso.set()
+
+    def _bucle(self) -> None:
+        while not self._detener.is_set():
+            try:
+                procesadas = self.procesar_lote()
+            except Exception as e:
+                print(f"Error en el trabajador de tareas: {e}")
+                procesadas = 0
+            self.ejecutar_periodicas()
+            if not procesadas:
+                self._aviso.wait(self.espera)
+                self._aviso.clear()
+
+    # --- Procesamiento ---
+    def tomar(self, engine) -> list:
+        """Reclama hasta `lote` tareas disponibles con un lease de LEASE_SEGUNDOS."""
+        with Session(engine) as session:
+            tareas = session.execute(_SQL_TOMAR, {"lease": LEASE_SEGUNDOS, "lote": self.lote}).mappings().all()
+            session.commit()
+        return tareas
+
+    def procesar_lote(self) -> int:
+        """Toma y ejecuta un lote de tareas disponibles. Devuelve cuántas tomó."""
+        from src.util import util_base_de_datos as db
+
+        tareas = self.tomar(db.engine)
+        for tarea in tareas:
+            self._ejecutar(db.engine, tarea)
+        return len(tareas)
+
+    def ejecutar_periodicas(self) -> list[str]:
+        """
+        Corre los jobs periódicos a los que les toca turno. Devuelve los nombres ejecutados.
+        Cada proceso consulta a lo sumo cada REVISION_PERIODICAS_SEGUNDOS por job; el
+        turno se reclama en la BD, así que entre todos los procesos corre una sola vez.
+        """
+        from src.util import util_base_de_datos as db
+
+        ejecutadas = []
+        ahora = time.monotonic()
+        for nombre, (cada, funcion) in list(_PERIODICAS.items()):
+            if self._revisar_periodicas_en.get(nombre, 0.0) > ahora:
+                continue
+            self._revisar_periodicas_en[nombre] = ahora + min(cada, REVISION_PERIODICAS_SEGUNDOS)
+            with Session(db.engine) as session:
+                try:
+                    turno = session.execute(_SQL_TURNO_PERIODICA, {"nombre": nombre, "cada": cada}).first()
+                    session.commit()
+                    if turno:
+                        funcion(session)
+                        ejecutadas.append(nombre)
+                except Exception as e:
+                    session.rollback()
+                    print(f"Job periódico '{nombre}' falló: {e}")
+        return ejecutadas
+
+    def _ejecutar(self, engine, tarea) -> None:
+        with Session(engine) as session:
+            try:
+                funcion = _MANEJADORES.get(tarea["tipo"])
+                if not funcion:
+                    raise LookupError(f"No hay manejador para el tipo '{tarea['tipo']}'.")
+                funcion(session, tarea["payload"])
+                session.execute(
+                    text("UPDATE outbox_tarea SET estado = 'hecho', procesado_en = now(), ultimo_error = NULL"
+                         " WHERE id_tarea = :id"),
+                    {"id": tarea["id_tarea"]},
+                )
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                agotada = tarea["intentos"] >= MAX_INTENTOS
+                print(f"Tarea {tarea['id_tarea']} ({tarea['tipo']}) falló en el intento {tarea['intentos']}: {e}")
+                session.execute(
+                    text("UPDATE outbox_tarea SET estado = :estado, ultimo_error = :error,"
+                         " disponible_en = now() + make_interval(secs => :espera)"
+                         " WHERE id_tarea = :id"),
+                    {
+                        "estado": "fallido" if agotada else "pendiente",
+                        "error": str(e)[:2000],
+                        "espera": min(2 ** tarea["intentos"], BACKOFF_MAX_SEGUNDOS),
+                        "id": tarea["id_tarea"],
+                    },
+                )
+                session.commit()
+
+
+# Instancia compartida por el proceso
+trabajador_tareas = TrabajadorTareas()
+
+
+@event.listens_for(Session, "after_commit")
+def _avisar_tareas_nuevas(db_session: Session) -> None:
+    if db_session.info.pop(_NUEVAS, False):
+        trabajador_tareas.despertar()
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_aviso(db_session: Session) -> None:
+    db_session.info.pop(_NUEVAS, None)
@@ -0,0 +1,225 @@
+# tests/conftest.py
+"""
+Configuración común de las pruebas.
+
+- Nunca se consulta Key Vault: util_keyvault se reemplaza por uno que lee los
+  secretos de variables de entorno.
+- Con TEST_DATABASE_URL (un Postgres descartable: se borra su esquema public)
+  se carga esquema_base.sql, se aplican las migraciones reales y corren también
+  las pruebas marcadas `postgres` (query count, EXPLAIN, keyset).
+- Sin TEST_DATABASE_URL se usa un SQLite temporal con esquema_sqlite.sql y las
+  pruebas `postgres` se saltan.
+
+    TEST_DATABASE_URL=postgresql+psycopg2://postgres@/soporte_test?host=/tmp/pg python -m pytest -q
+"""
+import os
+import sys
+import uuid
+import types
+import sqlite3
+import datetime
+import tempfile
+import contextlib
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, event, insert, text
+
+DIR_PRUEBAS = Path(__file__).resolve().parent
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+ES_POSTGRES = bool(TEST_DATABASE_URL)
+
+# --- Secretos sin Key Vault ---
+_keyvault = types.ModuleType("src.util.util_keyvault")
+_keyvault.getkeyapi = lambda nombre: os.getenv(nombre.replace("-", "_"), "test")
+sys.modules["src.util.util_keyvault"] = _keyvault
+
+
+def _preparar_postgres(url: str) -> None:
+    from src.util import util_migraciones
+
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA public CASCADE"))
+        conn.execute(text("CREATE SCHEMA public"))
+        conn.exec_driver_sql((DIR_PRUEBAS / "esquema_base.sql").read_text(encoding="utf-8"))
+    util_migraciones.aplicar_migraciones(engine)
+    engine.dispose()
+
+
+def _preparar_sqlite() -> str:
+    ruta = Path(tempfile.mkdtemp(prefix="soporte_pruebas_")) / "soporte.db"
+    with contextlib.closing(sqlite3.connect(ruta)) as conn:
+        conn.executescript((DIR_PRUEBAS / "esquema_sqlite.sql").read_text(encoding="utf-8"))
+    # Los uuid se guardan como texto hex, igual que SQLAlchemy compara un uuid.UUID en SQLite
+    sqlite3.register_adapter(uuid.UUID, lambda u: u.hex)
+    return f"sqlite:///{ruta}"
+
+
+# util_base_de_datos refleja el esquema al importarse: la base debe estar lista antes
+if ES_POSTGRES:
+    _preparar_postgres(TEST_DATABASE_URL)
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+else:
+    os.environ["DATABASE_URL"] = _preparar_sqlite()
+
+from src.util import util_base_de_datos as db  # noqa: E402
+
+# Hijas antes que padres, para borrar sin violar FKs
+TABLAS = [
+    "conversacion_mensaje", "conversacion", "escalado", "contador_analista", "bandeja_version",
+    "ticket", "external", "analista", "colaborador", "cliente_servicio", "cliente_dominio",
+    "servicio", "cliente", "persona",
+]
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "postgres: requiere TEST_DATABASE_URL (Postgres)")
+
+
+def pytest_collection_modifyitems(config, items):
+    if ES_POSTGRES:
+        return
+    saltar = pytest.mark.skip(reason="requiere TEST_DATABASE_URL (Postgres)")
+    for item in items:
+        if "postgres" in item.keywords:
+            item.add_marker(saltar)
+
+
+def limpiar_bd() -> None:
+    with db.engine.begin() as conn:
+        if ES_POSTGRES:
+            tablas = TABLAS + ["outbox_tarea", "tarea_periodica", "rollup_ticket_diario", "rollup_marca"]
+            conn.execute(text(f"TRUNCATE {', '.join(tablas)} RESTART IDENTITY CASCADE"))
+        else:
+            for tabla in TABLAS:
+                conn.execute(text(f"DELETE FROM {tabla}"))
+
+
+@pytest.fixture
+def sesion():
+    """Sesión sobre la base de pruebas; al terminar se vacían las tablas."""
+    from sqlalchemy.orm import Session
+
+    s = Session(db.engine)
+    try:
+        yield s
+    finally:
+        s.rollback()
+        s.close()
+        limpiar_bd()
+
+
+# =======================================================================
+# Datos de prueba
+# =======================================================================
+
+class Semilla:
+    """Crea clientes, colaboradores, analistas y tickets con inserts en bloque."""
+
+    NIVELES = ["bajo", "medio", "alto", "crítico"]
+    ESTADOS = ["aceptado", "en atención", "finalizado"]
+
+    def __init__(self, s):
+        self.s = s
+
+    def _persona(self, nombre: str, correo: str) -> uuid.UUID:
+        id_persona = uuid.uuid4()
+        self.s.execute(insert(db.Persona), [{"id_persona": id_persona}])
+        self.s.execute(insert(db.External), [{
+            "id_external": uuid.uuid4(), "id_persona": id_persona, "provider": "google",
+            "id_provider": str(id_persona), "correo": correo, "nombre": nombre, "hd": None,
+        }])
+        return id_persona
+
+    def cliente_servicio(self, cliente: str = "Acme", servicio: str = "Analítica") -> tuple[uuid.UUID, uuid.UUID]:
+        id_cliente, id_servicio, id_cs = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        self.s.execute(insert(db.Cliente), [{"id_cliente": id_cliente, "nombre": cliente}])
+        self.s.execute(insert(db.Servicio), [{"id_servicio": id_servicio, "nombre": servicio}])
+        self.s.execute(insert(db.ClienteServicio), [
+            {"id_cliente_servicio": id_cs, "id_cliente": id_cliente, "id_servicio": id_servicio}
+        ])
+        return id_cliente, id_cs
+
+    def colaborador(self, id_cliente, nombre: str = "Carla Cliente") -> uuid.UUID:
+        id_colaborador = uuid.uuid4()
+        id_persona = self._persona(nombre, f"{id_colaborador.hex[:8]}@acme.test")
+        self.s.execute(insert(db.Colaborador), [
+            {"id_colaborador": id_colaborador, "id_persona": id_persona, "id_cliente": id_cliente}
+        ])
+        return id_colaborador
+
+    def analista(self, nivel: int = 1, nombre: str = "Ana Lista") -> uuid.UUID:
+        id_analista = uuid.uuid4()
+        id_persona = self._persona(nombre, f"{id_analista.hex[:8]}@soporte.test")
+        self.s.execute(insert(db.Analista), [{"id_analista": id_analista, "id_persona": id_persona, "nivel": nivel}])
+        return id_analista
+
+    def tickets(self, n: int, id_colaborador, id_cs, id_analista=None, asuntos=None, lote: int = 5000) -> None:
+        """`n` tickets repartidos en niveles y estados, con updated_at distintos."""
+        base = datetime.datetime(2025, 1, 1)
+        filas = []
+        for i in range(n):
+            filas.append({
+                "asunto": asuntos[i % len(asuntos)] if asuntos else f"Ticket de prueba {i}",
+                "tipo": "incidencia",
+                "nivel": self.NIVELES[i % len(self.NIVELES)],
+                "estado": self.ESTADOS[i % len(self.ESTADOS)],
+                "id_colaborador": id_colaborador,
+                "id_cliente_servicio": id_cs,
+                "id_analista": id_analista,
+                "created_at": base + datetime.timedelta(minutes=i),
+                "updated_at": base + datetime.timedelta(minutes=i),
+                "due_at": base + datetime.timedelta(days=1, minutes=i),
+            })
+            if len(filas) == lote:
+                self.s.execute(insert(db.Ticket), filas)
+                filas = []
+        if filas:
+            self.s.execute(insert(db.Ticket), filas)
+
+    def escalado(self, id_ticket: int, motivo: str, solicitante=None, derivado=None) -> None:
+        self.s.execute(insert(db.Escalado), [{
+            "id_ticket": id_ticket, "motivo": motivo,
+            "id_analista_solicitante": solicitante, "id_analista_derivado": derivado,
+        }])
+
+    def mensajes(self, id_ticket: int, n: int) -> None:
+        self.s.execute(insert(db.ConversacionMensaje), [
+            {"id_ticket": id_ticket, "secuencia": i, "rol": "user" if i % 2 else "agent", "contenido": f"mensaje {i}"}
+            for i in range(1, n + 1)
+        ])
+
+    def contadores(self) -> None:
+        """Reconstruye contador_analista desde ticket (lo que hace la migración 0004)."""
+        self.s.execute(text(
+            "INSERT INTO contador_analista (id_analista, estado, nivel, total) "
+            "SELECT id_analista, estado, nivel, count(*) FROM ticket "
+            "WHERE id_analista IS NOT NULL GROUP BY id_analista, estado, nivel"
+        ))
+
+
+@pytest.fixture
+def semilla(sesion):
+    return Semilla(sesion)
+
+
+@contextlib.contextmanager
+def _contar_queries():
+    """Junta los SQL que llegan al driver dentro del bloque (uno por round trip)."""
+    sentencias = []
+
+    def _registrar(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", _registrar)
+    try:
+        yield sentencias
+    finally:
+        event.remove(db.engine, "before_cursor_execute", _registrar)
+
+
+@pytest.fixture
+def contar_queries():
+    """`with contar_queries() as sentencias:` registra cada SQL enviado a la base."""
+    return _contar_queries
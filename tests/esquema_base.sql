@@ -0,0 +1,79 @@
+-- Esquema base (previo a src/migraciones) para la base local de pruebas.
+-- Refleja las tablas y columnas que usa la app; las migraciones se aplican encima.
+
+CREATE TABLE persona (
+    id_persona uuid PRIMARY KEY DEFAULT gen_random_uuid()
+);
+
+CREATE TABLE cliente (
+    id_cliente uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    nombre text NOT NULL
+);
+
+CREATE TABLE cliente_dominio (
+    id_cliente_dominio uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    id_cliente uuid NOT NULL REFERENCES cliente (id_cliente),
+    dominio text NOT NULL
+);
+
+CREATE TABLE servicio (
+    id_servicio uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    nombre text NOT NULL
+);
+
+CREATE TABLE cliente_servicio (
+    id_cliente_servicio uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    id_cliente uuid NOT NULL REFERENCES cliente (id_cliente),
+    id_servicio uuid NOT NULL REFERENCES servicio (id_servicio)
+);
+
+CREATE TABLE colaborador (
+    id_colaborador uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    id_persona uuid NOT NULL REFERENCES persona (id_persona),
+    id_cliente uuid NOT NULL REFERENCES cliente (id_cliente)
+);
+
+CREATE TABLE analista (
+    id_analista uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    id_persona uuid NOT NULL REFERENCES persona (id_persona),
+    nivel integer NOT NULL DEFAULT 1
+);
+
+CREATE TABLE external (
+    id_external uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    id_persona uuid NOT NULL REFERENCES persona (id_persona),
+    provider text NOT NULL,
+    id_provider text NOT NULL,
+    correo text,
+    nombre text,
+    hd text
+);
+
+CREATE TABLE ticket (
+    id_ticket serial PRIMARY KEY,
+    asunto text NOT NULL,
+    tipo text,
+    nivel text,
+    estado text,
+    diagnostico text,
+    id_colaborador uuid REFERENCES colaborador (id_colaborador),
+    id_cliente_servicio uuid REFERENCES cliente_servicio (id_cliente_servicio),
+    id_analista uuid REFERENCES analista (id_analista),
+    created_at timestamp NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+    updated_at timestamp NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+    closed_at timestamp
+);
+
+CREATE TABLE conversacion (
+    id_conversacion serial PRIMARY KEY,
+    id_ticket integer REFERENCES ticket (id_ticket),
+    contenido json
+);
+
+CREATE TABLE escalado (
+    id_escalado serial PRIMARY KEY,
+    id_ticket integer NOT NULL REFERENCES ticket (id_ticket),
+    id_analista_solicitante uuid REFERENCES analista (id_analista),
+    id_analista_derivado uuid REFERENCES analista (id_analista),
+    motivo text
+);
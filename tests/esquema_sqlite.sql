@@ -0,0 +1,96 @@
+-- Esquema mínimo en SQLite para las pruebas sin Postgres: las tablas que mapea
+-- util_base_de_datos, con los uuid como texto. Cubre los caminos con fallback en
+-- memoria (búsqueda por asunto, índice de asignación); lo específico de Postgres
+-- (LATERAL, DISTINCT ON, EXPLAIN) se prueba solo con TEST_DATABASE_URL.
+
+CREATE TABLE persona (id_persona TEXT PRIMARY KEY);
+
+CREATE TABLE cliente (id_cliente TEXT PRIMARY KEY, nombre TEXT NOT NULL);
+
+CREATE TABLE cliente_dominio (
+    id_cliente_dominio TEXT PRIMARY KEY,
+    id_cliente TEXT NOT NULL REFERENCES cliente (id_cliente),
+    dominio TEXT NOT NULL
+);
+
+CREATE TABLE servicio (id_servicio TEXT PRIMARY KEY, nombre TEXT NOT NULL);
+
+CREATE TABLE cliente_servicio (
+    id_cliente_servicio TEXT PRIMARY KEY,
+    id_cliente TEXT NOT NULL REFERENCES cliente (id_cliente),
+    id_servicio TEXT NOT NULL REFERENCES servicio (id_servicio)
+);
+
+CREATE TABLE colaborador (
+    id_colaborador TEXT PRIMARY KEY,
+    id_persona TEXT NOT NULL REFERENCES persona (id_persona),
+    id_cliente TEXT NOT NULL REFERENCES cliente (id_cliente)
+);
+
+CREATE TABLE analista (
+    id_analista TEXT PRIMARY KEY,
+    id_persona TEXT NOT NULL REFERENCES persona (id_persona),
+    nivel INTEGER NOT NULL DEFAULT 1
+);
+
+CREATE TABLE external (
+    id_external TEXT PRIMARY KEY,
+    id_persona TEXT NOT NULL REFERENCES persona (id_persona),
+    provider TEXT NOT NULL,
+    id_provider TEXT NOT NULL,
+    correo TEXT,
+    nombre TEXT,
+    hd TEXT
+);
+
+CREATE TABLE ticket (
+    id_ticket INTEGER PRIMARY KEY,
+    asunto TEXT NOT NULL,
+    tipo TEXT,
+    nivel TEXT,
+    estado TEXT,
+    diagnostico TEXT,
+    id_colaborador TEXT REFERENCES colaborador (id_colaborador),
+    id_cliente_servicio TEXT REFERENCES cliente_servicio (id_cliente_servicio),
+    id_analista TEXT REFERENCES analista (id_analista),
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    closed_at TIMESTAMP,
+    due_at TIMESTAMP
+);
+
+CREATE TABLE conversacion (
+    id_conversacion INTEGER PRIMARY KEY,
+    id_ticket INTEGER REFERENCES ticket (id_ticket),
+    contenido JSON
+);
+
+CREATE TABLE escalado (
+    id_escalado INTEGER PRIMARY KEY,
+    id_ticket INTEGER NOT NULL REFERENCES ticket (id_ticket),
+    id_analista_solicitante TEXT REFERENCES analista (id_analista),
+    id_analista_derivado TEXT REFERENCES analista (id_analista),
+    motivo TEXT
+);
+
+CREATE TABLE contador_analista (
+    id_analista TEXT NOT NULL REFERENCES analista (id_analista),
+    estado TEXT NOT NULL,
+    nivel TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_analista, estado, nivel)
+);
+
+CREATE TABLE conversacion_mensaje (
+    id_ticket INTEGER NOT NULL REFERENCES ticket (id_ticket),
+    secuencia INTEGER NOT NULL,
+    rol TEXT NOT NULL,
+    contenido TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id_ticket, secuencia)
+);
+
+CREATE TABLE bandeja_version (
+    id_analista TEXT PRIMARY KEY REFERENCES analista (id_analista),
+    version INTEGER NOT NULL DEFAULT 0
+);
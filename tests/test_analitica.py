@@ -0,0 +1,179 @@
+# tests/test_analitica.py
+import random
+import datetime
+
+import pytest
+from sqlalchemy import insert, text
+
+from src.crud import crud_analitica, crud_contadores
+from src.util import util_tareas
+from src.util import util_base_de_datos as db
+
+pytestmark = pytest.mark.postgres
+
+D0 = datetime.datetime(2025, 2, 17)
+D1, D2, D3, D4, D5 = (datetime.datetime(2025, 3, d) for d in range(3, 8))
+HORA = datetime.timedelta(hours=1)
+
+
+def _ticket(sesion, id_colaborador, id_cs, nivel, creado, cerrado=None, vence=None, actualizado=None) -> int:
+    return sesion.execute(insert(db.Ticket).returning(db.Ticket.id_ticket), [{
+        "asunto": "rollup", "tipo": "incidencia", "nivel": nivel,
+        "estado": "finalizado" if cerrado else "aceptado",
+        "id_colaborador": id_colaborador, "id_cliente_servicio": id_cs,
+        "created_at": creado, "closed_at": cerrado, "due_at": vence,
+        "updated_at": actualizado or cerrado or creado,
+    }]).scalar_one()
+
+
+@pytest.fixture
+def historia(sesion, semilla):
+    """
+    t0 viejo y abierto; t1 abierto; t2 cerrado dentro del SLA; t3 cerrado fuera
+    del SLA. t3 es el último actualizado (D3 18:00).
+    """
+    id_cliente, id_cs = semilla.cliente_servicio()
+    id_colaborador = semilla.colaborador(id_cliente)
+    c = (sesion, id_colaborador, id_cs)
+    ids = {
+        "t0": _ticket(*c, "medio", D0),
+        "t1": _ticket(*c, "alto", D1 + 8 * HORA),
+        "t2": _ticket(*c, "alto", D1 + 9 * HORA, cerrado=D2 + 10 * HORA, vence=D2 + 12 * HORA),
+        "t3": _ticket(*c, "bajo", D2 + 9 * HORA, cerrado=D3 + 18 * HORA, vence=D3 + 9 * HORA),
+    }
+    sesion.commit()
+    return {"colaborador": id_colaborador, "cs": id_cs, **ids}
+
+
+def _rollup(sesion) -> dict:
+    sesion.rollback()
+    return {
+        (r.fecha, r.nivel): (r.creados, r.escalados, r.cerrados, r.cerrados_en_sla, r.segundos_cierre)
+        for r in sesion.execute(text("SELECT * FROM rollup_ticket_diario"))
+    }
+
+
+def _reconstruido(sesion) -> dict:
+    """El rollup que deja una reconstrucción completa (para comparar con el incremental)."""
+    antes = sesion.execute(text("SELECT * FROM rollup_marca")).mappings().one()
+    crud_analitica.actualizar_rollups(sesion, completo=True)
+    completo = _rollup(sesion)
+    sesion.execute(
+        text("UPDATE rollup_marca SET ultimo_updated_at = :u, ultimo_id_escalado = :e"),
+        {"u": antes["ultimo_updated_at"], "e": antes["ultimo_id_escalado"]},
+    )
+    sesion.commit()
+    return completo
+
+
+def test_marca_de_agua_recalcula_solo_los_dias_tocados(sesion, historia):
+    assert crud_analitica.actualizar_rollups(sesion) == 4   # D0..D3
+    marca = sesion.execute(text("SELECT ultimo_updated_at, ultimo_id_escalado FROM rollup_marca")).one()
+    assert tuple(marca) == (D3 + 18 * HORA, None)
+
+    # Sin cambios solo se repasa lo que cae en MARGEN_MARCA bajo la marca (t3: D2 y D3)
+    assert crud_analitica.actualizar_rollups(sesion) == 2
+
+    # Se cierra t1 en D4 y se deriva t2: se recalculan D1 (alta de ambos) y D4, no D0
+    sesion.execute(
+        text("UPDATE ticket SET estado = 'finalizado', closed_at = :c, updated_at = :c WHERE id_ticket = :id"),
+        {"c": D4 + 10 * HORA, "id": historia["t1"]},
+    )
+    sesion.execute(insert(db.Escalado), [{"id_ticket": historia["t2"], "motivo": "Escalar"}])
+    sesion.commit()
+    assert crud_analitica.actualizar_rollups(sesion) == 4   # D1, D4 y el margen (D2, D3)
+
+    # Un ticket que confirmó tarde con updated_at apenas bajo la marca no se pierde
+    tarde = D4 + 10 * HORA - datetime.timedelta(minutes=2)
+    _ticket(sesion, historia["colaborador"], historia["cs"], "bajo", D5, actualizado=tarde)
+    sesion.commit()
+    crud_analitica.actualizar_rollups(sesion)
+
+    incremental = _rollup(sesion)
+    assert incremental == _reconstruido(sesion)
+    assert incremental[(D1.date(), "alto")] == (2, 1, 0, 0, 0)
+    assert incremental[(D4.date(), "alto")][2] == 1
+    assert incremental[(D5.date(), "bajo")] == (1, 0, 0, 0, 0)
+
+
+def test_metricas_por_nivel_y_por_fecha(sesion, historia):
+    crud_analitica.actualizar_rollups(sesion)
+
+    por_nivel = crud_analitica.obtener_metricas(sesion, D1.date(), D3.date(), "nivel")
+
+    assert por_nivel["grupos"] == [
+        {"clave": "alto", "creados": 2, "cerrados": 1, "escalados": 0,
+         "cumplimiento_sla": 1.0, "tiempo_medio_cierre_horas": 25.0, "tasa_escalamiento": 0.0},
+        {"clave": "bajo", "creados": 1, "cerrados": 1, "escalados": 0,
+         "cumplimiento_sla": 0.0, "tiempo_medio_cierre_horas": 33.0, "tasa_escalamiento": 0.0},
+    ]
+    assert por_nivel["totales"] == {
+        "clave": "total", "creados": 3, "cerrados": 2, "escalados": 0,
+        "cumplimiento_sla": 0.5, "tiempo_medio_cierre_horas": 29.0, "tasa_escalamiento": 0.0,
+    }
+
+    # Un día sin cierres: los cocientes sobre cerrados quedan en None, no en 0
+    grupos = crud_analitica.obtener_metricas(sesion, D1.date(), D3.date(), "fecha")["grupos"]
+    d1, d3 = (next(g for g in grupos if g["clave"] == str(d.date())) for d in (D1, D3))
+    assert (d1["cumplimiento_sla"], d1["tiempo_medio_cierre_horas"]) == (None, None)
+    assert (d3["creados"], d3["tasa_escalamiento"]) == (0, None)
+
+
+def test_metricas_coinciden_con_agregar_los_tickets(sesion, semilla):
+    rng = random.Random(11)
+    servicios = [semilla.cliente_servicio("Acme", nombre) for nombre in ("Analítica", "Soporte BI", "Datos")]
+    colaboradores = {cs: semilla.colaborador(cliente) for cliente, cs in servicios}
+    esperado = {}
+    for _ in range(300):
+        cliente, cs = rng.choice(servicios)
+        creado = D1 + datetime.timedelta(minutes=rng.randrange(3 * 24 * 60))
+        cerrado = creado + datetime.timedelta(minutes=rng.randrange(1, 5000)) if rng.random() < 0.6 else None
+        vence = creado + datetime.timedelta(hours=rng.choice([4, 24, 72]))
+        _ticket(sesion, colaboradores[cs], cs, rng.choice(["bajo", "alto"]), creado, cerrado, vence)
+        e = esperado.setdefault(cs, [0, 0, 0, 0])   # creados, cerrados, en SLA, segundos
+        e[0] += 1
+        if cerrado:
+            e[1] += 1
+            e[2] += cerrado <= vence
+            e[3] += (cerrado - creado).total_seconds()
+    sesion.commit()
+    crud_analitica.actualizar_rollups(sesion)
+
+    # El rango de fechas abarca todos los cierres (a lo sumo ~3,5 días después del alta)
+    metricas = crud_analitica.obtener_metricas(sesion, D0.date(), D5.date() + datetime.timedelta(days=7), "servicio")
+
+    nombres = {cs: n for (_, cs), n in zip(servicios, ("Analítica", "Soporte BI", "Datos"))}
+    por_servicio = {g["clave"]: g for g in metricas["grupos"]}
+    for cs, (creados, cerrados, en_sla, segundos) in esperado.items():
+        g = por_servicio[nombres[cs]]
+        assert (g["creados"], g["cerrados"]) == (creados, cerrados)
+        assert g["cumplimiento_sla"] == round(en_sla / cerrados, 4)
+        assert g["tiempo_medio_cierre_horas"] == round(segundos / cerrados / 3600, 4)
+    assert metricas["totales"]["creados"] == 300
+
+
+def test_metricas_sin_filas(sesion):
+    metricas = crud_analitica.obtener_metricas(sesion, D1.date(), D3.date(), "cliente")
+
+    assert metricas == {"grupos": [], "totales": {
+        "clave": "total", "creados": 0, "cerrados": 0, "escalados": 0,
+        "cumplimiento_sla": None, "tiempo_medio_cierre_horas": None, "tasa_escalamiento": None,
+    }}
+    # Un rollup sin tickets tampoco falla
+    assert crud_analitica.actualizar_rollups(sesion) == 0
+
+
+def test_el_trabajador_corre_rollups_y_reconciliacion(sesion, semilla, historia):
+    assert util_tareas._PERIODICAS["actualizar_rollups"][0] == crud_analitica.ROLLUP_CADA_SEGUNDOS
+    assert util_tareas._PERIODICAS["reconciliar_contadores"][0] == crud_contadores.RECONCILIAR_CADA_SEGUNDOS
+    id_analista = semilla.analista(1)
+    sesion.execute(text("UPDATE ticket SET id_analista = :a"), {"a": id_analista})
+    sesion.commit()
+
+    ejecutadas = util_tareas.TrabajadorTareas().ejecutar_periodicas()
+
+    assert {"actualizar_rollups", "reconciliar_contadores"} <= set(ejecutadas)
+    assert len(_rollup(sesion)) == 5
+    totales = sesion.execute(text("SELECT sum(total) FROM contador_analista WHERE id_analista = :a"),
+                             {"a": id_analista}).scalar()
+    assert totales == 4
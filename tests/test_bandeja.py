@@ -0,0 +1,146 @@
+# tests/test_bandeja.py
+import os
+import time
+import statistics
+
+import pytest
+from sqlalchemy import select, text
+
+from src.crud import crud_analista
+from src.util import util_base_de_datos as db
+from src.util import util_schemas as sch
+
+pytestmark = pytest.mark.postgres
+
+
+@pytest.fixture
+def bandeja(sesion, semilla):
+    """Un analista con 120 tickets de dos colaboradores; algunos derivados."""
+    id_cliente, id_cs = semilla.cliente_servicio("Acme", "Analítica")
+    id_otro_cliente, id_otro_cs = semilla.cliente_servicio("Globex", "Soporte BI")
+    id_analista = semilla.analista(1)
+    semilla.tickets(60, semilla.colaborador(id_cliente, "Carla"), id_cs, id_analista)
+    semilla.tickets(60, semilla.colaborador(id_otro_cliente, "Bruno"), id_otro_cs, id_analista)
+    ids = sesion.execute(select(db.Ticket.id_ticket).order_by(db.Ticket.id_ticket)).scalars().all()
+    for id_ticket in ids[::10]:
+        semilla.escalado(id_ticket, "motivo viejo")
+        semilla.escalado(id_ticket, f"motivo {id_ticket}")
+    semilla.contadores()
+    sesion.commit()
+    return id_analista
+
+
+@pytest.mark.parametrize("tamano", [5, 50, 100])
+def test_hidratar_pagina_con_queries_constantes(sesion, bandeja, contar_queries, tamano):
+    rows, _, _ = crud_analista.get_tickets_by_analyst(sesion, bandeja, limit=tamano)
+
+    with contar_queries() as sentencias:
+        items = crud_analista.hydrate_ticket_page(sesion, rows)
+
+    # colaboradores + servicios + último escalado, sin importar el tamaño de página
+    assert len(sentencias) == 3
+    assert len(items) == tamano
+
+
+def test_pagina_trae_nivel_y_motivo_del_ultimo_escalado(sesion, bandeja):
+    rows, _, _ = crud_analista.get_tickets_by_analyst(sesion, bandeja, limit=120)
+    items = [sch.AnalystTicketItem(**i) for i in crud_analista.hydrate_ticket_page(sesion, rows)]
+
+    derivados = [i for i in items if i.escalation_reason]
+    assert len(derivados) == 12
+    assert all(i.escalation_reason == f"motivo {i.id_ticket}" for i in derivados)
+    assert {i.level for i in items} == {"bajo", "medio", "alto", "crítico"}
+    assert {i.user for i in items} == {"Carla", "Bruno"}
+    assert {i.service for i in items} == {"Analítica", "Soporte BI"}
+
+
+def test_keyset_recorre_todo_en_el_mismo_orden_que_offset(sesion, bandeja):
+    vistos, cursor = [], None
+    while True:
+        rows, total, cursor = crud_analista.get_tickets_by_analyst(sesion, bandeja, limit=7, cursor=cursor)
+        vistos += [r.id_ticket for r in rows]
+        if not cursor:
+            break
+
+    por_offset = [
+        r.id_ticket
+        for offset in range(0, 120, 7)
+        for r in crud_analista.get_tickets_by_analyst(sesion, bandeja, limit=7, offset=offset)[0]
+    ]
+    assert total == 120
+    assert len(vistos) == len(set(vistos)) == 120
+    assert vistos == por_offset
+
+
+def _mediana_ms(fn, repeticiones: int = 15) -> float:
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fn()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+def test_benchmark_latencia_por_pagina_keyset(sesion, semilla):
+    """
+    Latencia de una página de 20 al principio, al medio y al final de la bandeja.
+    BENCH_TICKETS ajusta el tamaño (p. ej. 1000000; por defecto 20000).
+    """
+    n = int(os.getenv("BENCH_TICKETS", "20000"))
+    id_cliente, id_cs = semilla.cliente_servicio()
+    id_analista = semilla.analista(1)
+    semilla.tickets(n, semilla.colaborador(id_cliente), id_cs, id_analista)
+    semilla.contadores()
+    sesion.commit()
+    sesion.execute(text("ANALYZE ticket"))
+
+    T = db.Ticket
+    orden = select(T.updated_at, T.id_ticket).where(T.id_analista == id_analista).order_by(
+        T.updated_at.desc(), T.id_ticket.desc()
+    )
+    resultados = {}
+    for nombre, profundidad in (("inicio", 0), ("medio", n // 2), ("final", n - 40)):
+        cursor = None
+        if profundidad:
+            ultimo = sesion.execute(orden.offset(profundidad - 1).limit(1)).one()
+            cursor = crud_analista.encode_cursor(ultimo.updated_at, ultimo.id_ticket)
+        keyset = _mediana_ms(lambda: crud_analista.get_tickets_by_analyst(
+            sesion, id_analista, limit=20, cursor=cursor))
+        offset = _mediana_ms(lambda: crud_analista.get_tickets_by_analyst(
+            sesion, id_analista, limit=20, offset=profundidad))
+        resultados[nombre] = keyset
+        print(f"\n  {nombre:>6} (fila {profundidad:>7}): keyset {keyset:6.2f} ms | offset {offset:7.2f} ms", end="")
+    print()
+
+    # Keyset: costo plano sin importar la profundidad (margen amplio para ruido de CI)
+    assert resultados["final"] < max(3 * resultados["inicio"], resultados["inicio"] + 5)
+
+
+def test_version_de_bandeja_sube_una_vez_por_sentencia(sesion, semilla):
+    id_cliente, id_cs = semilla.cliente_servicio()
+    id_colaborador = semilla.colaborador(id_cliente)
+    uno, otro = semilla.analista(1), semilla.analista(2)
+    sesion.commit()
+
+    def versiones():
+        sesion.commit()
+        return crud_analista.get_inbox_version(sesion, uno), crud_analista.get_inbox_version(sesion, otro)
+
+    semilla.tickets(50, id_colaborador, id_cs, uno)   # un solo INSERT de 50 filas
+    assert versiones() == (1, 0)
+
+    sesion.execute(text("UPDATE ticket SET estado = 'en atención'"))
+    assert versiones() == (2, 0)
+
+    # Derivar: suben el que lo tenía y el que lo recibe
+    sesion.execute(text(
+        "UPDATE ticket SET id_analista = :otro WHERE id_ticket IN (SELECT min(id_ticket) FROM ticket)"
+    ), {"otro": otro})
+    assert versiones() == (3, 1)
+
+    sesion.execute(text("DELETE FROM ticket WHERE id_analista = :otro"), {"otro": otro})
+    assert versiones() == (3, 2)
+
+    # Una sentencia que no toca filas no cambia nada
+    sesion.execute(text("UPDATE ticket SET estado = 'aceptado' WHERE false"))
+    assert versiones() == (3, 2)
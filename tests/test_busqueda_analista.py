@@ -0,0 +1,118 @@
+# tests/test_busqueda_analista.py
+import datetime
+from collections import Counter
+
+import pytest
+from sqlalchemy import func, select, text
+
+from src.api.routes import analyst
+from src.crud import crud_analista, crud_tickets
+from src.util import util_base_de_datos as db
+from src.util import util_schemas as sch
+
+pytestmark = pytest.mark.postgres
+
+ASUNTOS = ["Error al generar reporte en PDF", "No carga el dashboard de ventas", "Acceso denegado al portal"]
+DIA = datetime.date(2025, 1, 1)
+
+
+@pytest.fixture
+def buscador(sesion, semilla):
+    """
+    Un analista con 90 tickets de dos empresas/servicios, creados a lo largo de 5
+    días; 6 sin estado. Otro analista con tickets que nunca deben aparecer.
+    """
+    id_acme, cs_acme = semilla.cliente_servicio("Acme", "Analítica")
+    id_globex, cs_globex = semilla.cliente_servicio("Globex", "Soporte BI")
+    ana, beto = semilla.analista(1), semilla.analista(1)
+    semilla.tickets(50, semilla.colaborador(id_acme, "Carla"), cs_acme, ana, asuntos=ASUNTOS)
+    semilla.tickets(40, semilla.colaborador(id_globex, "Bruno"), cs_globex, ana, asuntos=ASUNTOS[::-1])
+    semilla.tickets(30, semilla.colaborador(id_acme, "Otra"), cs_acme, beto, asuntos=ASUNTOS)
+    sesion.execute(text("UPDATE ticket SET created_at = created_at + (id_ticket % 5) * interval '1 day'"))
+    sesion.execute(text("UPDATE ticket SET estado = NULL WHERE id_ticket % 15 = 0"))
+    sesion.commit()
+    return ana
+
+
+def _filtrados(sesion, analista, estados=None, niveles=None, servicio=None, empresa=None,
+               desde=None, hasta=None, texto=None):
+    """(estado, nivel, servicio, empresa) de cada ticket que cumple los filtros, sin agregar en SQL."""
+    T = db.Ticket
+    q = (
+        select(T.estado, T.nivel, db.Servicio.nombre, db.Cliente.nombre)
+        .outerjoin(db.Colaborador, db.Colaborador.id_colaborador == T.id_colaborador)
+        .outerjoin(db.Cliente, db.Cliente.id_cliente == db.Colaborador.id_cliente)
+        .outerjoin(db.ClienteServicio, db.ClienteServicio.id_cliente_servicio == T.id_cliente_servicio)
+        .outerjoin(db.Servicio, db.Servicio.id_servicio == db.ClienteServicio.id_servicio)
+        .where(T.id_analista == analista)
+    )
+    if estados:
+        q = q.where(T.estado.in_(estados))
+    if niveles:
+        q = q.where(T.nivel.in_(niveles))
+    if servicio:
+        q = q.where(db.Servicio.nombre == servicio)
+    if empresa:
+        q = q.where(db.Cliente.nombre == empresa)
+    if desde:
+        q = q.where(func.date(T.created_at) >= desde)
+    if hasta:
+        q = q.where(func.date(T.created_at) <= hasta)
+    if texto:
+        q = q.where(crud_tickets.subject_search_clause(texto)[0])
+    return sesion.execute(q).all()
+
+
+FILTROS = [
+    {},
+    {"estados": ["aceptado", "en atención"]},
+    {"niveles": ["alto", "crítico"], "empresa": "Globex"},
+    {"servicio": "Analítica", "desde": DIA + datetime.timedelta(days=1), "hasta": DIA + datetime.timedelta(days=2)},
+    {"texto": "reportes pdf", "niveles": ["bajo"]},
+    {"empresa": "Inexistente"},
+]
+
+
+@pytest.mark.parametrize("filtros", FILTROS, ids=lambda f: ",".join(f) or "sin_filtros")
+def test_facetas_y_total_coinciden_con_contar_las_filas(sesion, buscador, contar_queries, filtros):
+    filas = _filtrados(sesion, buscador, **filtros)
+
+    with contar_queries() as sentencias:
+        _, _, facets, total = crud_analista.search_tickets_by_analyst(sesion, buscador, limit=10, **filtros)
+
+    # Página + facetas y total en una sola agregación
+    assert len(sentencias) == 2
+    assert "GROUPING SETS" in sentencias[1][0]
+    assert total == len(filas)
+    for i, faceta in enumerate(["estado", "nivel", "service", "company"]):
+        assert facets[faceta] == dict(Counter(f[i] for f in filas if f[i] is not None))
+
+
+def test_total_incluye_los_tickets_sin_estado(sesion, buscador):
+    _, _, facets, total = crud_analista.search_tickets_by_analyst(sesion, buscador)
+
+    assert total == 90
+    assert sum(facets["estado"].values()) == 84
+
+
+def test_total_de_la_ruta_es_el_count_con_los_mismos_filtros(sesion, buscador):
+    persona = sesion.execute(select(db.Analista.id_persona).where(db.Analista.id_analista == buscador)).scalar_one()
+    usuario = sch.TokenData(
+        persona_id=str(persona), colaborador_id="-", cliente_id="-", nombre="Ana", correo="ana@soporte.test",
+        cliente_nombre="ANALYTICS", servicios_contratados=[],
+    )
+    crud_analista.invalidate_analyst_principal()
+    parametros = dict(q="dashboard", status=None, level=["Alto", "medio"], service=None, company="Acme",
+                      desde=DIA + datetime.timedelta(days=1), hasta=None, limit=5, db=sesion, current_user=usuario)
+
+    vistos, cursor = [], None
+    while True:
+        pagina = analyst.buscar_tickets_analista(cursor=cursor, **parametros)
+        vistos += [i.id_ticket for i in pagina.items]
+        cursor = pagina.next_cursor
+        if not cursor:
+            break
+
+    esperado = _filtrados(sesion, buscador, niveles=["alto", "medio"], empresa="Acme", texto="dashboard",
+                          desde=DIA + datetime.timedelta(days=1))
+    assert pagina.total == len(esperado) == len(set(vistos)) > 5
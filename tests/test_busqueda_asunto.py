@@ -0,0 +1,69 @@
+# tests/test_busqueda_asunto.py
+from types import SimpleNamespace
+
+import pytest
+
+from src.crud import crud_tickets
+from src.util import util_schemas as sch
+
+ASUNTOS = [
+    "No carga el dashboard de ventas",
+    "Error al generar reporte en PDF",
+    "Acceso denegado al portal",
+    "Reporte mensual sin datos de marzo",
+    "Problema con la sesión en el móvil",
+]
+
+
+def _tickets(asuntos):
+    return [SimpleNamespace(id_ticket=i, asunto=a) for i, a in enumerate(asuntos, start=1)]
+
+
+def _asuntos(tickets):
+    return [t.asunto for t in tickets]
+
+
+def test_plurales_y_palabras_sueltas_encuentran_el_asunto():
+    resultado = crud_tickets._rank_subject_in_memory(_tickets(ASUNTOS), "reportes PDF", limit=5)
+
+    assert _asuntos(resultado)[0] == "Error al generar reporte en PDF"
+    assert "Reporte mensual sin datos de marzo" in _asuntos(resultado)
+    assert "Acceso denegado al portal" not in _asuntos(resultado)
+
+
+def test_ignora_tildes_y_mayusculas():
+    resultado = crud_tickets._rank_subject_in_memory(_tickets(ASUNTOS), "SESION movil", limit=5)
+    assert _asuntos(resultado) == ["Problema con la sesión en el móvil"]
+
+
+def test_respeta_el_limite_y_ordena_por_relevancia():
+    asuntos = ["Reporte lento", "Reporte PDF lento", "Reporte PDF lento en producción", "Otra cosa"]
+    resultado = crud_tickets._rank_subject_in_memory(_tickets(asuntos), "reporte pdf lento", limit=2)
+
+    assert len(resultado) == 2
+    assert _asuntos(resultado)[0] == "Reporte PDF lento"
+
+
+@pytest.mark.parametrize("consulta", ["", "a de", "zzzz qqqq"])
+def test_consultas_sin_terminos_utiles_no_devuelven_nada(consulta):
+    assert crud_tickets._rank_subject_in_memory(_tickets(ASUNTOS), consulta, limit=5) == []
+
+
+def test_busqueda_por_asunto_desde_la_base(sesion, semilla):
+    # En SQLite usa el ranking en memoria; con TEST_DATABASE_URL, tsvector + pg_trgm
+    id_cliente, id_cs = semilla.cliente_servicio()
+    id_colaborador = semilla.colaborador(id_cliente)
+    otro = semilla.colaborador(id_cliente, "Otro Colaborador")
+    semilla.tickets(len(ASUNTOS), id_colaborador, id_cs, asuntos=ASUNTOS)
+    semilla.tickets(3, otro, id_cs, asuntos=["Error al generar reporte en PDF"])
+    sesion.commit()
+    usuario = sch.TokenData(
+        persona_id="", colaborador_id=str(id_colaborador), cliente_id=str(id_cliente),
+        nombre="Carla", correo="carla@acme.test", cliente_nombre="Acme", servicios_contratados=[],
+    )
+
+    resultado = crud_tickets.get_tickets_by_subject(sesion, "reportes PDF", usuario, limit=5)
+
+    assert _asuntos(resultado)[0] == "Error al generar reporte en PDF"
+    assert all(str(t.id_colaborador).replace("-", "") == id_colaborador.hex for t in resultado)
+    assert "Acceso denegado al portal" not in _asuntos(resultado)
@@ -0,0 +1,137 @@
+# tests/test_cache.py
+import uuid
+
+import fakeredis
+import pytest
+from fastapi import Response
+from sqlalchemy import select, text
+
+from src.api.routes import analyst
+from src.crud import crud_analista
+from src.util import util_cache
+from src.util import util_base_de_datos as db
+from src.util import util_schemas as sch
+
+DETALLE = {"id_ticket": 7, "status": "Abierto", "conversation": [{"role": "user", "content": "hola"}]}
+
+
+@pytest.fixture(params=["memoria", "redis"])
+def cache(request, monkeypatch):
+    """CacheVistas sobre cada backend, instalada como la instancia del proceso."""
+    if request.param == "memoria":
+        backend = util_cache.BackendMemoria()
+    else:
+        backend = util_cache.BackendRedis(fakeredis.FakeRedis())
+    cache = util_cache.CacheVistas(backend)
+    monkeypatch.setattr(util_cache, "cache_vistas", cache)
+    return cache
+
+
+def test_detalle_solo_se_sirve_con_la_misma_version(cache):
+    cache.guardar_detalle(7, "v1", DETALLE)
+
+    assert cache.obtener_detalle(7, "v1") == DETALLE
+    assert cache.obtener_detalle(7, "v2") is None
+    assert cache.obtener_detalle(8, "v1") is None
+    metricas = cache.metricas()
+    assert (metricas["hits"], metricas["obsoletos"], metricas["misses"]) == (1, 1, 1)
+
+
+def test_invalidar_la_bandeja_cambia_la_generacion_de_sus_claves(cache):
+    ana, beto = uuid.uuid4(), uuid.uuid4()
+    clave_ana, clave_beto = cache.clave_bandeja(ana, 20, None), cache.clave_bandeja(beto, 20, None)
+    cache.guardar_bandeja(clave_ana, {"items": [1, 2]})
+    cache.guardar_bandeja(clave_beto, {"items": [3]})
+    assert clave_ana.startswith(f"bandeja:{ana}:0:")
+    assert cache.clave_bandeja(ana, 20, "cursor") != clave_ana
+
+    cache.invalidar(analistas=[ana])
+
+    nueva = cache.clave_bandeja(ana, 20, None)
+    assert nueva.startswith(f"bandeja:{ana}:1:")
+    assert cache.obtener_bandeja(nueva) is None
+    assert cache.clave_bandeja(beto, 20, None) == clave_beto
+    assert cache.obtener_bandeja(clave_beto) == {"items": [3]}
+
+
+def test_invalidacion_se_aplica_recien_al_confirmar(sesion, cache):
+    ana = uuid.uuid4()
+    cache.guardar_detalle(7, "v1", DETALLE)
+    clave = cache.clave_bandeja(ana, 20)
+
+    sesion.execute(text("SELECT 1"))
+    util_cache.invalidar_al_confirmar(sesion, [7, None], [ana, None])
+    # Antes del commit otra lectura todavía ve (y puede re-cachear) lo confirmado
+    assert cache.obtener_detalle(7, "v1") == DETALLE
+    assert cache.clave_bandeja(ana, 20) == clave
+
+    sesion.commit()
+
+    assert cache.obtener_detalle(7, "v1") is None
+    assert cache.clave_bandeja(ana, 20) != clave
+    assert util_cache._PENDIENTE not in sesion.info
+
+
+def test_rollback_descarta_la_invalidacion(sesion, cache):
+    ana = uuid.uuid4()
+    cache.guardar_detalle(7, "v1", DETALLE)
+    clave = cache.clave_bandeja(ana, 20)
+
+    sesion.execute(text("SELECT 1"))
+    util_cache.invalidar_al_confirmar(sesion, [7], [ana])
+    sesion.rollback()
+    # El próximo commit de la misma sesión no arrastra lo registrado antes del rollback
+    sesion.execute(text("SELECT 1"))
+    sesion.commit()
+
+    assert cache.obtener_detalle(7, "v1") == DETALLE
+    assert cache.clave_bandeja(ana, 20) == clave
+    assert cache.metricas()["invalidaciones"] == 0
+
+
+def test_backend_caido_no_rompe_lecturas_ni_invalidaciones(cache):
+    class Caido:
+        def __getattr__(self, nombre):
+            def fallar(*args, **kwargs):
+                raise ConnectionError("sin conexión")
+            return fallar
+
+    cache.configurar_backend(Caido())
+
+    cache.guardar_detalle(7, "v1", DETALLE)
+    assert cache.obtener_detalle(7, "v1") is None
+    assert cache.clave_bandeja("ana", 20).startswith("bandeja:ana:0:")
+    cache.invalidar([7], ["ana"])
+    assert cache.metricas()["errores"] == 3
+
+
+@pytest.mark.postgres
+def test_bandeja_cacheada_se_renueva_tras_un_cambio_confirmado(sesion, semilla, cache):
+    id_cliente, id_cs = semilla.cliente_servicio()
+    ana = semilla.analista(1)
+    semilla.tickets(3, semilla.colaborador(id_cliente), id_cs, ana)
+    semilla.contadores()
+    sesion.commit()
+    persona = sesion.execute(select(db.Analista.id_persona).where(db.Analista.id_analista == ana)).scalar_one()
+    usuario = sch.TokenData(
+        persona_id=str(persona), colaborador_id="-", cliente_id="-", nombre="Ana", correo="ana@soporte.test",
+        cliente_nombre="ANALYTICS", servicios_contratados=[],
+    )
+    crud_analista.invalidate_analyst_principal()
+
+    def pagina():
+        return analyst.listar_conversaciones_analista(
+            Response(), limit=20, offset=0, status=None, cursor=None, orden="recientes", sla=None,
+            if_none_match=None, db=sesion, current_user=usuario,
+        )
+
+    primera = pagina()
+    assert pagina() == primera
+    assert cache.metricas()["hits"] == 1
+
+    id_ticket = primera.items[0].id_ticket
+    crud_analista.apply_ticket_changes_db(sesion, id_ticket, ana, new_level="crítico")
+
+    renovada = pagina()
+    assert next(i.level for i in renovada.items if i.id_ticket == id_ticket) == "crítico"
+    assert cache.metricas()["hits"] == 1
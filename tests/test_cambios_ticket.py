@@ -0,0 +1,254 @@
+# tests/test_cambios_ticket.py
+import time
+import datetime
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func, select, text
+
+from src.api.routes import analyst
+from src.crud import crud_analista
+from src.util import util_asignacion
+from src.util import util_cache
+from src.util import util_base_de_datos as db
+from src.util import util_schemas as sch
+
+pytestmark = pytest.mark.postgres
+
+
+@pytest.fixture
+def mesa(sesion, semilla):
+    """Dos analistas de nivel 1 con 4 tickets cada uno y contadores al día."""
+    id_cliente, id_cs = semilla.cliente_servicio()
+    id_colaborador = semilla.colaborador(id_cliente)
+    ana, beto = semilla.analista(1), semilla.analista(1)
+    semilla.tickets(4, id_colaborador, id_cs, ana)
+    semilla.tickets(4, id_colaborador, id_cs, beto)
+    semilla.contadores()
+    sesion.commit()
+    ids = {
+        a: sesion.execute(
+            select(db.Ticket.id_ticket).where(db.Ticket.id_analista == a).order_by(db.Ticket.id_ticket)
+        ).scalars().all()
+        for a in (ana, beto)
+    }
+    return {"ana": ana, "beto": beto, "tickets": ids}
+
+
+def _contadores(sesion) -> dict:
+    sesion.rollback()
+    return {
+        (a, e, n): t
+        for a, e, n, t in sesion.execute(text("SELECT id_analista, estado, nivel, total FROM contador_analista"))
+        if t
+    }
+
+
+def _ticket(sesion, id_ticket):
+    sesion.rollback()
+    return sesion.execute(select(db.Ticket).where(db.Ticket.id_ticket == id_ticket)).scalar_one()
+
+
+def _token_de(sesion, id_analista) -> sch.TokenData:
+    persona = sesion.execute(
+        select(db.Analista.id_persona).where(db.Analista.id_analista == id_analista)
+    ).scalar_one()
+    return sch.TokenData(
+        persona_id=str(persona), colaborador_id="-", cliente_id="-", nombre="Ana", correo="ana@soporte.test",
+        cliente_nombre="ANALYTICS", servicios_contratados=[],
+    )
+
+
+# =======================================================================
+# Cambio individual con concurrencia optimista (apply_ticket_changes_db)
+# =======================================================================
+
+def test_cambio_en_un_round_trip_con_detalle(sesion, mesa, contar_queries):
+    id_ticket = mesa["tickets"][mesa["ana"]][0]        # aceptado / bajo
+    visto = _ticket(sesion, id_ticket).updated_at
+    antes = _contadores(sesion)
+
+    with contar_queries() as sentencias:
+        info = crud_analista.apply_ticket_changes_db(
+            sesion, id_ticket, mesa["ana"], new_status="finalizado", new_level="alto",
+            description="Se reprocesó el modelo.", expected_updated_at=visto,
+        )
+
+    # UPDATE ... RETURNING + detalle en un statement; luego contadores y el aviso
+    assert [s.split()[0] for s, _ in sentencias] == ["WITH", "INSERT", "SELECT"]
+    assert "UPDATE ticket" in sentencias[0][0] and "pg_notify" in sentencias[2][0]
+
+    detalle = sch.AnalystTicketDetail(**info)
+    assert (detalle.status, detalle.level, detalle.description) == ("finalizado", "alto", "Se reprocesó el modelo.")
+    ticket = _ticket(sesion, id_ticket)
+    assert ticket.closed_at is not None
+    assert ticket.due_at == ticket.created_at + datetime.timedelta(days=1)
+
+    despues = _contadores(sesion)
+    assert despues.get((mesa["ana"], "aceptado", "bajo"), 0) == antes[(mesa["ana"], "aceptado", "bajo")] - 1
+    assert despues[(mesa["ana"], "finalizado", "alto")] == antes.get((mesa["ana"], "finalizado", "alto"), 0) + 1
+
+
+def test_updated_at_viejo_da_409_sin_tocar_nada(sesion, mesa):
+    id_ticket = mesa["tickets"][mesa["ana"]][0]
+    visto = _ticket(sesion, id_ticket).updated_at
+    # Otro analista (u otra pestaña) lo modificó después de que el cliente lo leyera
+    crud_analista.apply_ticket_changes_db(sesion, id_ticket, mesa["ana"], new_status="en atención")
+    actual = _ticket(sesion, id_ticket)
+    antes = _contadores(sesion)
+
+    payload = sch.UpdateTicketStatusRequest(status="cerrado", expected_updated_at=visto)
+    with pytest.raises(HTTPException) as error:
+        analyst.update_ticket_status(id_ticket, payload, sesion, _token_de(sesion, mesa["ana"]))
+
+    assert error.value.status_code == 409
+    assert _contadores(sesion) == antes
+    ticket = _ticket(sesion, id_ticket)
+    assert (ticket.estado, ticket.updated_at, ticket.closed_at) == ("en atención", actual.updated_at, None)
+
+
+def test_ticket_ajeno_o_inexistente(sesion, mesa):
+    ajeno = mesa["tickets"][mesa["beto"]][0]
+    antes = _contadores(sesion)
+
+    assert crud_analista.apply_ticket_changes_db(sesion, ajeno, mesa["ana"], new_status="finalizado") is None
+    for id_ticket, estado in ((ajeno, 403), (999_999, 404)):
+        with pytest.raises(HTTPException) as error:
+            analyst.update_ticket_status(
+                id_ticket, sch.UpdateTicketStatusRequest(status="cerrado"), sesion, _token_de(sesion, mesa["ana"])
+            )
+        assert error.value.status_code == estado
+
+    assert _contadores(sesion) == antes
+    assert _ticket(sesion, ajeno).estado == "aceptado"
+
+
+
+# =======================================================================
+# Cambios en bloque (apply_bulk_changes_db)
+# =======================================================================
+
+@pytest.fixture
+def con_nivel2(sesion, semilla, mesa):
+    """Dos analistas de nivel 2 y el índice de asignación global cargado con ellos."""
+    mesa["nivel2"] = [semilla.analista(2), semilla.analista(2)]
+    sesion.commit()
+    util_asignacion.indice_analistas.refrescar(sesion)
+    yield mesa
+    util_asignacion.indice_analistas._cargado_en = 0.0
+
+
+def _principal(id_analista, nivel=1):
+    return crud_analista.AnalistaPrincipal(id_analista, nivel)
+
+
+def test_bloque_con_tickets_ajenos_e_inexistentes(sesion, mesa):
+    propios, ajenos = mesa["tickets"][mesa["ana"]], mesa["tickets"][mesa["beto"]]
+
+    resultados = crud_analista.apply_bulk_changes_db(
+        sesion, _principal(mesa["ana"]), propios[:2] + ajenos[:1] + [999_999], new_status="en atención"
+    )
+
+    assert [(r["id_ticket"], r["ok"], r.get("error")) for r in resultados] == [
+        (propios[0], True, None),
+        (propios[1], True, None),
+        (ajenos[0], False, "No autorizado para modificar este ticket."),
+        (999_999, False, "Ticket no encontrado."),
+    ]
+    assert _ticket(sesion, ajenos[0]).estado == "aceptado"
+    assert {_ticket(sesion, i).estado for i in propios[:2]} == {"en atención"}
+
+
+def test_cerrar_y_derivar_no_deriva(sesion, con_nivel2):
+    mesa = con_nivel2
+    ids = mesa["tickets"][mesa["ana"]][:2]
+
+    resultados = crud_analista.apply_bulk_changes_db(
+        sesion, _principal(mesa["ana"]), ids, new_status="finalizado", motivo_derivacion="Escalar"
+    )
+
+    assert all(r["error"] == "Solo se pueden derivar tickets abiertos." for r in resultados)
+    assert all("derivado_a" not in r for r in resultados)
+    for i in ids:
+        ticket = _ticket(sesion, i)
+        assert (ticket.estado, ticket.id_analista) == ("finalizado", mesa["ana"])
+    assert sesion.execute(select(db.Escalado)).first() is None
+    assert [util_asignacion.indice_analistas.carga(a) for a in mesa["nivel2"]] == [0, 0]
+
+
+def test_derivacion_fallida_igual_aplica_el_estado(sesion, mesa):
+    # Sin analistas de nivel superior: la derivación falla, el cambio de estado no
+    util_asignacion.indice_analistas.refrescar(sesion)
+    try:
+        ids = mesa["tickets"][mesa["ana"]][:2]
+        resultados = crud_analista.apply_bulk_changes_db(
+            sesion, _principal(mesa["ana"]), ids, new_status="en atención", motivo_derivacion="Escalar"
+        )
+    finally:
+        util_asignacion.indice_analistas._cargado_en = 0.0
+
+    assert [r["error"] for r in resultados] == ["No se encontraron analistas de nivel superior disponibles."] * 2
+    assert [r["status"] for r in resultados] == ["en atención"] * 2
+    assert {_ticket(sesion, i).estado for i in ids} == {"en atención"}
+
+
+def test_derivacion_mueve_contadores_e_invalida_bandejas_de_destino(sesion, con_nivel2):
+    mesa = con_nivel2
+    ana = mesa["ana"]
+    ids = [i for i in mesa["tickets"][ana] if _ticket(sesion, i).estado != "finalizado"]
+    cache = util_cache.cache_vistas
+    claves = {a: cache.clave_bandeja(a, "pagina") for a in [ana, mesa["beto"], *mesa["nivel2"]]}
+    antes = _contadores(sesion)
+
+    resultados = crud_analista.apply_bulk_changes_db(sesion, _principal(ana), ids, motivo_derivacion="Escalar")
+
+    assert all(r["ok"] for r in resultados)
+    destinos = {r["id_ticket"]: r["derivado_a"] for r in resultados}
+    assert sorted(list(destinos.values()).count(a) for a in mesa["nivel2"]) == [1, 2]
+
+    # Cada ticket dejó su (estado, nivel) en ana y lo sumó en su destino
+    esperado = dict(antes)
+    for i in ids:
+        t = _ticket(sesion, i)
+        assert t.id_analista == destinos[i]
+        esperado[(ana, t.estado, t.nivel)] -= 1
+        esperado[(destinos[i], t.estado, t.nivel)] = esperado.get((destinos[i], t.estado, t.nivel), 0) + 1
+    assert _contadores(sesion) == {k: v for k, v in esperado.items() if v}
+    assert sesion.execute(select(func.count()).select_from(db.Escalado)).scalar() == len(ids)
+
+    # Bandejas de ana y de los destinos invalidadas; la de beto no
+    cambiadas = {a for a, clave in claves.items() if cache.clave_bandeja(a, "pagina") != clave}
+    assert cambiadas == {ana, *mesa["nivel2"]}
+
+
+def test_benchmark_bloque_contra_cambios_individuales(sesion, semilla, contar_queries):
+    id_cliente, id_cs = semilla.cliente_servicio()
+    id_colaborador = semilla.colaborador(id_cliente)
+    ana = semilla.analista(1)
+    n = 200
+    semilla.tickets(2 * n, id_colaborador, id_cs, ana)
+    semilla.contadores()
+    sesion.commit()
+    ids = sesion.execute(select(db.Ticket.id_ticket).order_by(db.Ticket.id_ticket)).scalars().all()
+
+    inicio = time.perf_counter()
+    with contar_queries() as individuales:
+        for i in ids[:n]:
+            crud_analista.apply_ticket_changes_db(sesion, i, ana, new_status="en atención", new_level="alto")
+    individual_ms = (time.perf_counter() - inicio) * 1000
+
+    inicio = time.perf_counter()
+    with contar_queries() as bloque:
+        resultados = crud_analista.apply_bulk_changes_db(
+            sesion, _principal(ana), ids[n:], new_status="en atención", new_level="alto"
+        )
+    bloque_ms = (time.perf_counter() - inicio) * 1000
+
+    print(
+        f"\n  {n} tickets: individual {individual_ms:.0f} ms / {len(individuales)} queries"
+        f" | bloque {bloque_ms:.0f} ms / {len(bloque)} queries ({n / bloque_ms * 1000:,.0f} tickets/s)"
+    )
+    assert all(r["ok"] for r in resultados)
+    # SELECT FOR UPDATE + UPDATE + contadores + pg_notify, sin importar el tamaño del lote
+    assert len(bloque) == 4
+    assert bloque_ms < individual_ms
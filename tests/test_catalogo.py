@@ -0,0 +1,158 @@
+# tests/test_catalogo.py
+import time
+import uuid
+import difflib
+import threading
+
+import pytest
+from sqlalchemy import insert, select
+
+from src.util import util_catalogo
+from src.util import util_base_de_datos as db
+
+
+@pytest.fixture
+def catalogo(sesion, semilla):
+    """
+    Catálogo propio cargado con Acme (Analítica, Soporte BI, Datos, Datos Maestros)
+    y Globex (Facturación). Devuelve (catalogo, ids) con los ids tal como los da la BD.
+    """
+    id_acme, _ = semilla.cliente_servicio("Acme", "Analítica")
+    for nombre in ("Soporte BI", "Datos", "Datos Maestros"):
+        _contratar(sesion, id_acme, nombre)
+    semilla.cliente_servicio("Globex", "Facturación")
+    sesion.commit()
+    catalogo = util_catalogo.CatalogoServicios(ttl_segundos=3600)
+    catalogo.refrescar(sesion)
+    return catalogo, _ids(sesion)
+
+
+def _contratar(sesion, id_cliente, nombre: str) -> None:
+    id_servicio = uuid.uuid4()
+    sesion.execute(insert(db.Servicio), [{"id_servicio": id_servicio, "nombre": nombre}])
+    sesion.execute(insert(db.ClienteServicio), [
+        {"id_cliente_servicio": uuid.uuid4(), "id_cliente": id_cliente, "id_servicio": id_servicio}
+    ])
+
+
+def _ids(sesion) -> dict:
+    """{"Acme": id_cliente, ..., "Analítica": id_cliente_servicio, ...}"""
+    filas = sesion.execute(
+        select(db.Cliente.nombre, db.Cliente.id_cliente, db.Servicio.nombre, db.ClienteServicio.id_cliente_servicio)
+        .join(db.ClienteServicio, db.ClienteServicio.id_cliente == db.Cliente.id_cliente)
+        .join(db.Servicio, db.Servicio.id_servicio == db.ClienteServicio.id_servicio)
+    ).all()
+    return {**{c: str(i) for c, i, _, _ in filas}, **{s: cs for _, _, s, cs in filas}}
+
+
+@pytest.mark.parametrize("buscado, esperado", [
+    ("Analítica", "Analítica"),
+    ("  ANALITICA ", "Analítica"),          # exacta normalizada
+    ("datos", "Datos"),                     # la exacta gana a la subcadena de "Datos Maestros"
+    ("maestros", "Datos Maestros"),         # subcadena
+    ("BI", "Soporte BI"),
+    ("Analitca", "Analítica"),              # difusa
+    ("Soprte BI", "Soporte BI"),
+])
+def test_resolver_servicio_exacto_subcadena_y_difuso(sesion, catalogo, buscado, esperado):
+    catalogo, ids = catalogo
+    assert catalogo.resolver_servicio(sesion, ids["Acme"], buscado) == ids[esperado]
+
+
+@pytest.mark.parametrize("buscado", ["Análisis", "Sopa", "Facturación", ""])
+def test_resolver_servicio_sin_coincidencia(sesion, catalogo, buscado):
+    catalogo, ids = catalogo
+    # Por debajo de SIMILITUD_MINIMA no hay coincidencia difusa, y un servicio de
+    # otro cliente nunca se resuelve
+    if buscado in ("Análisis", "Sopa"):
+        normalizado = util_catalogo.normalizar(buscado)
+        assert max(
+            difflib.SequenceMatcher(None, normalizado, util_catalogo.normalizar(n)).ratio()
+            for n in ("Analítica", "Soporte BI", "Datos", "Datos Maestros")
+        ) < util_catalogo.SIMILITUD_MINIMA
+    assert catalogo.resolver_servicio(sesion, ids["Acme"], buscado) is None
+
+
+def test_faltante_recarga_solo_pasada_la_recarga_minima(sesion, catalogo):
+    catalogo, ids = catalogo
+    _contratar(sesion, ids["Globex"], "Soporte BI")
+    sesion.commit()
+
+    # Recién cargado: no se golpea la BD por cada búsqueda fallida
+    assert catalogo.resolver_servicio(sesion, ids["Globex"], "Soporte BI") is None
+
+    catalogo._cargado_en -= util_catalogo.RECARGA_MINIMA + 1
+    version = catalogo.version
+    assert catalogo.resolver_servicio(sesion, ids["Globex"], "Soporte BI") is not None
+    assert catalogo.version == version + 1
+
+
+def _contar_recargas(catalogo, monkeypatch, demora: float = 0.05) -> list:
+    recargas = []
+    original = catalogo._recargar
+
+    def recargar_lento(db_session):
+        recargas.append(1)
+        time.sleep(demora)
+        original(db_session)
+
+    monkeypatch.setattr(catalogo, "_recargar", recargar_lento)
+    return recargas
+
+
+def _en_paralelo(n: int, funcion) -> list:
+    largada = threading.Barrier(n)
+    resultados = [None] * n
+
+    def correr(i):
+        largada.wait()
+        resultados[i] = funcion()
+
+    hilos = [threading.Thread(target=correr, args=(i,)) for i in range(n)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    return resultados
+
+
+def test_faltantes_simultaneos_recargan_una_sola_vez(sesion, catalogo, monkeypatch):
+    catalogo, ids = catalogo
+    _contratar(sesion, ids["Globex"], "Soporte BI")
+    sesion.commit()
+    catalogo._cargado_en -= util_catalogo.RECARGA_MINIMA + 1
+    recargas = _contar_recargas(catalogo, monkeypatch)
+
+    resultados = _en_paralelo(16, lambda: catalogo.resolver_servicio(sesion, ids["Globex"], "Soporte BI"))
+
+    # Todos esperaron la misma recarga y encontraron el servicio nuevo
+    assert recargas == [1]
+    assert len(set(resultados)) == 1 and resultados[0] is not None
+
+
+def test_ttl_vencido_recarga_un_hilo_y_los_demas_no_esperan(sesion, catalogo, monkeypatch):
+    catalogo, ids = catalogo
+    catalogo.ttl_segundos = 0.01
+    time.sleep(0.02)
+    recargas = _contar_recargas(catalogo, monkeypatch, demora=0.3)
+
+    inicio = time.perf_counter()
+    resultados = _en_paralelo(16, lambda: (
+        catalogo.servicios_de_cliente(sesion, ids["Acme"]), time.perf_counter() - inicio
+    ))
+
+    assert recargas == [1]
+    assert all(len(servicios) == 4 for servicios, _ in resultados)
+    # 15 hilos respondieron con los datos vigentes sin esperar los 0,3 s de la recarga
+    assert sum(demora < 0.2 for _, demora in resultados) == 15
+
+
+def test_catalogo_invalidado_espera_la_recarga(sesion, catalogo, monkeypatch):
+    catalogo, ids = catalogo
+    catalogo.invalidar()
+    recargas = _contar_recargas(catalogo, monkeypatch)
+
+    resultados = _en_paralelo(8, lambda: catalogo.nombre_cliente(sesion, ids["Acme"]))
+
+    assert recargas == [1]
+    assert resultados == ["Acme"] * 8
@@ -0,0 +1,176 @@
+# tests/test_contadores.py
+import time
+import threading
+
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from src.crud import crud_analista, crud_contadores
+from src.util import util_tareas
+from src.util import util_base_de_datos as db
+
+pytestmark = pytest.mark.postgres
+
+
+@pytest.fixture
+def analistas(sesion, semilla):
+    """ana con 6 tickets (contadores al día) y beto sin tickets."""
+    id_cliente, id_cs = semilla.cliente_servicio()
+    ana, beto = semilla.analista(1), semilla.analista(1)
+    semilla.tickets(6, semilla.colaborador(id_cliente), id_cs, ana)
+    semilla.contadores()
+    sesion.commit()
+    return ana, beto
+
+
+def _contadores(sesion) -> dict:
+    sesion.rollback()
+    return {
+        (a, e, n): total
+        for a, e, n, total in sesion.execute(text("SELECT id_analista, estado, nivel, total FROM contador_analista"))
+        if total
+    }
+
+
+def _reales(sesion) -> dict:
+    sesion.rollback()
+    return {
+        (a, e, n): total
+        for a, e, n, total in sesion.execute(text(
+            "SELECT id_analista, estado, nivel, count(*) FROM ticket GROUP BY 1, 2, 3"
+        ))
+    }
+
+
+def _pendientes(sesion) -> list:
+    sesion.rollback()
+    return sesion.execute(text(
+        "SELECT payload FROM outbox_tarea WHERE tipo = 'contadores' AND estado = 'pendiente' ORDER BY id_tarea"
+    )).scalars().all()
+
+
+def test_registrar_cambio_mueve_un_ticket_en_una_sentencia(sesion, analistas, contar_queries):
+    ana, beto = analistas
+    antes = _contadores(sesion)
+
+    with contar_queries() as sentencias:
+        crud_contadores.registrar_cambio(sesion, (ana, "aceptado", "bajo"), (beto, "en atención", "alto"))
+    sesion.commit()
+    with contar_queries() as alta_y_baja:
+        crud_contadores.registrar_cambio(sesion, None, (beto, "aceptado", "medio"))
+        crud_contadores.registrar_cambio(sesion, (ana, "finalizado", "alto"), None)
+    sesion.commit()
+
+    assert [s.split()[0] for s, _ in sentencias] == ["INSERT"]
+    assert len(alta_y_baja) == 2
+    esperado = dict(antes)
+    esperado[(ana, "aceptado", "bajo")] -= 1
+    esperado[(ana, "finalizado", "alto")] -= 1
+    esperado[(beto, "en atención", "alto")] = 1
+    esperado[(beto, "aceptado", "medio")] = 1
+    assert _contadores(sesion) == {k: v for k, v in esperado.items() if v}
+
+
+def test_cambio_sin_efecto_neto_no_toca_los_contadores(sesion, analistas, contar_queries):
+    ana, _ = analistas
+    id_ticket, estado, nivel, updated_at = sesion.execute(
+        select(db.Ticket.id_ticket, db.Ticket.estado, db.Ticket.nivel, db.Ticket.updated_at).limit(1)
+    ).one()
+    antes = _contadores(sesion)
+
+    with contar_queries() as sentencias:
+        crud_contadores.registrar_cambio(sesion, (ana, estado, nivel), (ana, estado, nivel))
+        crud_contadores.registrar_cambio_diferido(sesion, (ana, estado, nivel), (ana, estado, nivel))
+    assert sentencias == []
+
+    # El mismo estado y nivel por la ruta: el UPDATE corre, el contador no
+    with contar_queries() as sentencias:
+        info = crud_analista.apply_ticket_changes_db(sesion, id_ticket, ana, new_status=estado, new_level=nivel)
+    assert info["updated_at"] > updated_at
+    assert not any(s.lstrip().startswith("INSERT INTO contador_analista") for s, _ in sentencias)
+    assert _contadores(sesion) == antes
+    assert _pendientes(sesion) == []
+
+
+def test_cambio_diferido_se_aplica_al_procesar_el_outbox(sesion, analistas):
+    ana, beto = analistas
+    antes = _contadores(sesion)
+    version = crud_analista.get_inbox_version(sesion, beto)
+
+    crud_contadores.registrar_cambio_diferido(sesion, None, (beto, "aceptado", "alto"))
+    crud_contadores.registrar_cambio_diferido(sesion, (ana, "aceptado", "bajo"), (beto, "aceptado", "bajo"))
+    # Sin analista no cuenta
+    crud_contadores.registrar_cambio_diferido(sesion, None, (None, "aceptado", "alto"))
+    sesion.commit()
+
+    assert _pendientes(sesion) == [
+        {"deltas": [[str(beto), "aceptado", "alto", 1]]},
+        {"deltas": [[str(ana), "aceptado", "bajo", -1], [str(beto), "aceptado", "bajo", 1]]},
+    ]
+    assert _contadores(sesion) == antes
+
+    assert util_tareas.TrabajadorTareas().procesar_lote() == 2
+
+    esperado = dict(antes)
+    esperado[(ana, "aceptado", "bajo")] -= 1
+    esperado[(beto, "aceptado", "alto")] = 1
+    esperado[(beto, "aceptado", "bajo")] = 1
+    assert _contadores(sesion) == {k: v for k, v in esperado.items() if v}
+    # El total de la bandeja de beto cambió sin tocar ticket: nuevo ETag
+    assert crud_analista.get_inbox_version(sesion, beto) > version
+
+
+def test_reconciliar_descuenta_los_deltas_pendientes_del_outbox(sesion, analistas):
+    ana, beto = analistas
+    # Contador corrupto
+    sesion.execute(text("UPDATE contador_analista SET total = total + 5 WHERE estado = 'aceptado' AND nivel = 'bajo'"))
+    # Un alta confirmada cuyo +1 todavía está en el outbox
+    id_ticket = sesion.execute(select(db.Ticket.id_ticket).where(db.Ticket.nivel == "medio").limit(1)).scalar()
+    sesion.execute(text("UPDATE ticket SET id_analista = :b WHERE id_ticket = :t"), {"b": beto, "t": id_ticket})
+    estado = sesion.execute(select(db.Ticket.estado).where(db.Ticket.id_ticket == id_ticket)).scalar()
+    crud_contadores.registrar_cambio_diferido(sesion, (ana, estado, "medio"), (beto, estado, "medio"))
+    # Las tareas ya hechas no se descuentan
+    util_tareas.encolar(sesion, "contadores", {"deltas": [[str(beto), "aceptado", "alto", 1]]})
+    sesion.execute(text("UPDATE outbox_tarea SET estado = 'hecho' WHERE payload::text LIKE '%alto%'"))
+    sesion.commit()
+
+    corregidos = crud_contadores.reconciliar_contadores(sesion)
+
+    # Solo se corrige la corrupción; el traspaso a beto lo aplica el trabajador
+    assert corregidos == {(ana, "aceptado", "bajo"): -5}
+    assert (beto, estado, "medio") not in _contadores(sesion)
+    util_tareas.TrabajadorTareas().procesar_lote()
+    assert _contadores(sesion) == _reales(sesion)
+    assert crud_contadores.reconciliar_contadores(sesion) == {}
+
+
+def test_reconciliar_espera_a_las_mutaciones_en_curso(sesion, analistas):
+    ana, beto = analistas
+    id_ticket, estado, nivel = sesion.execute(
+        select(db.Ticket.id_ticket, db.Ticket.estado, db.Ticket.nivel).limit(1)
+    ).one()
+    sesion.rollback()
+
+    # Otra transacción mueve un ticket (ticket + contador) y confirma más tarde
+    otra = Session(db.engine)
+    otra.execute(text("UPDATE ticket SET id_analista = :b WHERE id_ticket = :t"), {"b": beto, "t": id_ticket})
+    crud_contadores.registrar_cambio(otra, (ana, estado, nivel), (beto, estado, nivel))
+    confirmada = []
+
+    def confirmar():
+        time.sleep(0.2)
+        confirmada.append(time.perf_counter())
+        otra.commit()
+        otra.close()
+
+    hilo = threading.Thread(target=confirmar)
+    hilo.start()
+    corregidos = crud_contadores.reconciliar_contadores(sesion)
+    terminada = time.perf_counter()
+    hilo.join()
+
+    # LOCK TABLE esperó al commit y vio los dos cambios juntos: nada que corregir
+    assert corregidos == {}
+    assert terminada > confirmada[0]
+    assert _contadores(sesion) == _reales(sesion)
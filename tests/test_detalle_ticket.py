@@ -0,0 +1,77 @@
+# tests/test_detalle_ticket.py
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy import select
+
+from src.api.routes import analyst
+from src.crud import crud_analista
+from src.util import util_base_de_datos as db
+from src.util import util_schemas as sch
+
+pytestmark = pytest.mark.postgres
+
+
+def _ticket_con_todo(sesion, semilla):
+    id_cliente, id_cs = semilla.cliente_servicio("Acme", "Analítica")
+    id_colaborador = semilla.colaborador(id_cliente, "Carla Cliente")
+    id_analista = semilla.analista(1)
+    semilla.tickets(1, id_colaborador, id_cs, id_analista, asuntos=["No carga el dashboard"])
+    id_ticket = sesion.execute(select(db.Ticket.id_ticket)).scalar_one()
+    semilla.escalado(id_ticket, "Primer motivo")
+    semilla.escalado(id_ticket, "Requiere acceso a producción")
+    semilla.mensajes(id_ticket, crud_analista.CONVERSACION_ULTIMOS + 5)
+    sesion.commit()
+    return id_ticket
+
+
+def test_detalle_en_un_solo_round_trip(sesion, semilla, contar_queries):
+    id_ticket = _ticket_con_todo(sesion, semilla)
+
+    with contar_queries() as sentencias:
+        info = crud_analista.get_ticket_detail(sesion, id_ticket)
+
+    assert len(sentencias) == 1, [s for s, _ in sentencias]
+    detalle = sch.AnalystTicketDetail(**info)
+    assert detalle.subject == "No carga el dashboard"
+    assert detalle.user == "Carla Cliente"
+    assert detalle.company == "Acme"
+    assert detalle.service == "Analítica"
+    assert detalle.escalation_reason == "Requiere acceso a producción"
+
+
+def test_detalle_trae_los_ultimos_mensajes_en_orden(sesion, semilla):
+    id_ticket = _ticket_con_todo(sesion, semilla)
+
+    info = crud_analista.get_ticket_detail(sesion, id_ticket)
+
+    ultimos = crud_analista.CONVERSACION_ULTIMOS
+    assert len(info["conversation"]) == ultimos
+    assert info["conversation"][0]["content"] == "mensaje 6"
+    assert info["conversation"][-1]["content"] == f"mensaje {ultimos + 5}"
+    assert info["conversation_cursor"] == 6
+
+
+def test_detalle_de_ticket_inexistente(sesion):
+    assert crud_analista.get_ticket_detail(sesion, 999_999) is None
+
+
+@pytest.mark.parametrize("existe", [True, False])
+def test_detalle_no_revela_tickets_a_quien_no_es_analista(sesion, semilla, contar_queries, existe):
+    id_ticket = _ticket_con_todo(sesion, semilla) if existe else 999_999
+    id_cliente, _ = semilla.cliente_servicio("Globex")
+    id_colaborador = semilla.colaborador(id_cliente)
+    sesion.commit()
+    persona = sesion.execute(
+        select(db.Colaborador.id_persona).where(db.Colaborador.id_colaborador == id_colaborador)
+    ).scalar_one()
+    colaborador = sch.TokenData(
+        persona_id=str(persona), colaborador_id=str(id_colaborador), cliente_id=str(id_cliente),
+        nombre="Carla", correo="carla@acme.test", cliente_nombre="Globex", servicios_contratados=[],
+    )
+
+    with contar_queries() as sentencias, pytest.raises(HTTPException) as error:
+        analyst.detalle_conversacion_analista(id_ticket, Response(), None, sesion, colaborador)
+
+    # Mismo 403 exista o no el ticket, sin llegar a leerlo
+    assert error.value.status_code == 403
+    assert not any("ticket" in s for s, _ in sentencias)
@@ -0,0 +1,123 @@
+# tests/test_eventos.py
+"""Reparto del hub de eventos en memoria, sin LISTEN (corre también sin Postgres)."""
+import uuid
+import asyncio
+import threading
+
+import pytest
+
+from src.util import util_eventos
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    hub = util_eventos.HubEventos()
+    # Sin hilo de LISTEN: los avisos se entregan llamando a _despachar
+    monkeypatch.setattr(hub, "iniciar", lambda: None)
+    return hub
+
+
+def _aviso(tipo, id_ticket, *analistas, **datos) -> str:
+    return util_eventos._evento(tipo, id_ticket, analistas, **datos)
+
+
+def _vaciar(cola) -> list[dict]:
+    eventos = []
+    while not cola.empty():
+        eventos.append(cola.get_nowait())
+    return eventos
+
+
+async def _entregar(hub, *avisos) -> None:
+    for aviso in avisos:
+        hub._despachar(aviso)
+    # Las entregas se agendan con call_soon_threadsafe en el loop del suscriptor
+    await asyncio.sleep(0)
+
+
+def test_fan_out_a_todas_las_conexiones_de_los_analistas_del_evento(hub):
+    ana, beto, carla = (uuid.uuid4() for _ in range(3))
+
+    async def escenario():
+        pestana1, pestana2 = hub.suscribir(ana), hub.suscribir(ana)
+        de_beto, de_carla = hub.suscribir(beto), hub.suscribir(carla)
+        await _entregar(
+            hub,
+            _aviso("ticket_actualizado", 1, ana, status="en atención"),
+            _aviso("ticket_derivado", 2, ana, beto),
+            _aviso("ticket_creado", 3, uuid.uuid4()),
+        )
+        return [[e["id_ticket"] for e in _vaciar(c)] for c in (pestana1, pestana2, de_beto, de_carla)]
+
+    assert asyncio.run(escenario()) == [[1, 2], [1, 2], [2], []]
+    metricas = hub.metricas()
+    assert (metricas["recibidos"], metricas["entregas"], metricas["conexiones"]) == (3, 5, 4)
+
+
+def test_los_datos_del_evento_llegan_intactos_y_los_avisos_invalidos_se_ignoran(hub):
+    ana = uuid.uuid4()
+
+    async def escenario():
+        cola = hub.suscribir(ana)
+        await _entregar(hub, "no es json", _aviso("ticket_actualizado", 7, ana, level="alto", status="finalizado"))
+        return _vaciar(cola)
+
+    [evento] = asyncio.run(escenario())
+    assert {k: evento[k] for k in ("tipo", "id_ticket", "analistas", "level", "status")} == {
+        "tipo": "ticket_actualizado", "id_ticket": 7, "analistas": [str(ana)], "level": "alto", "status": "finalizado",
+    }
+    assert hub.metricas()["recibidos"] == 1
+
+
+def test_suscriptor_lento_recibe_resync_al_llenar_su_cola(hub):
+    ana = uuid.uuid4()
+    n = util_eventos.MAX_COLA_CLIENTE
+
+    async def escenario():
+        lento, rapido = hub.suscribir(ana), hub.suscribir(ana)
+        vistos_rapido = []
+        for i in range(n + 5):
+            await _entregar(hub, _aviso("ticket_actualizado", i, ana))
+            vistos_rapido += _vaciar(rapido)
+            if i == n - 1:
+                assert lento.qsize() == n
+        return _vaciar(lento), vistos_rapido
+
+    lento, rapido = asyncio.run(escenario())
+
+    # Al evento 101 se descarta lo pendiente y queda solo el aviso de recargar;
+    # lo que llega después se encola detrás
+    assert lento[0] == {"tipo": "resync"}
+    assert [e["id_ticket"] for e in lento[1:]] == list(range(n + 1, n + 5))
+    assert [e["id_ticket"] for e in rapido] == list(range(n + 5))
+    assert hub.metricas()["resyncs"] == 1
+
+
+def test_avisos_desde_el_hilo_de_listen(hub):
+    ana = uuid.uuid4()
+
+    async def escenario():
+        cola = hub.suscribir(ana)
+        hilo = threading.Thread(target=lambda: [hub._despachar(_aviso("ticket_creado", i, ana)) for i in range(50)])
+        hilo.start()
+        recibidos = [(await asyncio.wait_for(cola.get(), timeout=2))["id_ticket"] for _ in range(50)]
+        hilo.join()
+        return recibidos
+
+    assert asyncio.run(escenario()) == list(range(50))
+
+
+def test_desuscribir_corta_la_entrega_y_limpia_al_analista(hub):
+    ana = uuid.uuid4()
+
+    async def escenario():
+        una, otra = hub.suscribir(ana), hub.suscribir(ana)
+        hub.desuscribir(ana, una)
+        await _entregar(hub, _aviso("ticket_creado", 1, ana))
+        assert (_vaciar(una), len(_vaciar(otra))) == ([], 1)
+        hub.desuscribir(ana, otra)
+        hub.desuscribir(ana, otra)   # dos veces no falla
+
+    asyncio.run(escenario())
+    assert hub._suscriptores == {}
+    assert (hub.metricas()["conexiones"], hub.metricas()["analistas_conectados"]) == (0, 0)
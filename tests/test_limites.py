@@ -0,0 +1,209 @@
+# tests/test_limites.py
+import time
+import asyncio
+
+import fakeredis
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+from src.util import util_limites as lim
+
+CHAT = lim.Grupo("chat", "/api/chat", lim.Presupuesto(3, 1.0), lim.Presupuesto(4, 1.0))
+AUTH = lim.Grupo("auth", "/api/auth", lim.Presupuesto(2, 1.0))
+
+
+class Reloj:
+    """time.monotonic controlable para el backend en memoria."""
+
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    r = Reloj()
+    monkeypatch.setattr(lim.time, "monotonic", r)
+    return r
+
+
+@pytest.fixture(params=["memoria", "redis"])
+def limitador(request):
+    if request.param == "memoria":
+        backend = lim.BackendMemoria()
+    else:
+        backend = lim.BackendRedis(fakeredis.FakeRedis())
+    return lim.Limitador(grupos=(CHAT, AUTH), backend=backend)
+
+
+def _permitidos(limitador, grupo, usuario, cliente, n, ip="10.1.1.1") -> list[bool]:
+    return [limitador.consumir(grupo, usuario, cliente, ip).permitido for _ in range(n)]
+
+
+# =======================================================================
+# Buckets
+# =======================================================================
+
+def test_bucket_se_recarga_con_el_tiempo(reloj):
+    limitador = lim.Limitador(grupos=(AUTH,), backend=lim.BackendMemoria())
+
+    assert _permitidos(limitador, AUTH, "u1", None, 3) == [True, True, False]
+    rechazo = limitador.consumir(AUTH, "u1", None, "ip")
+    assert (rechazo.restantes, rechazo.limite, rechazo.reintentar) == (0, 2, 1.0)
+
+    reloj.ahora += 0.5
+    assert _permitidos(limitador, AUTH, "u1", None, 1) == [False]
+    reloj.ahora += 0.5
+    assert _permitidos(limitador, AUTH, "u1", None, 2) == [True, False]
+    # Nunca supera la capacidad aunque pase mucho tiempo
+    reloj.ahora += 3600
+    assert _permitidos(limitador, AUTH, "u1", None, 3) == [True, True, False]
+
+
+def test_bucket_se_recarga_en_redis():
+    grupo = lim.Grupo("rapido", "/x", lim.Presupuesto(1, 20.0))
+    limitador = lim.Limitador(grupos=(grupo,), backend=lim.BackendRedis(fakeredis.FakeRedis()))
+
+    assert _permitidos(limitador, grupo, "u1", None, 2) == [True, False]
+    time.sleep(0.06)
+    assert _permitidos(limitador, grupo, "u1", None, 1) == [True]
+
+
+def test_limite_de_usuario_y_de_cliente(limitador):
+    # Usuario: 3, cliente: 4. El primer usuario choca con su propio límite...
+    assert _permitidos(limitador, CHAT, "ana", "acme", 4) == [True, True, True, False]
+    # ...y el segundo con el del cliente, que ya gastó 3 de 4
+    assert _permitidos(limitador, CHAT, "beto", "acme", 2) == [True, False]
+    rechazo = limitador.consumir(CHAT, "beto", "acme", "ip")
+    assert rechazo.limite == 4   # se reporta el bucket más restrictivo (el del cliente)
+    # Otro cliente no se ve afectado
+    assert _permitidos(limitador, CHAT, "carla", "globex", 1) == [True]
+
+
+def test_rechazo_no_consume_de_ningun_bucket(limitador):
+    assert _permitidos(limitador, CHAT, "ana", "acme", 3) == [True, True, True]
+    assert _permitidos(limitador, CHAT, "ana", "acme", 5) == [False] * 5
+    # Los rechazos de ana no gastaron el cliente: beto usa el token que queda
+    assert _permitidos(limitador, CHAT, "beto", "acme", 2) == [True, False]
+
+
+def test_sin_usuario_se_limita_por_ip_y_sin_cliente_solo_por_usuario(limitador):
+    assert _permitidos(limitador, AUTH, None, None, 3, ip="1.1.1.1") == [True, True, False]
+    assert _permitidos(limitador, AUTH, None, None, 1, ip="2.2.2.2") == [True]
+    # Analista (sin cliente): solo su bucket de usuario
+    assert _permitidos(limitador, CHAT, "analista", None, 4) == [True, True, True, False]
+
+
+def test_error_del_backend_deja_pasar():
+    class Caido:
+        def consumir(self, claves, presupuestos):
+            raise ConnectionError("redis caído")
+
+    limitador = lim.Limitador(grupos=(AUTH,), backend=Caido())
+    assert limitador.consumir(AUTH, "u1", None, "ip") is None
+    assert limitador.metricas()["errores"] == 1
+
+
+# =======================================================================
+# Middleware
+# =======================================================================
+
+def _app(limitador, identidades: dict, proxies=None):
+    async def ok(request):
+        return PlainTextResponse("ok")
+
+    app = Starlette(routes=[Route("/api/{resto:path}", ok, methods=["GET", "POST"]), Route("/libre", ok)])
+    asgi = lim.LimiteMiddleware(app, identificar=lambda a: identidades.get(a, (None, None)), limitador=limitador)
+    if proxies is not None:
+        asgi = ProxyHeadersMiddleware(asgi, trusted_hosts=proxies)
+    return TestClient(asgi)
+
+
+def test_429_con_cabeceras(limitador):
+    cliente = _app(limitador, {"Bearer t": ("ana", "acme")})
+
+    respuestas = [cliente.get("/api/chat/enviar", headers={"Authorization": "Bearer t"}) for _ in range(4)]
+
+    assert [r.status_code for r in respuestas] == [200, 200, 200, 429]
+    assert [r.headers["ratelimit-remaining"] for r in respuestas] == ["2", "1", "0", "0"]
+    assert respuestas[0].headers["ratelimit-limit"] == "3"
+    rechazo = respuestas[-1]
+    assert int(rechazo.headers["retry-after"]) >= 1
+    assert int(rechazo.headers["ratelimit-reset"]) >= 1
+    assert rechazo.json()["detail"].startswith("Demasiadas peticiones")
+
+
+def test_rutas_sin_grupo_y_preflight_no_se_limitan(limitador):
+    cliente = _app(limitador, {})
+
+    assert all(cliente.get("/libre").status_code == 200 for _ in range(5))
+    assert "ratelimit-limit" not in cliente.get("/libre").headers
+    assert all(cliente.options("/api/auth/login").status_code != 429 for _ in range(5))
+
+
+def test_ip_real_detras_de_un_proxy_confiable(limitador):
+    # TestClient conecta como "testclient": es el proxy de confianza
+    cliente = _app(limitador, {}, proxies=["testclient"])
+
+    def login(xff):
+        return cliente.post("/api/auth/login", headers={"X-Forwarded-For": xff}).status_code
+
+    # Cada cliente real tiene su propio bucket...
+    assert [login("203.0.113.1") for _ in range(3)] == [200, 200, 429]
+    assert login("203.0.113.2") == 200
+    # ...y anteponer una IP falsa no sirve: se usa la última agregada por el proxy
+    assert login("198.51.100.9, 203.0.113.1") == 429
+
+
+def test_sin_proxy_confiable_se_ignora_x_forwarded_for(limitador):
+    cliente = _app(limitador, {}, proxies=["10.0.0.1"])
+
+    estados = [
+        cliente.post("/api/auth/login", headers={"X-Forwarded-For": f"203.0.113.{i}"}).status_code
+        for i in range(3)
+    ]
+    assert estados == [200, 200, 429]
+
+
+# =======================================================================
+# Benchmark
+# =======================================================================
+
+def test_benchmark_sobrecosto_del_middleware():
+    """µs por petición que agrega el middleware (llamada ASGI directa, sin red)."""
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def recibir():
+        return {"type": "http.request", "body": b""}
+
+    async def enviar(mensaje):
+        pass
+
+    def scope(i):
+        return {"type": "http", "method": "GET", "path": "/api/analista/tickets", "client": ("10.0.0.1", 1),
+                "headers": [(b"authorization", f"Bearer t{i % 500}".encode())]}
+
+    async def medir(asgi, n=3000) -> float:
+        inicio = time.perf_counter()
+        for i in range(n):
+            await asgi(scope(i), recibir, enviar)
+        return (time.perf_counter() - inicio) / n * 1e6
+
+    identificar = lambda a: (a, "acme")  # noqa: E731
+    analista = lim.Grupo("analista", "/api/analista", lim.Presupuesto(10**9, 1e6))
+    resultados = {"sin limitador": asyncio.run(medir(app))}
+    for nombre, backend in (("memoria", lim.BackendMemoria()), ("redis (fakeredis)", lim.BackendRedis(fakeredis.FakeRedis()))):
+        asgi = lim.LimiteMiddleware(app, identificar, lim.Limitador(grupos=(analista,), backend=backend))
+        resultados[nombre] = asyncio.run(medir(asgi))
+
+    print("\n  " + " | ".join(f"{k}: {v:.1f} µs" for k, v in resultados.items()))
+    # En memoria el costo es el del salto al threadpool más el bucket: debe quedar bajo 1 ms
+    assert resultados["memoria"] - resultados["sin limitador"] < 1000
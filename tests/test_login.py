@@ -0,0 +1,140 @@
+# tests/test_login.py
+import uuid
+import time
+import asyncio
+import statistics
+import threading
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from src.api.routes import auth
+from src.auth import security
+from src.crud import crud_users
+from src.util import util_catalogo
+from src.util import util_schemas as sch
+from src.util import util_base_de_datos as db
+
+pytestmark = pytest.mark.postgres
+
+
+def _perfil(sub, nombre="Carla Cliente", correo="carla@gmail.com") -> dict:
+    return {"sub": sub, "email": correo, "name": nombre, "hd": None}
+
+
+@pytest.fixture
+def login(sesion, semilla, monkeypatch):
+    """
+    Llama a una ruta de login con un id_token "ya verificado" (sin ir a Google) y el
+    catálogo cargado, como queda tras el arranque de la app.
+    """
+    semilla.cliente_servicio("Gmail", "Soporte general")
+    sesion.commit()
+    util_catalogo.catalogo.refrescar(sesion)
+    perfiles = {}
+    monkeypatch.setattr(security, "verify_google_token", lambda token: perfiles[token])
+
+    def _login(ruta, sub, **perfil):
+        perfiles[sub] = _perfil(sub, **perfil)
+        return asyncio.run(ruta(sch.GoogleLoginRequest(id_token=sub), sesion))["access_token"]
+
+    yield _login
+    util_catalogo.catalogo.invalidar()
+
+
+def _tipos(sentencias) -> list[str]:
+    return [s.split()[0].upper() for s, _ in sentencias]
+
+
+def _contar(sesion, modelo) -> int:
+    return sesion.execute(select(func.count()).select_from(modelo)).scalar()
+
+
+def test_primer_login_y_login_repetido(sesion, login, contar_queries):
+    sub = str(uuid.uuid4())
+
+    with contar_queries() as primero:
+        login(auth.google_login_colaborador, sub)
+    with contar_queries() as repetido:
+        login(auth.google_login_colaborador, sub)
+
+    # Alta: lectura, persona + external en un statement (CTE dentro de un savepoint) y el rol
+    assert _tipos(primero) == ["SELECT", "SAVEPOINT", "WITH", "RELEASE", "INSERT"]
+    # Usuario conocido con el mismo perfil: una sola lectura (external + rol) y ninguna escritura
+    assert _tipos(repetido) == ["SELECT"]
+    # La semilla de Gmail no crea colaboradores: solo el del login
+    assert (_contar(sesion, db.Persona), _contar(sesion, db.External), _contar(sesion, db.Colaborador)) == (1, 1, 1)
+
+
+def test_perfil_cambiado_se_actualiza_con_un_update(sesion, login, contar_queries):
+    sub = str(uuid.uuid4())
+    login(auth.google_login_colaborador, sub)
+
+    with contar_queries() as sentencias:
+        login(auth.google_login_colaborador, sub, nombre="Carla C. Cliente")
+
+    assert _tipos(sentencias) == ["SELECT", "UPDATE"]
+    assert sesion.execute(select(db.External.nombre)).scalar_one() == "Carla C. Cliente"
+
+
+def test_login_de_analista(sesion, login, contar_queries):
+    sub = str(uuid.uuid4())
+
+    with contar_queries() as primero:
+        token = login(auth.google_login_analista, sub)
+    with contar_queries() as repetido:
+        login(auth.google_login_analista, sub)
+
+    assert _tipos(primero) == ["SELECT", "SAVEPOINT", "WITH", "RELEASE", "INSERT"]
+    assert _tipos(repetido) == ["SELECT"]
+    assert sesion.execute(select(db.Analista.nivel)).scalar_one() == 1
+    assert security._decodificar(token)["cli"] == security.ID_NULO
+
+
+def test_altas_concurrentes_crean_una_sola_persona(sesion, login):
+    sub = str(uuid.uuid4())
+    largada = threading.Barrier(6)
+    resultados, errores = [], []
+
+    def alta():
+        with Session(db.engine) as s:
+            largada.wait()
+            try:
+                resultados.append(crud_users.get_or_create_from_external(s, _perfil(sub))[0])
+                s.commit()
+            except Exception as e:  # pragma: no cover - solo para reportar desde el hilo
+                errores.append(e)
+
+    hilos = [threading.Thread(target=alta) for _ in range(6)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    # El ON CONFLICT de los perdedores revierte su savepoint: sin personas huérfanas
+    assert not errores
+    assert len(set(resultados)) == 1
+    assert (_contar(sesion, db.Persona), _contar(sesion, db.External)) == (1, 1)
+
+
+def test_benchmark_latencia_y_queries_por_login(sesion, login, contar_queries):
+    n = 200
+    subs = [str(uuid.uuid4()) for _ in range(n)]
+    resultados = {}
+    for nombre in ("primer login", "repetido"):
+        tiempos = []
+        with contar_queries() as sentencias:
+            for sub in subs:
+                inicio = time.perf_counter()
+                login(auth.google_login_colaborador, sub)
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+        resultados[nombre] = len(sentencias) / n
+        print(
+            f"\n  {nombre:>12}: mediana {statistics.median(tiempos):.2f} ms, "
+            f"p95 {statistics.quantiles(tiempos, n=20)[-1]:.2f} ms, {len(sentencias) / n:.1f} queries/login",
+            end="",
+        )
+    print()
+
+    assert resultados == {"primer login": 5, "repetido": 1}
@@ -0,0 +1,120 @@
+# tests/test_notificaciones.py
+"""
+Avisos de la BD hacia las cachés en memoria de un proceso en marcha: los triggers
+de las migraciones 0008 (catálogo) y 0010 (analista) hacen NOTIFY, el hub de
+eventos los recibe por LISTEN y los oyentes que registra main invalidan.
+"""
+import time
+import uuid
+
+import pytest
+from sqlalchemy import insert, select, text
+from sqlalchemy.orm import Session
+
+import main
+from src.crud import crud_analista
+from src.util import util_catalogo, util_eventos
+from src.util import util_base_de_datos as db
+from src.util import util_schemas as sch
+
+pytestmark = pytest.mark.postgres
+
+
+def _esperar(condicion, timeout: float = 3.0) -> bool:
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if condicion():
+            return True
+        time.sleep(0.02)
+    return condicion()
+
+
+@pytest.fixture
+def proceso(sesion, semilla, monkeypatch):
+    """El arranque de main (catálogo + oyentes + LISTEN) sobre un hub propio."""
+    id_cliente, _ = semilla.cliente_servicio("Acme", "Analítica")
+    sesion.commit()
+    hub = util_eventos.HubEventos()
+    monkeypatch.setattr(util_eventos, "hub_eventos", hub)
+
+    def oyentes() -> set:
+        # Conexión nueva en cada consulta: pg_stat_activity es una foto por transacción.
+        # El hub de una prueba anterior puede seguir conectado unos segundos tras detener().
+        with db.engine.connect() as conn:
+            return set(conn.execute(text(
+                "SELECT pid FROM pg_stat_activity WHERE query = 'LISTEN analista_cambios'"
+            )).scalars())
+
+    previos = oyentes()
+    main.cargar_catalogo()
+    assert _esperar(lambda: oyentes() - previos)
+    yield str(sesion.execute(select(db.Cliente.id_cliente)).scalar_one())
+    hub.detener()
+    util_catalogo.catalogo.invalidar()
+    crud_analista.invalidate_analyst_principal()
+
+
+def test_cambio_confirmado_en_el_catalogo_lo_invalida(sesion, proceso):
+    catalogo = util_catalogo.catalogo
+    assert catalogo.resolver_servicio(sesion, proceso, "Soporte BI") is None
+
+    # Otra conexión (p. ej. un backoffice) contrata un servicio nuevo
+    with Session(db.engine) as otra:
+        id_servicio = uuid.uuid4()
+        otra.execute(insert(db.Servicio), [{"id_servicio": id_servicio, "nombre": "Soporte BI"}])
+        otra.execute(insert(db.ClienteServicio), [
+            {"id_cliente_servicio": uuid.uuid4(), "id_cliente": uuid.UUID(proceso), "id_servicio": id_servicio}
+        ])
+        otra.commit()
+
+    assert _esperar(lambda: catalogo._cargado_en == 0.0)
+    # Sin esperar RECARGA_MINIMA: el próximo acceso recarga
+    assert catalogo.resolver_servicio(sesion, proceso, "Soporte BI") is not None
+
+
+def test_cambio_revertido_en_el_catalogo_no_avisa(sesion, proceso):
+    catalogo = util_catalogo.catalogo
+    version = catalogo.version
+
+    with Session(db.engine) as otra:
+        otra.execute(text("UPDATE cliente SET nombre = 'Acme SA'"))
+        otra.rollback()
+    time.sleep(0.3)
+
+    assert catalogo._cargado_en != 0.0
+    assert catalogo.nombre_cliente(sesion, proceso) == "Acme"
+    assert catalogo.version == version
+
+
+def test_cambio_de_nivel_o_baja_del_analista_invalida_su_identidad(sesion, semilla, proceso):
+    id_analista = semilla.analista(1)
+    otro = semilla.analista(1)
+    sesion.commit()
+    personas = dict(sesion.execute(select(db.Analista.id_analista, db.Analista.id_persona)).all())
+    usuario = sch.TokenData(
+        persona_id=str(personas[id_analista]), colaborador_id="-", cliente_id="-", nombre="Ana",
+        correo="ana@soporte.test", cliente_nombre="ANALYTICS", servicios_contratados=[],
+    )
+
+    def cacheado(persona) -> bool:
+        return persona in crud_analista._principales
+
+    assert crud_analista.get_analyst_principal(sesion, usuario).nivel == 1
+    crud_analista.get_analyst_principal(sesion, usuario.model_copy(update={"persona_id": str(personas[otro])}))
+
+    with Session(db.engine) as admin:
+        admin.execute(text("UPDATE analista SET nivel = 2 WHERE id_analista = :a"), {"a": id_analista})
+        admin.commit()
+
+    # Solo se olvida la persona afectada
+    assert _esperar(lambda: not cacheado(personas[id_analista]))
+    assert cacheado(personas[otro])
+    assert crud_analista.get_analyst_principal(sesion, usuario).nivel == 2
+    sesion.rollback()
+
+    with Session(db.engine) as admin:
+        admin.execute(text("DELETE FROM analista WHERE id_analista = :a"), {"a": id_analista})
+        admin.commit()
+
+    assert _esperar(lambda: not cacheado(personas[id_analista]))
+    assert crud_analista.get_analyst_principal(sesion, usuario) is None
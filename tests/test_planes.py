@@ -0,0 +1,122 @@
+# tests/test_planes.py
+"""
+Regresión de planes: ejecuta las queries de las rutas calientes del crud contra
+un Postgres sembrado, les hace EXPLAIN y falla si alguna recorre secuencialmente
+una tabla caliente. Con enable_seqscan = off el planner solo elige un Seq Scan
+cuando ningún índice sirve, así el resultado no depende del tamaño de la siembra.
+"""
+import uuid
+
+import pytest
+from sqlalchemy import select, text
+
+from src.crud import crud_analista, crud_tickets, crud_users
+from src.util import util_base_de_datos as db
+from src.util import util_schemas as sch
+
+pytestmark = pytest.mark.postgres
+
+TABLAS_CALIENTES = {"ticket", "escalado", "external", "conversacion_mensaje", "analista", "colaborador"}
+
+
+def _nodos(plan: dict):
+    yield plan
+    for hijo in plan.get("Plans", []):
+        yield from _nodos(hijo)
+
+
+def scans_secuenciales(sentencias) -> list[tuple[str, str]]:
+    """(tabla, sql) por cada Seq Scan sobre una tabla caliente en los planes de `sentencias`."""
+    encontrados = []
+    with db.engine.connect() as conn:
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute("SET enable_seqscan = off")
+            for sql, parametros in sentencias:
+                if not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+                    continue
+                cursor.execute("EXPLAIN (FORMAT JSON) " + sql, parametros)
+                plan = cursor.fetchone()[0][0]["Plan"]
+                encontrados += [
+                    (n["Relation Name"], sql)
+                    for n in _nodos(plan)
+                    if n["Node Type"] == "Seq Scan" and n.get("Relation Name") in TABLAS_CALIENTES
+                ]
+        finally:
+            cursor.close()
+            conn.rollback()
+    return encontrados
+
+
+@pytest.fixture
+def sembrado(sesion, semilla):
+    id_cliente, id_cs = semilla.cliente_servicio("Acme", "Analítica")
+    id_colaborador = semilla.colaborador(id_cliente, "Carla Cliente")
+    analistas = [semilla.analista(nivel) for nivel in (1, 1, 2)]
+    for i, id_analista in enumerate(analistas):
+        semilla.tickets(
+            1000, id_colaborador if i == 0 else semilla.colaborador(id_cliente), id_cs, id_analista,
+            asuntos=["Error al generar reporte en PDF", "No carga el dashboard de ventas", "Acceso denegado"],
+        )
+    ids = sesion.execute(select(db.Ticket.id_ticket).order_by(db.Ticket.id_ticket)).scalars().all()
+    for id_ticket in ids[::20]:
+        semilla.escalado(id_ticket, "Requiere nivel 2", analistas[0], analistas[2])
+        semilla.mensajes(id_ticket, 5)
+    semilla.contadores()
+    sesion.commit()
+    sesion.execute(text("ANALYZE"))
+
+    persona, correo, nombre = sesion.execute(
+        select(db.External.id_persona, db.External.correo, db.External.nombre)
+        .join(db.Colaborador, db.Colaborador.id_persona == db.External.id_persona)
+        .where(db.Colaborador.id_colaborador == id_colaborador)
+    ).one()
+    usuario = sch.TokenData(
+        persona_id=str(persona), colaborador_id=str(id_colaborador), cliente_id=str(id_cliente),
+        nombre=nombre, correo=correo, cliente_nombre="Acme", servicios_contratados=[],
+    )
+    return {"analista": analistas[0], "usuario": usuario, "ticket": ids[20], "correo": correo, "nombre": nombre}
+
+
+def _rutas_calientes(sesion, s):
+    """Las lecturas de las rutas calientes, tal como las hace la API."""
+    analista, usuario = s["analista"], s["usuario"]
+    rows, _, cursor = crud_analista.get_tickets_by_analyst(sesion, analista, limit=20)
+    crud_analista.get_tickets_by_analyst(sesion, analista, limit=20, cursor=cursor)
+    crud_analista.get_tickets_by_analyst(sesion, analista, limit=20, estados=["aceptado"])
+    crud_analista.get_tickets_by_analyst(sesion, analista, limit=20, orden="prioridad")
+    crud_analista.hydrate_ticket_page(sesion, rows)
+    crud_analista.get_ticket_detail(sesion, s["ticket"])
+    crud_analista.get_ticket_version(sesion, s["ticket"])
+    crud_analista.get_conversation_page(sesion, s["ticket"], antes=4)
+    crud_analista.get_inbox_version(sesion, analista)
+
+    crud_analista.invalidate_analyst_principal()
+    crud_analista.get_analyst_principal(sesion, usuario)
+
+    crud_tickets.get_all_tickets(sesion, usuario, limit=10)
+    crud_tickets.get_all_open_tickets(sesion, usuario, limit=10)
+    crud_tickets.get_ticket_by_id_db(sesion, s["ticket"], usuario)
+    crud_tickets.get_tickets_by_subject(sesion, "reportes PDF", usuario)
+
+    crud_users.get_or_create_from_external(
+        sesion, {"sub": usuario.persona_id, "email": s["correo"], "name": s["nombre"], "hd": None},
+        rol=db.Colaborador,
+    )
+
+
+def test_rutas_calientes_sin_seq_scan(sesion, sembrado, contar_queries):
+    with contar_queries() as sentencias:
+        _rutas_calientes(sesion, sembrado)
+
+    assert len(sentencias) > 15
+    assert scans_secuenciales(sentencias) == []
+
+
+def test_el_arnes_detecta_un_seq_scan(sesion, sembrado, contar_queries):
+    # Filtro sin índice: debe reportarse
+    with contar_queries() as sentencias:
+        sesion.query(db.Ticket).filter(db.Ticket.tipo == "incidencia", db.Ticket.diagnostico.is_(None)).limit(5).all()
+        sesion.query(db.External).filter(db.External.correo == f"{uuid.uuid4()}@x.test").all()
+
+    assert {tabla for tabla, _ in scans_secuenciales(sentencias)} == {"ticket", "external"}
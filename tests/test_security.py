@@ -0,0 +1,157 @@
+# tests/test_security.py
+import time
+import uuid
+import datetime
+
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+from sqlalchemy import select
+
+from src.auth import security
+from src.util import util_catalogo
+from src.util import util_schemas as sch
+from src.util import util_base_de_datos as db
+
+
+@pytest.fixture(autouse=True)
+def sin_claims_cacheados():
+    security._claims_verificados.clear()
+    yield
+    security._claims_verificados.clear()
+    util_catalogo.catalogo.invalidar()
+
+
+@pytest.fixture
+def cliente(sesion, semilla):
+    """id_cliente (como lo devuelve la BD) de un cliente con dos servicios contratados."""
+    id_cliente, _ = semilla.cliente_servicio("Acme", "Analítica")
+    id_servicio = uuid.uuid4()
+    semilla.s.execute(db.Servicio.__table__.insert(), [{"id_servicio": id_servicio, "nombre": "Soporte BI"}])
+    semilla.s.execute(db.ClienteServicio.__table__.insert(), [
+        {"id_cliente_servicio": uuid.uuid4(), "id_cliente": id_cliente, "id_servicio": id_servicio}
+    ])
+    sesion.commit()
+    util_catalogo.catalogo.refrescar(sesion)
+    return str(sesion.execute(select(db.Cliente.id_cliente)).scalar_one())
+
+
+def _token_data(cliente_id: str, colaborador_id: str = None) -> sch.TokenData:
+    return sch.TokenData(
+        persona_id=str(uuid.uuid4()), colaborador_id=colaborador_id or str(uuid.uuid4()), cliente_id=cliente_id,
+        nombre="Carla", correo="carla@acme.test", cliente_nombre="(no viaja en el token)", servicios_contratados=[],
+    )
+
+
+def _token_v1(data: sch.TokenData, **extra) -> str:
+    """Token con el formato anterior: el TokenData completo en los claims."""
+    claims = data.model_dump() | {"exp": datetime.datetime.utcnow() + datetime.timedelta(hours=1)} | extra
+    return jwt.encode(claims, security.SECRET_KEY, algorithm=security.ALGORITHM)
+
+
+def test_token_v2_solo_lleva_ids_y_el_perfil_sale_del_catalogo(sesion, cliente):
+    data = _token_data(cliente)
+    token = security.create_access_token(data)
+
+    claims = jwt.get_unverified_claims(token)
+    assert set(claims) == {"sub", "col", "cli", "nom", "cor", "ver", "exp"}
+
+    usuario = security.get_current_user(token, sesion)
+    assert (usuario.persona_id, usuario.colaborador_id, usuario.cliente_id) == (
+        data.persona_id, data.colaborador_id, cliente
+    )
+    assert usuario.cliente_nombre == "Acme"
+    assert sorted(s.nombre for s in usuario.servicios_contratados) == ["Analítica", "Soporte BI"]
+
+
+def test_token_v2_de_cliente_inexistente(sesion, cliente):
+    usuario = security.get_current_user(security.create_access_token(_token_data(str(uuid.uuid4()))), sesion)
+    assert (usuario.cliente_nombre, usuario.servicios_contratados) == ("Cliente Desconocido", [])
+
+
+def test_analista_con_id_nulo_no_consulta_el_catalogo(sesion, contar_queries):
+    token = security.create_access_token(_token_data(security.ID_NULO, security.ID_NULO))
+
+    with contar_queries() as sentencias:
+        usuario = security.get_current_user(token, sesion)
+
+    assert sentencias == []
+    assert (usuario.cliente_nombre, usuario.servicios_contratados) == ("ANALYTICS", [])
+    assert security.identidad_limites(f"Bearer {token}") == (usuario.persona_id, None)
+
+
+def test_token_anterior_sigue_valiendo(sesion):
+    data = _token_data(str(uuid.uuid4()))
+    data.cliente_nombre = "Acme"
+    data.servicios_contratados = [sch.ServicioInfo(id_servicio="s1", nombre="Analítica")]
+    token = _token_v1(data)
+
+    assert security.get_current_user(token, sesion) == data
+    assert security.identidad_limites(f"Bearer {token}") == (data.colaborador_id, data.cliente_id)
+
+
+@pytest.mark.parametrize("token", [
+    _token_v1(_token_data(str(uuid.uuid4())), correo=None),                                 # v1 inválido
+    jwt.encode({"sub": "x", "ver": 2, "exp": time.time() + 60}, security.SECRET_KEY),         # v2 sin claims
+    jwt.encode({"sub": "x", "ver": 2, "exp": time.time() + 60}, "otra-llave"),                # firma ajena
+    jwt.encode({"sub": "x", "ver": 2, "exp": time.time() - 60}, security.SECRET_KEY),         # vencido
+    "no-es-un-jwt",
+])
+def test_tokens_invalidos_dan_401(sesion, token):
+    with pytest.raises(HTTPException) as error:
+        security.get_current_user(token, sesion)
+    assert error.value.status_code == 401
+
+
+def test_claims_cacheados_evitan_reverificar(sesion, monkeypatch):
+    token = security.create_access_token(_token_data(security.ID_NULO, security.ID_NULO))
+    verificaciones = []
+    decode = jwt.decode
+    monkeypatch.setattr(security.jwt, "decode", lambda *a, **k: verificaciones.append(1) or decode(*a, **k))
+
+    for _ in range(5):
+        security.get_current_user(token, sesion)
+
+    assert verificaciones == [1]
+
+
+def test_claims_cacheados_vencidos_se_reverifican(sesion):
+    # Token que ya venció pero cuyos claims siguen en el caché (TTL del caché > exp)
+    claims = {"sub": "x", "col": security.ID_NULO, "cli": security.ID_NULO, "nom": "A", "cor": "a@x",
+              "ver": 2, "exp": int(time.time()) - 1}
+    token = jwt.encode(claims, security.SECRET_KEY, algorithm=security.ALGORITHM)
+    security._claims_verificados[token] = claims
+
+    with pytest.raises(HTTPException) as error:
+        security.get_current_user(token, sesion)
+    assert error.value.status_code == 401
+    assert security.identidad_limites(f"Bearer {token}") == (None, None)
+
+
+def test_benchmark_get_current_user(sesion, cliente):
+    """
+    Costo por petición de get_current_user: token v2 con claims cacheados y perfil
+    del catálogo, contra reverificar cada vez y validar el TokenData completo (v1).
+    """
+    data = _token_data(cliente)
+    token_v2 = security.create_access_token(data)
+    data.servicios_contratados = [sch.ServicioInfo(id_servicio=str(uuid.uuid4()), nombre=f"Servicio {i}") for i in range(8)]
+    token_v1 = _token_v1(data)
+
+    def medir(fn, n=5000) -> float:
+        inicio = time.perf_counter()
+        for _ in range(n):
+            fn()
+        return (time.perf_counter() - inicio) / n * 1e6
+
+    v2 = medir(lambda: security.get_current_user(token_v2, sesion))
+
+    def v1_sin_cache():
+        security._claims_verificados.clear()
+        security.get_current_user(token_v1, sesion)
+
+    v1 = medir(v1_sin_cache)
+    print(f"\n  get_current_user: v2 cacheado {v2:.1f} µs | v1 verificando cada vez {v1:.1f} µs "
+          f"| tokens de {len(token_v2)} vs {len(token_v1)} bytes")
+    assert len(token_v2) < len(token_v1)
+    assert v2 < v1
@@ -0,0 +1,149 @@
+# tests/test_sla.py
+import datetime
+
+import pytest
+from sqlalchemy import select, text
+
+from src.crud import crud_analista, crud_tickets
+from src.util import util_asignacion, util_catalogo, util_sla
+from src.util import util_base_de_datos as db
+from src.util import util_schemas as sch
+
+INICIO = datetime.datetime(2025, 3, 3, 9, 30)
+
+
+@pytest.mark.parametrize("nivel, plazo", [
+    ("crítico", datetime.timedelta(hours=4)),
+    ("alto", datetime.timedelta(days=1)),
+    ("medio", datetime.timedelta(days=2)),
+    ("bajo", datetime.timedelta(days=4)),
+])
+def test_vencimiento_por_nivel(nivel, plazo):
+    assert util_sla.calcular_vencimiento(nivel, INICIO) == INICIO + plazo
+
+
+@pytest.mark.parametrize("nivel, desde", [("urgente", INICIO), (None, INICIO), ("alto", None)])
+def test_sin_plazo_no_hay_vencimiento(nivel, desde):
+    assert util_sla.calcular_vencimiento(nivel, desde) is None
+
+
+@pytest.mark.postgres
+def test_alta_y_cambio_de_nivel_calculan_due_at_desde_la_creacion(sesion, semilla):
+    id_cliente, _ = semilla.cliente_servicio("Acme", "Analítica")
+    id_colaborador = semilla.colaborador(id_cliente)
+    id_analista = semilla.analista(1)
+    sesion.commit()
+    util_catalogo.catalogo.refrescar(sesion)
+    util_asignacion.indice_analistas.refrescar(sesion)
+    usuario = sch.TokenData(
+        persona_id="-", colaborador_id=str(id_colaborador), cliente_id=str(id_cliente),
+        nombre="Carla", correo="carla@acme.test", cliente_nombre="Acme", servicios_contratados=[],
+    )
+    try:
+        creados = {
+            nivel: crud_tickets.create_ticket_db(sesion, usuario, f"Ticket {nivel}", "incidencia", nivel, "Analítica")
+            for nivel in util_sla.SLA_POR_NIVEL
+        }
+    finally:
+        util_catalogo.catalogo.invalidar()
+        util_asignacion.indice_analistas._cargado_en = 0.0
+
+    for nivel, ticket in creados.items():
+        assert ticket.due_at == util_sla.calcular_vencimiento(nivel, ticket.created_at)
+
+    # Cambiar el nivel recalcula el plazo desde la creación, no desde ahora
+    ticket = creados["bajo"]
+    info = crud_analista.apply_ticket_changes_db(sesion, ticket.id_ticket, id_analista, new_level="crítico")
+    assert info["due_at"] == util_sla.calcular_vencimiento("crítico", ticket.created_at)
+
+
+@pytest.fixture
+def cola(sesion, semilla):
+    """
+    Un analista con 48 tickets (un tercio cerrados) en cuatro grupos de vencimiento
+    relativos a ahora: vencidos, en riesgo, al límite de la ventana y holgados.
+    Cada grupo comparte due_at, así el desempate es por id_ticket.
+    """
+    id_cliente, id_cs = semilla.cliente_servicio()
+    id_analista = semilla.analista(1)
+    semilla.tickets(48, semilla.colaborador(id_cliente), id_cs, id_analista)
+    semilla.contadores()
+    ahora = datetime.datetime.utcnow()
+    sesion.execute(
+        text("""
+            UPDATE ticket SET due_at = CASE id_ticket % 4
+                WHEN 0 THEN CAST(:ahora AS timestamp) - interval '3 hours'
+                WHEN 1 THEN CAST(:ahora AS timestamp) + interval '1 hour'
+                WHEN 2 THEN CAST(:ahora AS timestamp) + interval '3 hours'
+                ELSE CAST(:ahora AS timestamp) + interval '3 days'
+            END
+        """),
+        {"ahora": ahora},
+    )
+    sesion.commit()
+    return id_analista
+
+
+def _abiertos(sesion, id_analista, desde=None, hasta=None) -> list[int]:
+    """ids de los tickets abiertos con desde <= due_at < hasta, por (due_at, id_ticket)."""
+    T = db.Ticket
+    q = select(T.id_ticket).where(T.id_analista == id_analista, T.estado.in_(util_sla.ESTADOS_ABIERTOS))
+    if desde:
+        q = q.where(T.due_at >= desde)
+    if hasta:
+        q = q.where(T.due_at < hasta)
+    return sesion.execute(q.order_by(T.due_at, T.id_ticket)).scalars().all()
+
+
+def _recorrer(sesion, id_analista, limit=5, **kwargs):
+    ids, totales, cursor = [], set(), None
+    while True:
+        rows, total, cursor = crud_analista.get_tickets_by_analyst(
+            sesion, id_analista, limit=limit, cursor=cursor, **kwargs
+        )
+        ids += [r.id_ticket for r in rows]
+        totales.add(total)
+        if not cursor:
+            return ids, totales
+
+
+@pytest.mark.postgres
+def test_orden_prioridad_solo_abiertos_por_vencimiento(sesion, cola):
+    ids, totales = _recorrer(sesion, cola, orden="prioridad")
+    por_offset = [
+        r.id_ticket
+        for offset in range(0, 40, 5)
+        for r in crud_analista.get_tickets_by_analyst(sesion, cola, limit=5, offset=offset, orden="prioridad")[0]
+    ]
+
+    esperado = _abiertos(sesion, cola)
+    assert len(esperado) == 32
+    assert ids == por_offset == esperado
+    # Sin filtro de SLA el total sale de los contadores de los estados abiertos
+    assert totales == {32}
+
+
+@pytest.mark.postgres
+@pytest.mark.parametrize("sla", ["vencido", "en_riesgo"])
+def test_filtro_sla_con_total_por_count(sesion, cola, contar_queries, sla):
+    # Contadores desfasados: con filtro de SLA el total no sale de ahí
+    sesion.execute(text("UPDATE contador_analista SET total = total + 100"))
+    sesion.commit()
+    ahora = datetime.datetime.utcnow()
+    if sla == "vencido":
+        esperado = _abiertos(sesion, cola, hasta=ahora)
+    else:
+        esperado = _abiertos(sesion, cola, desde=ahora, hasta=ahora + util_sla.VENTANA_RIESGO)
+
+    with contar_queries() as sentencias:
+        ids, totales = _recorrer(sesion, cola, sla=sla, orden="prioridad")
+
+    assert len(esperado) == 8
+    assert ids == esperado
+    assert totales == {8}
+    assert not any("contador_analista" in s for s, _ in sentencias)
+
+    # Con estados explícitos el filtro de SLA se combina con ellos
+    rows, total, _ = crud_analista.get_tickets_by_analyst(sesion, cola, limit=50, estados=["en atención"], sla=sla)
+    assert total == len(rows) == 4
+    assert {r.estado for r in rows} == {"en atención"}
@@ -0,0 +1,148 @@
+# tests/test_tareas.py
+import pytest
+from sqlalchemy import text
+
+from src.util import util_tareas
+from src.util import util_base_de_datos as db
+
+pytestmark = pytest.mark.postgres
+
+
+@pytest.fixture
+def manejadores():
+    """Registra manejadores de prueba y los quita al terminar."""
+    registrados = []
+
+    def registrar(tipo, funcion):
+        util_tareas.manejador(tipo)(funcion)
+        registrados.append(tipo)
+
+    yield registrar
+    for tipo in registrados:
+        util_tareas._MANEJADORES.pop(tipo, None)
+
+
+def _encolar(sesion, tipo, payload=None) -> None:
+    util_tareas.encolar(sesion, tipo, payload or {})
+    sesion.commit()
+
+
+def _tarea(sesion, tipo="prueba"):
+    sesion.rollback()
+    return sesion.execute(
+        text("SELECT estado, intentos, ultimo_error, disponible_en - now() AS espera"
+             " FROM outbox_tarea WHERE tipo = :t"),
+        {"t": tipo},
+    ).mappings().one()
+
+
+def test_lease_reserva_la_tarea_hasta_que_vence(sesion):
+    _encolar(sesion, "prueba")
+    uno, otro = util_tareas.TrabajadorTareas(), util_tareas.TrabajadorTareas()
+
+    tomadas = uno.tomar(db.engine)
+    assert [t["intentos"] for t in tomadas] == [1]
+    # Mientras dura el lease ningún otro trabajador la toma
+    assert otro.tomar(db.engine) == []
+    assert _tarea(sesion)["espera"].total_seconds() > util_tareas.LEASE_SEGUNDOS - 5
+
+    # El proceso "cayó" y el lease venció: vuelve a estar disponible
+    sesion.execute(text("UPDATE outbox_tarea SET disponible_en = now() - interval '1 second'"))
+    sesion.commit()
+    assert [t["intentos"] for t in otro.tomar(db.engine)] == [2]
+
+
+def test_tarea_exitosa_aplica_sus_cambios_y_queda_hecha(sesion, manejadores):
+    vistos = []
+    manejadores("prueba", lambda s, payload: vistos.append(payload))
+    _encolar(sesion, "prueba", {"x": 1})
+
+    assert util_tareas.TrabajadorTareas().procesar_lote() == 1
+
+    assert vistos == [{"x": 1}]
+    assert _tarea(sesion)["estado"] == "hecho"
+
+
+def test_falla_del_manejador_deja_la_tarea_pendiente_con_backoff(sesion, manejadores):
+    def fallar(s, payload):
+        s.execute(text("INSERT INTO tarea_periodica (nombre, proxima_en) VALUES ('no_debe_quedar', now())"))
+        raise RuntimeError("sin conexión")
+
+    manejadores("prueba", fallar)
+    trabajador = util_tareas.TrabajadorTareas()
+    _encolar(sesion, "prueba")
+
+    trabajador.procesar_lote()
+    tarea = _tarea(sesion)
+    assert (tarea["estado"], tarea["intentos"], tarea["ultimo_error"]) == ("pendiente", 1, "sin conexión")
+    assert 0 < tarea["espera"].total_seconds() <= 2
+    # Lo que escribió el manejador se deshizo junto con el intento
+    assert sesion.execute(text("SELECT count(*) FROM tarea_periodica")).scalar() == 0
+
+    # Todavía no venció el backoff: no se vuelve a tomar
+    assert trabajador.procesar_lote() == 0
+
+    # Backoff exponencial: 2^intentos segundos
+    sesion.execute(text("UPDATE outbox_tarea SET disponible_en = now()"))
+    sesion.commit()
+    trabajador.procesar_lote()
+    tarea = _tarea(sesion)
+    assert tarea["intentos"] == 2
+    assert 2 < tarea["espera"].total_seconds() <= 4
+
+
+def test_agotar_los_intentos_marca_fallido(sesion, manejadores):
+    manejadores("prueba", lambda s, payload: 1 / 0)
+    _encolar(sesion, "prueba")
+    sesion.execute(text("UPDATE outbox_tarea SET intentos = :n"), {"n": util_tareas.MAX_INTENTOS - 1})
+    sesion.commit()
+
+    util_tareas.TrabajadorTareas().procesar_lote()
+
+    assert _tarea(sesion)["estado"] == "fallido"
+
+
+def test_tipo_sin_manejador_se_reintenta(sesion):
+    _encolar(sesion, "prueba_sin_manejador")
+
+    util_tareas.TrabajadorTareas().procesar_lote()
+
+    tarea = _tarea(sesion, "prueba_sin_manejador")
+    assert tarea["estado"] == "pendiente"
+    assert "No hay manejador" in tarea["ultimo_error"]
+
+
+def test_purga_borra_solo_hechas_viejas_por_lotes(sesion):
+    sesion.execute(text("""
+        INSERT INTO outbox_tarea (tipo, estado, procesado_en)
+        SELECT 'prueba', 'hecho', now() - interval '30 days' FROM generate_series(1, 7)
+        UNION ALL SELECT 'reciente', 'hecho', now() - interval '1 hour'
+        UNION ALL SELECT 'fallida', 'fallido', now() - interval '30 days'
+        UNION ALL SELECT 'pendiente', 'pendiente', NULL
+    """))
+    sesion.commit()
+
+    assert util_tareas.purgar_hechas(sesion, lote=3) == 7
+
+    quedan = sesion.execute(text("SELECT tipo FROM outbox_tarea ORDER BY tipo")).scalars().all()
+    assert quedan == ["fallida", "pendiente", "reciente"]
+
+
+def test_periodica_corre_una_vez_por_intervalo_entre_procesos(sesion):
+    corridas = []
+    util_tareas.periodica("prueba_periodica", 3600)(lambda s: corridas.append(1))
+    try:
+        uno, otro = util_tareas.TrabajadorTareas(), util_tareas.TrabajadorTareas()
+        assert "prueba_periodica" in uno.ejecutar_periodicas()
+        # Otro proceso en el mismo intervalo no la repite
+        assert "prueba_periodica" not in otro.ejecutar_periodicas()
+
+        # Venció el intervalo: el próximo que revisa la corre
+        sesion.execute(text("UPDATE tarea_periodica SET proxima_en = now() - interval '1 second'"))
+        sesion.commit()
+        otro._revisar_periodicas_en.clear()
+        assert "prueba_periodica" in otro.ejecutar_periodicas()
+    finally:
+        util_tareas._PERIODICAS.pop("prueba_periodica")
+
+    assert corridas == [1, 1]
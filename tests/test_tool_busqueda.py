@@ -0,0 +1,117 @@
+# tests/test_tool_busqueda.py
+import re
+import datetime
+from types import SimpleNamespace
+
+from src.tool.tool_busqueda import ToolBusqueda, MAX_TICKETS_LISTADO
+from src.util import util_schemas as sch
+
+
+def _contador_tokens():
+    """tiktoken (cl100k_base) si está disponible; si no, palabras + signos como aproximación."""
+    try:
+        import tiktoken
+        codificacion = tiktoken.get_encoding("cl100k_base")
+        return "tiktoken", lambda texto: len(codificacion.encode(texto))
+    except Exception:
+        return "aproximado", lambda texto: len(re.findall(r"\w+|[^\w\s]", texto))
+
+
+def _tickets(n: int) -> list:
+    niveles = ["bajo", "medio", "alto", "crítico"]
+    estados = ["aceptado", "en atención", "finalizado"]
+    servicio = SimpleNamespace(servicio=SimpleNamespace(nombre="Analítica"))
+    analista = SimpleNamespace(persona=SimpleNamespace(external_collection=[SimpleNamespace(nombre="Ana Lista")]))
+    return [
+        SimpleNamespace(
+            id_ticket=n - i,
+            asunto=f"El reporte mensual de ventas número {i} no carga los filtros por región",
+            tipo="incidencia",
+            nivel=niveles[i % 4],
+            estado=estados[i % 3],
+            diagnostico="Se reprocesó el modelo." if i % 3 == 2 else None,
+            cliente_servicio=servicio,
+            analista=analista,
+            created_at=datetime.datetime(2025, 1, 1) + datetime.timedelta(hours=i),
+        )
+        for i in range(n)
+    ]
+
+
+def _conteos(tickets) -> dict:
+    conteos = {}
+    for t in tickets:
+        conteos[(t.nivel, t.estado)] = conteos.get((t.nivel, t.estado), 0) + 1
+    return conteos
+
+
+def _listado_anterior(tool: ToolBusqueda, tickets) -> str:
+    """Formato previo: todos los tickets como bloques Markdown."""
+    return "He encontrado los siguientes tickets:\n" + "\n\n".join(tool._format_ticket_details(t) for t in tickets)
+
+
+def test_benchmark_tokens_por_listado():
+    nombre, contar = _contador_tokens()
+    tool = ToolBusqueda(db=None, user_info=None)
+
+    print(f"\nTokens por listado ({nombre}):")
+    compactos = {}
+    for n in (10, 100, 1000):
+        tickets = _tickets(n)
+        antes = contar(_listado_anterior(tool, tickets))
+        despues = contar(tool._format_listado(tickets[:tool.limite_listado], _conteos(tickets)))
+        compactos[n] = despues
+        print(f"  {n:>5} tickets: antes {antes:>7} | compacto {despues:>5} ({despues / antes:.1%})")
+        assert despues < antes
+
+    # Con el tope de filas el costo ya no crece con la cantidad de tickets del colaborador
+    assert compactos[1000] <= compactos[10] * 1.1
+
+
+def test_filas_compactas_cuestan_menos_que_el_detalle():
+    _, contar = _contador_tokens()
+    tickets = _tickets(100)
+    tool = ToolBusqueda(db=None, user_info=None, limite_listado=100)
+
+    compacto = contar(tool._format_listado(tickets, _conteos(tickets)))
+    assert compacto < contar(_listado_anterior(tool, tickets)) / 2
+
+
+def test_cabecera_con_conteos_y_filas_truncadas():
+    tickets = _tickets(30)
+    tool = ToolBusqueda(db=None, user_info=None)
+
+    lineas = tool._format_listado(tickets[:MAX_TICKETS_LISTADO], _conteos(tickets)).splitlines()
+
+    assert lineas[0] == (
+        "Total: 30 | Nivel: crítico 7, alto 7, medio 8, bajo 8 | "
+        "Estado: aceptado 10, en atención 10, finalizado 10"
+    )
+    filas = lineas[3:]
+    assert len(filas) == MAX_TICKETS_LISTADO
+    asunto = filas[0].split("|")[1]
+    assert len(asunto) == 60 and asunto.endswith("…")
+
+
+def test_listado_y_detalle_por_id_desde_la_base(sesion, semilla):
+    id_cliente, id_cs = semilla.cliente_servicio()
+    id_colaborador = semilla.colaborador(id_cliente)
+    semilla.tickets(25, id_colaborador, id_cs, semilla.analista(1))
+    sesion.commit()
+    usuario = sch.TokenData(
+        persona_id="", colaborador_id=str(id_colaborador), cliente_id=str(id_cliente),
+        nombre="Carla", correo="carla@acme.test", cliente_nombre="Acme", servicios_contratados=[],
+    )
+    tools = {t.name: t for t in ToolBusqueda(sesion, usuario, limite_listado=5).get_tools()}
+
+    listado = tools["listar_tickets"].invoke({})
+    lineas = listado.splitlines()
+    assert lineas[0].startswith("Total: 25 |")
+    assert len(lineas) == 3 + 5
+
+    # El detalle completo sigue disponible por ID
+    id_ticket = int(lineas[3].split("|")[0].lstrip("#"))
+    detalle = tools["buscar_ticket_por_id"].invoke({"ticket_id": id_ticket})
+    assert f"**ID:** #{id_ticket}" in detalle
+    assert "**Servicio:** Analítica" in detalle
+